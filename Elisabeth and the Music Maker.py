@@ -24,14 +24,34 @@
 # midiutil library for the output of MIDI files.
 from os import environ
 environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+import time
+
+# The time at which each phase of starting up ended, by name, for --startup-profile.
+STARTUP_PHASES = [('interpreter',time.perf_counter())]
+def startup_phase(name):
+    STARTUP_PHASES.append((name,time.perf_counter()))
+
 from pathlib import Path
 import math
+import re
 import pygame
 from pygame import sprite
-pygame.init()
+startup_phase('import pygame')
 import os
-import random
-from midiutil import MIDIFile
+import sys
+import argparse
+import bisect
+import array
+import threading
+import multiprocessing
+import json
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+import score
+import harpsichord
+import savefile
+startup_phase('other imports')
+EXPORT_DONE = None # Posted when the music has been exported (see ExportWorker); made by start_pygame().
 
 # The following lines determine the dimensions of various on-screen objects in pixels.
 WINDOW_DIM = (1200,640) # Entire game window (width, height)
@@ -51,109 +71,536 @@ SIGN_STAFF_LENGTH = 2*STAFF_HEIGHT # The part of the staff reserved for clef and
 PAGEDIM = (STAFF_LENGTH+SIGN_STAFF_LENGTH+STAFF_HEIGHT,WINDOW_DIM[1]-BUTTON_DIM[1]-2*BUFFER-STAFF_HEIGHT)
 NOTE_LINE = 2 # Thickness of note features in pixels
 
+# Folders the game reads and writes.  May need to be changed if run on other device.
+MAIN_DIR = os.getcwd()
+# MAIN_DIR = Path(__file__).parent
+CACHE_DIR = os.path.join(MAIN_DIR,'Elisabeth_Cache') # Files the game makes for itself, to start faster next time
+SCORE_FILE = os.path.join(MAIN_DIR,'Elisabeth.score') # Where the piece is saved (with Ctrl+S), and opened from as the game starts
+JOURNAL_INTERVAL = 0.25 # Most seconds an edit waits to be written to the disk (see Autosave)
+JOURNAL_LONGEST = 4*2**20 # Most bytes of edits journaled before the piece is saved whole
+
+# How the music is exported (see output_music()).  Exported files are kept in a folder of their own,
+# named for what is in them, and the oldest are deleted as they grow too many or too old (see ExportCache).
+EXPORT_DIR = os.path.join(MAIN_DIR,'Elisabeth_Exports')
+EXPORT_CACHE_SIZE = 64*2**20 # Most bytes of exported files kept
+EXPORT_CACHE_AGE = 30*24*60*60 # Most seconds an exported file is kept since it was last played
+EXPORT_TRACKS = 'one' # On which tracks of the MIDI file: 'one' for all on one, 'staff' or 'system' for each on its own
+EXPORT_WORKERS = 1 # How many processes compile the staves, and write the tracks, of a large piece at once (see score.pool_map())
+MIXER_BUFFER = 512 # Samples the mixer is handed at a time (see init_audio()); the fewer, the sooner a note placed is heard
+PLAYBACK_BUFFER = 2048 # Samples in each buffer the Player hands the mixer, while playing; as only one waits behind the one playing, the more, the longer a delay in handing one over it outlasts
+PLAYBACK_LOOKAHEAD = 0.1 # Seconds of music the Player keeps rendered ahead of what is heard
+PREVIEW_BUDGET = 16*2**20 # Most bytes of notes kept rendered for hearing as they are placed (see PreviewCache)
+PREVIEW_LONGEST = 1.5 # Most seconds a note is heard for as it is placed (longer ones are let go then)
+
+# Finding a font by name means scanning every font on the system, which is slow on some (on Linux,
+# fontconfig's).  So the file found for each name is kept in the cache folder, and the scan is only
+# made for names not found there.  A name with no font on the system is kept as None, for which
+# pygame's own font is used; to look again (say, once the font is installed), delete the file.
+FONT_PATHS = os.path.join(CACHE_DIR,'fonts.json')
+def system_font(name,size):
+    try:
+        with open(FONT_PATHS,encoding='utf-8') as fontfile:
+            paths = json.load(fontfile)
+    except (OSError,ValueError):
+        paths = {}
+    if name not in paths or (paths[name] is not None and not os.path.exists(paths[name])):
+        paths[name] = pygame.font.match_font(name)
+        if paths[name] is None:
+            print(f"No font named {name} was found; pygame's own font will be used instead.",file=sys.stderr)
+        try:
+            os.makedirs(CACHE_DIR,exist_ok=True)
+            with open(FONT_PATHS+'.tmp','w',encoding='utf-8') as fontfile:
+                json.dump(paths,fontfile)
+            os.replace(FONT_PATHS+'.tmp',FONT_PATHS)
+        except OSError:
+            pass # The font will simply be looked for again next time.
+    return pygame.font.Font(paths[name],size)
+
 # Colors and font
 WINDOW_BACKGROUND = (240,240,240)
 UNCLICKED_BUTTON = (200,200,200)
 CLICKED_BUTTON = (180,180,180)
 PAPER_COLOR = (230,230,200)
 INK_COLOR = (40,20,20)
-DEFAULT_FONT = pygame.font.SysFont('constantia',16)
+SPRITE_KEY = (255,0,255) # Transparent color for pre-drawn note sprites; never used as ink.
+DEFAULT_FONT = None # Found by start_pygame().
+
+# This function starts what the game needs of pygame before its window is made, once.  Only the
+# window and fonts are needed to start; the mixer is started by init_audio(), when there is first
+# something to play, and joysticks and the rest are never used.  None of it is done as this file is
+# imported, since the processes an export may be handed to (see score.pool_map()) import it again.
+def start_pygame():
+    global EXPORT_DONE, DEFAULT_FONT
+    if DEFAULT_FONT is not None:
+        return
+    pygame.display.init()
+    pygame.font.init()
+    startup_phase('pygame init')
+    EXPORT_DONE = pygame.event.custom_type()
+    DEFAULT_FONT = system_font('constantia',16)
+    startup_phase('font')
+
+# Frame pacing.  The window is redrawn at most FRAME_RATE times a second, and only when
+# something on it has changed; otherwise the game sleeps until the player does something,
+# waking at least every IDLE_TIMEOUT milliseconds.
+FRAME_RATE = 30
+IDLE_TIMEOUT = 1000
+GLYPH_CACHE_SIZE = 64 # The most scaled glyphs (clefs, accidentals, etc.) kept at once
+BACKGROUND_POOL_SIZE = 8 # The most staff backgrounds (one for each clef and time signature) kept at once
+NOTE_BLOCK = 256 # How many notes a block of a staff's NoteList holds, give or take double
+HIT_COLUMN = int(STAFF_HEIGHT/2) # Width, in pixels, of the columns notes are filed in for finding clicks
+SCROLL_KEYS = {pygame.K_UP:-1,pygame.K_DOWN:1,pygame.K_PAGEUP:-SYSTEMS,pygame.K_PAGEDOWN:SYSTEMS} # Systems each key scrolls by
 
 # The following functions, linebreak and bliterate, were written by Robert Rattray for a 
-# previous project, Wolf Adventure.
+# previous project, Wolf Adventure.  They have since been made to measure text rather than
+# render it to find its width, and to keep what they have laid out for the next time.
+TEXT_CACHE_SIZE = 32 # The most laid-out blocks of text kept at once
+KERNING_SLACK = 2 # The most, in pixels, that joining two words can change their total width
+
+# The width of each word, in each font, is measured once and kept here.
+WORD_WIDTHS = {}
+def word_width(font,word):
+    widths = WORD_WIDTHS.get(font)
+    if widths is None:
+        widths = WORD_WIDTHS[font] = {}
+    if word not in widths:
+        widths[word] = font.size(word)[0]
+    return widths[word]
 
 # The linebreak function yields a list of image-type objects rendering a line
 # of the given text of the appropriate width.
-def linebreak(text,width,maxheight=0,font=DEFAULT_FONT,color=INK_COLOR):
+def linebreak(text,width,maxheight=0,font=None,color=INK_COLOR):
+    font = font or DEFAULT_FONT
     # Begin by converting the text - likely read from a file with line breaks of its own -
     # into a simple long string with single line breaks for paragraphs, less whitespace.
-    pars = text.split('\n\n')
-    for i in range(len(pars)):
-        par = pars[i]
-        par = par.replace('\n',' ')
-        while '  ' in par:
-            par = par.replace('  ',' ')
-        pars[i] = par
+    pars = [re.sub('  +',' ',par.replace('\n',' ')) for par in text.split('\n\n')]
     text = ' \n '.join(pars)
     # Then look as the text as a series of words, with paragraph breaks considered words.
     words = text.split(' ') # This is NOT equivalent to text.split()
-    lines = [] # Lines is a series of images with text rendered in a font.
+    texts = [] # Texts is a series of lines of words, which are rendered in a font at the end.
     line = words[0] # Line is the next words to be rendered.
-    if font.render(words[0],True,color).get_width() > width:
+    linewidth = word_width(font,line) # The width of the line, measured or added up from its words.
+    doubt = 0 # How far the added-up width might be from the line's measured width.
+    space = word_width(font,' ')
+    if linewidth > width:
         return False         # Linebreak yields false if a word is too long for
     for word in words[1:]:   # the width or the whole exceeds a maximum height.
-        if font.render(word,True,color).get_width() > width:
+        wordwidth = word_width(font,word)
+        if wordwidth > width:
             return False
-        linextend = ' '.join([line,word])
         if word == '\n': # At paragraph breaks, end the line without adding the 'word'.
-            lines.append(font.render(line,True,color))
+            texts.append(line)
             line = ''
-        elif font.render(linextend,True,color).get_width() > width:
-            lines.append(font.render(line,True,color))
+            linewidth = doubt = 0
+            continue
+        # The width of the line with the word added is that of its parts, give or take a little
+        # for the joins, unless that is too close to call, in which case the line is measured.
+        linextend = linewidth + space + wordwidth
+        doubt += 2*KERNING_SLACK
+        if abs(linextend - width) <= doubt:
+            linextend = font.size(line + ' ' + word)[0]
+            doubt = 0
+        if linextend > width:
+            texts.append(line)
             line = word # When adding a word would go beyond the width, end the line and start anew.
+            linewidth = wordwidth
+            doubt = 0
         else:
-            line = linextend
-    lines.append(font.render(line,True,color))
+            line = line + ' ' + word
+            linewidth = linextend
+    texts.append(line)
+    lines = [font.render(line,True,color) for line in texts]
     lineheight = lines[0].get_height()
     if maxheight > 0 and lineheight*len(lines) > maxheight:
         return False
     else:
         return lines
 
+# Blocks of text laid out by bliterate, by everything that decides their appearance.
+TEXT_CACHE = OrderedDict()
+
 # Bliterate takes a text string, line-breaks it, and blits it.
 # It yields the y-position ideal for blitting text beneath it,
 # as well as the width of the text block.
-def bliterate(screen,text,x,y,width,height=0,justify=False,outerbuffer=0,buffer=0,font=DEFAULT_FONT,color=INK_COLOR):
-    lines = linebreak(text,width-2*outerbuffer,height-2*outerbuffer,font,color)
-    widths = []
-    if lines == False: # Display error for lines if word too wide or text too tall.
-        screen.blit(font.render('Error',True,(255,0,0)),(x,y))
+# The lines are put together on one transparent surface, which is kept, so that
+# the same text, laid out the same way, can be shown again with a single blit.
+def bliterate(screen,text,x,y,width,height=0,justify=False,outerbuffer=0,buffer=0,font=None,color=INK_COLOR):
+    font = font or DEFAULT_FONT
+    key = (text,width,height,justify,outerbuffer,buffer,font,color)
+    if key in TEXT_CACHE:
+        TEXT_CACHE.move_to_end(key)
     else:
-        runningheight = y + outerbuffer
-        change = int(lines[0].get_height() + buffer / 2)
-        for line in lines:
-            if justify:
-                screen.blit(line,(int(x+(width-line.get_width())/2),runningheight))
-            else:
-                screen.blit(line,(x+outerbuffer,runningheight))
-            widths.append(line.get_width())
-            runningheight += change
-    return runningheight, max(widths)
+        TEXT_CACHE[key] = typeset(text,width,height,justify,outerbuffer,buffer,font,color)
+        while len(TEXT_CACHE) > TEXT_CACHE_SIZE:
+            TEXT_CACHE.popitem(last=False)
+    block = TEXT_CACHE[key]
+    if block is None: # Display error for lines if word too wide or text too tall.
+        error = font.render('Error',True,(255,0,0))
+        screen.blit(error,(x,y))
+        return y + error.get_height(), error.get_width()
+    image, runningheight, widest = block
+    screen.blit(image,(x,y))
+    return y + runningheight, widest
 
-# Code to retrieve image files easily.  May need to be changed if run on other device.
-MAIN_DIR = os.getcwd()
-# MAIN_DIR = Path(__file__).parent
+# Typeset lays out text for bliterate, on a surface to be blitted at the top left of the block.
+# It yields that surface, the height below which to put more text, and the widest line's width,
+# or None if the text does not fit.
+def typeset(text,width,height,justify,outerbuffer,buffer,font,color):
+    lines = linebreak(text,width-2*outerbuffer,height-2*outerbuffer,font,color)
+    if lines == False:
+        return None
+    change = int(lines[0].get_height() + buffer / 2)
+    image = pygame.Surface((width,outerbuffer+change*(len(lines)-1)+max(line.get_height() for line in lines)),pygame.SRCALPHA)
+    image.fill(color + (0,)) # Clear, but of the text's color, so that the edges of letters blend true.
+    runningheight = outerbuffer
+    for line in lines:
+        if justify:
+            image.blit(line,(int((width-line.get_width())/2),runningheight),special_flags=pygame.BLEND_RGBA_MAX)
+        else:
+            image.blit(line,(outerbuffer,runningheight),special_flags=pygame.BLEND_RGBA_MAX)
+        runningheight += change
+    return image, runningheight, max(line.get_width() for line in lines)
+
+# Code to retrieve image files easily.
+BUNDLE_PATH = os.path.join(CACHE_DIR,'assets.bundle')
+BUNDLE_MAGIC = b'EMMB1\n' # The first bytes of a bundle; changed if ever its layout should change.
 def get_asset(assetname):
     return pygame.image.load(os.path.join(MAIN_DIR,'Elisabeth_Assets',assetname))
 
-# Graphics dictionaries are made by loading all of the files.
-CLEF_DICT = {"treble":get_asset("treble.png"),"cclef":get_asset("cclef.png"),"bass":get_asset("bass.png")}
-UPPER_CLEF_DICT = {"treble":get_asset("treble.png"),"cclef":get_asset("cclef.png")}
+# The pictures are not loaded until they are first needed, and each file only once, however many
+# tables name it.  Every picture is kept, at each size asked for, in the window's pixel format (if
+# there is a window yet).  A size is given as a tuple of the sizes the picture is scaled to in turn,
+# () being the picture as drawn.  If there is a bundle (see save_bundle), pictures are taken from
+# it, already scaled, instead of being decoded and scaled; the whole bundle is read at once.
+class AssetStore():
+    def __init__(self,bundle_path=BUNDLE_PATH):
+        self.bundle_path = bundle_path
+        self.bundle_read = False # Whether the bundle has been looked for yet.
+        self.pictures = {} # Pictures by (file name, sizes).
+        self.bundled = {} # Pixel data from the bundle by (file name, sizes): (format, size, bytes).
+        self.source_sizes = {} # The size of each file's picture as drawn, if known without reading it.
+        self.decoded = 0 # Files read and decoded.
+        self.scaled = 0 # Pictures scaled.
+        self.unbundled = 0 # Pictures taken from the bundle.
+
+    # This method returns the picture in the file at the given sizes, loading it only if need be.
+    # Pictures that need not be kept (like glyphs, which have a cache of their own) are not.
+    def picture(self,filename,sizes=(),keep=True):
+        key = (filename,sizes)
+        surface = self.pictures.get(key)
+        if surface is not None:
+            return surface
+        if key in self.bundled:
+            form, size, data = self.bundled[key]
+            surface = pygame.image.frombytes(bytes(data),size,form)
+            self.unbundled += 1
+        elif sizes:
+            surface = pygame.transform.scale(self.picture(filename,sizes[:-1]),sizes[-1])
+            self.scaled += 1
+        else:
+            surface = get_asset(filename)
+            self.decoded += 1
+        if pygame.display.get_surface() is not None: # Conversion needs a window.
+            if surface.get_flags() & pygame.SRCALPHA:
+                surface = surface.convert_alpha()
+            else:
+                surface = surface.convert()
+        if keep:
+            self.pictures[key] = surface
+        return surface
+
+    # This method returns the size of a file's picture as drawn, without reading the file if the bundle knows it.
+    def source_size(self,filename):
+        if filename not in self.source_sizes:
+            self.source_sizes[filename] = self.picture(filename).get_size()
+        return self.source_sizes[filename]
+
+    # This method reads the bundle, if there is one, once.  Pictures whose files have changed since it
+    # was written are left out, to be loaded from the files as usual.
+    def read_bundle(self):
+        if self.bundle_read:
+            return
+        self.bundle_read = True
+        try:
+            with open(self.bundle_path,'rb') as bundlefile:
+                bundle = bundlefile.read()
+        except OSError:
+            return
+        if not bundle.startswith(BUNDLE_MAGIC):
+            return
+        start = len(BUNDLE_MAGIC) + 8
+        headerlength = int.from_bytes(bundle[len(BUNDLE_MAGIC):start],'little')
+        entries = json.loads(bundle[start:start+headerlength])
+        data = memoryview(bundle)[start+headerlength:]
+        for filename, sizes, form, size, offset, length, source in entries:
+            try:
+                stat = os.stat(os.path.join(MAIN_DIR,'Elisabeth_Assets',filename))
+            except OSError:
+                continue
+            if [stat.st_size,stat.st_mtime_ns] != source[:2]:
+                continue
+            self.source_sizes[filename] = tuple(source[2])
+            self.bundled[(filename,tuple(tuple(s) for s in sizes))] = (form,tuple(size),data[offset:offset+length])
+
+    # This method writes a bundle of the given pictures, as (file name, sizes) pairs, for read_bundle to find.
+    def save_bundle(self,wanted):
+        entries = []
+        chunks = []
+        offset = 0
+        for filename, sizes in wanted:
+            surface = self.picture(filename,sizes)
+            form = 'RGBA' if surface.get_flags() & pygame.SRCALPHA else 'RGB'
+            data = pygame.image.tobytes(surface,form)
+            stat = os.stat(os.path.join(MAIN_DIR,'Elisabeth_Assets',filename))
+            source = [stat.st_size,stat.st_mtime_ns,self.source_size(filename)]
+            entries.append([filename,sizes,form,surface.get_size(),offset,len(data),source])
+            chunks.append(data)
+            offset += len(data)
+        header = json.dumps(entries).encode()
+        os.makedirs(os.path.dirname(self.bundle_path),exist_ok=True)
+        with open(self.bundle_path+'.tmp','wb') as bundlefile:
+            bundlefile.write(BUNDLE_MAGIC + len(header).to_bytes(8,'little') + header)
+            for data in chunks:
+                bundlefile.write(data)
+        os.replace(self.bundle_path+'.tmp',self.bundle_path)
+
+    def report(self):
+        return f"Assets: {len(self.pictures)} pictures from {self.decoded} files decoded, {self.scaled} scaled, {self.unbundled} from the bundle."
+
+ASSETS = AssetStore()
+
+# A table of pictures by name, as the buttons and staves use them.  The pictures are loaded from
+# ASSETS when they are asked for, at the table's sizes (see AssetStore).
+class AssetTable(Mapping):
+    def __init__(self,files,sizes=()):
+        self.files = files # The file of each picture, by name
+        self.sizes = sizes
+
+    def __getitem__(self,name):
+        return ASSETS.picture(self.files[name],self.sizes)
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __len__(self):
+        return len(self.files)
+
+    # This method returns a picture scaled once more, to size, without keeping it.
+    def scaled(self,name,size):
+        return ASSETS.picture(self.files[name],self.sizes+(size,),keep=False)
+
+# Graphics dictionaries name the files, which are loaded when first shown.  The pictures on buttons
+# are shown at the button's size, and the staves' accidentals, agréments, and time signatures are
+# scaled from those; the staves' clefs are scaled from the pictures as drawn.
+BUTTON_SIZES = (BUTTON_DIM,)
+CLEF_DICT = AssetTable({"treble":"treble.png","cclef":"cclef.png","bass":"bass.png"})
+UPPER_CLEF_DICT = AssetTable({"treble":"treble.png","cclef":"cclef.png"},BUTTON_SIZES)
 CLEF_NOTE_DICT = {'treble':38,'cclef':36,'bass':28}
-TIME_DICT = {"common":get_asset("c.png"),"three":get_asset("three.png"),"cut":get_asset("cut.png"),
-    "six-four":get_asset("six_four.png"),
-    "three-two":get_asset("three_two.png")}
+TIME_DICT = AssetTable({"common":"c.png","three":"three.png","cut":"cut.png",
+    "six-four":"six_four.png",
+    "three-two":"three_two.png"},BUTTON_SIZES)
 TIME_TUPLE_DICT = {"common":(4,4),"three":(3,4),"cut":(2,4),"six-four":(6,4),"three-two":(3,2)}
-ACCI_DICT = {"sharp":get_asset("sharp.png"),"flat":get_asset("flat.png")}
+LONGEST_MEASURE = max(4*beats/unit for beats, unit in TIME_TUPLE_DICT.values()) # Beats in the longest measure
+ACCI_DICT = AssetTable({"sharp":"sharp.png","flat":"flat.png"},BUTTON_SIZES)
 NOTE_TIME_DICT = {"whole":1.0,"half":0.5,"quarter":0.25,"eighth":0.125,"sixteenth":0.0625}
-NOTE_PICT_DICT = {"whole":get_asset("whole.png"),"half":get_asset("half.png"),"quarter":get_asset("quarter.png"),
-    "eighth":get_asset("eighth.png"),"sixteenth":get_asset("sixteenth.png")}
-ERASER_DICT = {"eraser":get_asset("Knife.png")}
-INVERTER_DICT = {"inverse":get_asset("inverse.png")}
-DOT_DICT = {"dot":get_asset("1,5.png")}
-AGREMENT_DICT = {"pince":get_asset("pince.png"),"tremblement":get_asset("tremblement.png"),
-    "appuye":get_asset("tremblement_appuye.png"),
-    "portdevoix":get_asset("portdevoix.png"),"double":get_asset("double.png"),
-    "cadence":get_asset("cadence.png"),"mordent":get_asset("mordent.png")}
+NOTE_PICT_DICT = AssetTable({"whole":"whole.png","half":"half.png","quarter":"quarter.png",
+    "eighth":"eighth.png","sixteenth":"sixteenth.png"},BUTTON_SIZES)
+ERASER_DICT = AssetTable({"eraser":"Knife.png"},BUTTON_SIZES)
+INVERTER_DICT = AssetTable({"inverse":"inverse.png"},BUTTON_SIZES)
+DOT_DICT = AssetTable({"dot":"1,5.png"},BUTTON_SIZES)
+AGREMENT_DICT = AssetTable({"pince":"pince.png","tremblement":"tremblement.png",
+    "appuye":"tremblement_appuye.png",
+    "portdevoix":"portdevoix.png","double":"double.png",
+    "cadence":"cadence.png","mordent":"mordent.png"},BUTTON_SIZES)
 AGREMENT_DONE_DICT = {}
 for K in AGREMENT_DICT:
     AGREMENT_DONE_DICT[K] = False
-PLAY_DICT = {"play":pygame.transform.scale(get_asset("play.png"),(CHAT_WIDTH,BUTTON_DIM[1]))}
-lispic = get_asset("Elisabeth.jpg")
-LIS_HEIGHT = int(CHAT_WIDTH*lispic.get_height()/lispic.get_width())
-lispic = pygame.transform.scale(lispic,(CHAT_WIDTH,LIS_HEIGHT))
-CHAT_RECT.top = LIS_HEIGHT
-CHAT_RECT.height -= LIS_HEIGHT
+PLAY_DICT = AssetTable({"play":"play.png"},BUTTON_SIZES)
+PORTRAIT = "Elisabeth.jpg"
+
+# Elisabeth's portrait is shown the width of the chat box, which begins beneath it.
+def portrait_size():
+    width, height = ASSETS.source_size(PORTRAIT)
+    return (CHAT_WIDTH,int(CHAT_WIDTH*height/width))
+
+# The pictures kept in the asset bundle: the buttons', the portrait, and the glyphs at the sizes
+# Note.generate_image() and Staff.build_background() scale them to.
+def bundled_pictures():
+    wanted = [(PORTRAIT,(portrait_size(),))]
+    for table in [UPPER_CLEF_DICT,TIME_DICT,ACCI_DICT,NOTE_PICT_DICT,ERASER_DICT,INVERTER_DICT,DOT_DICT,AGREMENT_DICT,PLAY_DICT]:
+        wanted += [(table.files[name],table.sizes) for name in table]
+    for table, size in [(CLEF_DICT,(STAFF_HEIGHT,int(1.5*STAFF_HEIGHT))),(TIME_DICT,(STAFF_HEIGHT,STAFF_HEIGHT)),
+            (ACCI_DICT,(int(STAFF_HEIGHT/3),int(STAFF_HEIGHT/2))),(AGREMENT_DICT,(int(STAFF_HEIGHT/2),int(STAFF_HEIGHT/2)))]:
+        wanted += [(table.files[name],table.sizes+(size,)) for name in table]
+    return list(dict.fromkeys(wanted))
+
+# The glyphs drawn on the staves - clefs, time signatures, accidentals, and agréments - are
+# scaled to the staff height from the pictures above.  Rather than scale a picture for every
+# note every time it is drawn, the scaled copies are kept here, by name and size, already
+# converted to the window's pixel format.  The least recently used is dropped once there are
+# more than 'capacity', and all are dropped if STAFF_HEIGHT should ever change.
+class GlyphCache():
+    def __init__(self,capacity=GLYPH_CACHE_SIZE):
+        self.capacity = capacity
+        self.glyphs = OrderedDict()
+        self.staff_height = STAFF_HEIGHT # The staff height the glyphs were scaled for.
+        self.hits = 0
+        self.misses = 0
+
+    # This method returns the picture table[name] scaled to size, scaling it only if need be.
+    def get(self,table,name,size):
+        if self.staff_height != STAFF_HEIGHT:
+            self.flush()
+        key = (name,size)
+        glyph = self.glyphs.get(key)
+        if glyph is not None:
+            self.hits += 1
+            self.glyphs.move_to_end(key)
+            return glyph
+        self.misses += 1
+        glyph = table.scaled(name,size)
+        self.glyphs[key] = glyph
+        while len(self.glyphs) > self.capacity:
+            self.glyphs.popitem(last=False)
+        return glyph
+
+    # This method forgets every scaled glyph.
+    def flush(self):
+        self.glyphs.clear()
+        self.staff_height = STAFF_HEIGHT
+
+    def report(self):
+        return f"Glyph cache: {len(self.glyphs)} glyphs, {self.hits} hits, {self.misses} misses."
+
+GLYPHS = GlyphCache()
+
+# This function paints the parts of a staff that do not depend on its notes - the paper, lines,
+# barlines, clef, and time signature - onto a surface of its own, which Staff.generate_image() then
+# copies in a single blit.
+def staff_background(clef,timename):
+    background = pygame.Surface((STAFF_LENGTH+SIGN_STAFF_LENGTH+STAFF_HEIGHT,3*STAFF_HEIGHT))
+    if pygame.display.get_surface() is not None:
+        background = background.convert()
+    background.fill(PAPER_COLOR)
+    # Draw five horizontal lines and vertical lines in between measures.
+    for l in range(5):
+        y = int(l*STAFF_HEIGHT/4+STAFF_HEIGHT)
+        pygame.draw.line(background,INK_COLOR,(int(STAFF_HEIGHT/2),y),(int(STAFF_LENGTH+SIGN_STAFF_LENGTH+STAFF_HEIGHT/2),y))
+    for m in range(MEASURES_PER):
+        pygame.draw.line(background,INK_COLOR,(int(STAFF_HEIGHT/2+SIGN_STAFF_LENGTH+m*STAFF_LENGTH/MEASURES_PER),STAFF_HEIGHT),(int(STAFF_HEIGHT/2+SIGN_STAFF_LENGTH+m*STAFF_LENGTH/MEASURES_PER),2*STAFF_HEIGHT))
+    # Draw the clef at the front of each staff.  The C-clef can reach half the staff height below the staff.
+    background.blit(GLYPHS.get(CLEF_DICT,clef,(STAFF_HEIGHT,int(1.5*STAFF_HEIGHT))),(int(STAFF_HEIGHT/2),STAFF_HEIGHT))
+    # Draw the time signature immediately following the clef.
+    background.blit(GLYPHS.get(TIME_DICT,timename,(STAFF_HEIGHT,STAFF_HEIGHT)),(int(3*STAFF_HEIGHT/2),STAFF_HEIGHT))
+    return background
+
+# A staff's background depends only on its clef and time signature, so rather than each staff
+# painting and keeping its own, the staves in view share those kept here, by clef and time signature;
+# staves out of view hold none (see Page).  However long the piece, then, there are no more than
+# 'capacity' backgrounds.  The least recently used is dropped once there are more, and all are
+# dropped if STAFF_HEIGHT should ever change.
+class BackgroundPool():
+    def __init__(self,capacity=BACKGROUND_POOL_SIZE):
+        self.capacity = capacity
+        self.backgrounds = OrderedDict()
+        self.staff_height = STAFF_HEIGHT # The staff height the backgrounds were painted for.
+        self.hits = 0
+        self.misses = 0
+
+    # This method returns the background of a staff with the given clef and time signature.
+    def get(self,clef,timename):
+        if self.staff_height != STAFF_HEIGHT:
+            self.backgrounds.clear()
+            self.staff_height = STAFF_HEIGHT
+        key = (clef,timename)
+        background = self.backgrounds.get(key)
+        if background is not None:
+            self.hits += 1
+            self.backgrounds.move_to_end(key)
+            return background
+        self.misses += 1
+        background = self.backgrounds[key] = staff_background(clef,timename)
+        while len(self.backgrounds) > self.capacity:
+            self.backgrounds.popitem(last=False)
+        return background
+
+    # This method returns how many bytes the backgrounds kept take.
+    def size(self):
+        return sum(background.get_bytesize()*background.get_width()*background.get_height() for background in self.backgrounds.values())
+
+    def report(self):
+        return f"Staff backgrounds: {len(self.backgrounds)} kept in {self.size()/2**20:.1f} MB, {self.hits} hits, {self.misses} misses."
+
+BACKGROUNDS = BackgroundPool()
+
+# This class keeps count of how often, at an export, a staff's notes as compiled before could be used
+# again (see Staff.kept_events()), and how often they had to be compiled anew.
+class CompileCount():
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def report(self):
+        asked = self.hits + self.misses
+        rate = f" ({100*self.hits/asked:.0f}% kept)" if asked else ""
+        return f"Compiled staves: {self.hits} hits, {self.misses} misses{rate}."
+
+COMPILED = CompileCount()
+
+# This class - export cache - keeps the MIDI files exported, in a folder, each named for the music
+# in it (see Score.digest()), so that playing a piece that has not changed since it was last played
+# opens the same file again, without compiling or writing anything.  Files last played longest ago
+# are deleted once those kept take more than 'capacity' bytes, and any not played for 'max_age' seconds.
+class ExportCache():
+    def __init__(self,folder=EXPORT_DIR,capacity=EXPORT_CACHE_SIZE,max_age=EXPORT_CACHE_AGE):
+        self.folder = folder
+        self.capacity = capacity
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    # This method returns the path of the file of the given name in the folder, first calling
+    # write(output_file) to write it if there is no such file.  A file is only given its name once
+    # it has been written whole, so a half-written file is never taken for a finished one.
+    def fetch(self,filename,write):
+        path = os.path.join(self.folder,filename)
+        if os.path.exists(path):
+            self.hits += 1
+            os.utime(path) # It has now been played most recently.
+            return path
+        self.misses += 1
+        os.makedirs(self.folder,exist_ok=True)
+        with open(path+'.tmp','wb') as output_file:
+            write(output_file)
+        os.replace(path+'.tmp',path)
+        self.evict(path)
+        return path
+
+    # This method deletes the files too old to keep, and then those played longest ago until the
+    # rest fit in the cache's capacity, keeping the file at the path given.
+    def evict(self,keep=None):
+        try:
+            entries = [entry for entry in os.scandir(self.folder) if entry.name.endswith('.mid') and entry.path != keep]
+        except OSError:
+            return
+        files = sorted((entry.stat().st_mtime,entry.stat().st_size,entry.path) for entry in entries)
+        total = sum(size for played, size, path in files) + (os.path.getsize(keep) if keep else 0)
+        now = time.time()
+        for played, size, path in files:
+            if total <= self.capacity and now - played <= self.max_age:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evicted += 1
+
+    def report(self):
+        return f"Exports: {self.hits} played again, {self.misses} written, {self.evicted} deleted."
+
+EXPORTS = ExportCache()
 
 # Classes
 #
@@ -163,9 +610,7 @@ CHAT_RECT.height -= LIS_HEIGHT
 class pybutton(pygame.sprite.Sprite): # Inherits from Sprite b/c has appearance
     def __init__(self,statusdict,position,explanation='',*groups):
         super().__init__(*groups)
-        for eachkey in statusdict:
-            statusdict[eachkey] = pygame.transform.scale(statusdict[eachkey],BUTTON_DIM)
-        self.statusdict = statusdict
+        self.statusdict = statusdict # Pictures (an AssetTable) at the button's size
         self.statuslist = list(statusdict)
         self.status = 0
         self.selected = False
@@ -201,6 +646,118 @@ class pybutton(pygame.sprite.Sprite): # Inherits from Sprite b/c has appearance
         for y in range(0,self.image.get_height()-2,2):
             pygame.draw.line(self.image,UNCLICKED_BUTTON,(0,y),(self.image.get_width(),y))
 
+# These functions draw the parts of a note - its head, stem, dot, and flags - onto a surface,
+# returning the rectangles they drew on.  Note.generate_image() and Note.flag() usually take
+# them from NOTE_SPRITES below instead, which draws each of them once and copies it thereafter.
+def draw_notehead(surface,center,filled):
+    if filled:
+        return pygame.draw.circle(surface,INK_COLOR,center,int(STAFF_HEIGHT/6))
+    return pygame.draw.circle(surface,INK_COLOR,center,int(STAFF_HEIGHT/6),NOTE_LINE)
+
+def draw_stem(surface,start,tip):
+    return pygame.draw.line(surface,INK_COLOR,start,tip,NOTE_LINE)
+
+def draw_dot(surface,center):
+    return pygame.draw.circle(surface,INK_COLOR,center,NOTE_LINE)
+
+# The flags hang from the tip of the stem: one for an eighth note, two for a sixteenth.
+def draw_flags(surface,tip,orientation,count):
+    inked = []
+    for f in range(count):
+        if orientation:
+            inked.append(pygame.draw.line(surface,INK_COLOR,(tip[0],tip[1]+4*f*NOTE_LINE),(tip[0]+2*NOTE_LINE,tip[1]+(4*f+4)*NOTE_LINE),NOTE_LINE))
+            inked.append(pygame.draw.arc(surface,INK_COLOR,[tip[0]-int(NOTE_LINE*6.4),tip[1]+(4*f+2)*NOTE_LINE,int(NOTE_LINE*9.2),int(8*NOTE_LINE)],-math.atan(1/2),math.atan(1/2)+0.1,NOTE_LINE))
+        else:
+            inked.append(pygame.draw.line(surface,INK_COLOR,(tip[0],tip[1]-4*f*NOTE_LINE),(tip[0]+2*NOTE_LINE,tip[1]-(4*f+4)*NOTE_LINE),NOTE_LINE))
+            inked.append(pygame.draw.arc(surface,INK_COLOR,[tip[0]-int(NOTE_LINE*6),tip[1]-(4*f+10)*NOTE_LINE,int(NOTE_LINE*9.2),int(8*NOTE_LINE)],-math.atan(1/2)-0.1,math.atan(1/2),NOTE_LINE))
+    return inked[0].unionall(inked[1:])
+
+# This class - note sprites - keeps the parts of notes pre-drawn, at the current staff height,
+# in one surface (the atlas), so that drawing a note is a few blits rather than several circles,
+# lines and arcs.  Each sprite is drawn by the very functions above, in the ink color on a
+# color-keyed background, so a copy of it is the same, pixel for pixel, as drawing it in place.
+# Stems vary in length where beams meet them, so they are kept apart, one per length as needed.
+class NoteSprites():
+    def __init__(self,enabled=True,stem_limit=256):
+        self.enabled = enabled # When False, every part is drawn in place, as it once was.
+        self.stem_limit = stem_limit # The most stem sprites kept; beyond it, stems are drawn in place.
+        self.size = None # (STAFF_HEIGHT, NOTE_LINE) that the sprites were drawn for.
+
+    # This method draws every fixed sprite onto a scratch surface with room to spare, crops each to
+    # what was drawn, and packs them side by side into the atlas.  Each sprite remembers where in the
+    # atlas it is and where its anchor (the head's center, or the stem's tip) lies within it.
+    def build(self):
+        self.size = (STAFF_HEIGHT,NOTE_LINE)
+        margin = 2*STAFF_HEIGHT
+        drawings = {'filled':lambda s,a: draw_notehead(s,a,True),
+            'hollow':lambda s,a: draw_notehead(s,a,False),
+            'dot':draw_dot}
+        for orientation in [True,False]:
+            for count in [1,2]:
+                drawings[('flags',orientation,count)] = lambda s,a,o=orientation,c=count: draw_flags(s,a,o,c)
+        pieces = []
+        for name in drawings:
+            surface, area = self.draw_sprite(drawings[name],margin)
+            pieces.append((name,surface,area))
+        self.atlas = pygame.Surface((sum(area.width for name,surface,area in pieces),max(area.height for name,surface,area in pieces)))
+        self.atlas.fill(SPRITE_KEY)
+        self.sprites = {}
+        x = 0
+        for name, surface, area in pieces:
+            self.atlas.blit(surface,(x,0),area)
+            self.sprites[name] = (pygame.Rect(x,0,area.width,area.height),(margin-area.left,margin-area.top))
+            x += area.width
+        self.atlas.set_colorkey(SPRITE_KEY,pygame.RLEACCEL)
+        self.stems = {}
+
+    # This method draws one sprite with its anchor at (margin, margin) on a color-keyed scratch surface,
+    # and returns the surface with the area drawn on.
+    def draw_sprite(self,drawing,margin):
+        surface = pygame.Surface((2*margin,2*margin))
+        surface.fill(SPRITE_KEY)
+        area = drawing(surface,(margin,margin)).clip(surface.get_rect())
+        surface.set_colorkey(SPRITE_KEY,pygame.RLEACCEL)
+        return surface, area
+
+    # This method copies the named sprite onto the surface with its anchor at the given point.
+    def blit(self,surface,name,anchor):
+        if self.size != (STAFF_HEIGHT,NOTE_LINE):
+            self.build()
+        area, offset = self.sprites[name]
+        return surface.blit(self.atlas,(anchor[0]-offset[0],anchor[1]-offset[1]),area)
+
+    def notehead(self,surface,center,filled):
+        if not self.enabled:
+            return draw_notehead(surface,center,filled)
+        return self.blit(surface,'filled' if filled else 'hollow',center)
+
+    def dot(self,surface,center):
+        if not self.enabled:
+            return draw_dot(surface,center)
+        return self.blit(surface,'dot',center)
+
+    def flags(self,surface,tip,orientation,count):
+        if not self.enabled:
+            return draw_flags(surface,tip,orientation,count)
+        return self.blit(surface,('flags',orientation,count),tip)
+
+    # Stems are anchored at their tip and kept by the distance from tip to head.
+    def stem(self,surface,start,tip):
+        if not self.enabled:
+            return draw_stem(surface,start,tip)
+        if self.size != (STAFF_HEIGHT,NOTE_LINE):
+            self.build()
+        length = (start[0]-tip[0],start[1]-tip[1])
+        if length not in self.stems:
+            if len(self.stems) >= self.stem_limit:
+                return draw_stem(surface,start,tip)
+            margin = abs(length[0])+abs(length[1])+2*NOTE_LINE
+            self.stems[length] = self.draw_sprite(lambda s,a: draw_stem(s,(a[0]+length[0],a[1]+length[1]),a),margin) + (margin,)
+        sprite, area, margin = self.stems[length]
+        return surface.blit(sprite,(tip[0]-margin+area.left,tip[1]-margin+area.top),area)
+
+NOTE_SPRITES = NoteSprites()
+
 ################################################################################
 ## This research project was started because of unfamiliarity with the notation
 ## used by Elisabeth Jean-Claude Jacquet de la Guerre in her Suite in A Minor,
@@ -221,13 +778,58 @@ class pybutton(pygame.sprite.Sprite): # Inherits from Sprite b/c has appearance
 ## marked with ## comments throughout the Note class.
 #################################################################################
 
+# This class - note table - holds the notes of a staff column by column, each column an array of
+# plain numbers with a row for each note, rather than each note in an object of its own; the Note
+# objects the game handles are no more than views of their rows (see Note).  A note's pitch is kept
+# as its rung (see score.LETTERS), and its accidental and agrément as their codes (see score.ACCIDENTALS
+# and score.AGREMENTS).  A row is handed out again once its note is taken out of the staff (see
+# Staff.remove_note()), so a note must not be used once it has been.
+class NoteTable():
+    def __init__(self,staff):
+        self.staff = staff # The staff the notes are on
+        self.measure = array.array('d') # The measure each note is in
+        self.beat = array.array('d') # Its beat in that measure
+        self.duration = array.array('d') # Its duration, as a fraction of a whole note
+        self.rung = array.array('h') # Its pitch without accidental
+        self.accidental = array.array('B') # Its accidental's code
+        self.agrement = array.array('B') # Its agrément's code
+        self.orientation = array.array('B') # 1 if its stem is up, 0 if down
+        self.seq = array.array('q') # The order in which it was placed in its staff
+        self.free = [] # The rows handed out again, before any new ones
+
+    def __len__(self):
+        return len(self.seq) - len(self.free)
+
+    # This method returns a row for a note, holding the values given, in the order of the columns above.
+    def new_row(self,*values):
+        columns = (self.measure,self.beat,self.duration,self.rung,self.accidental,self.agrement,self.orientation,self.seq)
+        if self.free:
+            row = self.free.pop()
+            for column, value in zip(columns,values):
+                column[row] = value
+        else:
+            row = len(self.seq)
+            for column, value in zip(columns,values):
+                column.append(value)
+        return row
+
+    # This method hands a row out again, once its note has been taken out of the staff.
+    def free_row(self,row):
+        self.free.append(row)
+
+# This class - note - is one note of a staff.  What is played is kept in the staff's NoteTable, and
+# a note is a view of its row there, with only where it is laid out on the screen kept in the note
+# itself (and only while its staff is in view; see Staff.place()), so that even a very long piece
+# takes little memory.  Its attributes are those a note has always had.
 class Note():
+    __slots__ = ('staff','table','row','position','rect','tip_position','stem_tip','inked')
+
     def __init__(self,staff,time,duration,pitch,accidental='',agrement='',orientation=True):
         self.staff = staff # The staff in which the note appears (a Staff object)
-        self.time = time # The position in time in which this note is played, as a tuple of measure and beat.
-        self.duration = duration # The duration for which this note is played; e.g., 0.75 for dotted half note.
-        self.pitch = pitch # The pitch of this note without accidental, e.g., 'c4' for C-sharp above middle C
-        self.accidental = accidental # Either 'sharp,' '' or 'flat.'
+        self.table = staff.table # The notes of that staff, column by column
+        self.row = self.table.new_row(time[0],time[1],duration,score.LETTERS.index(pitch[0])+7*int(pitch[1]),
+                                      score.ACCIDENTAL_CODES[accidental],score.AGREMENT_CODES[agrement],orientation,0)
+        self.position = self.rect = self.tip_position = self.stem_tip = self.inked = None # Laid out by set_position()
         ###########################################################################################
         ## As seen in the third measure of the first "Allemande," and throughout the suite,
         ## accidentals do not carry from note to note, even within the same octave and measure
@@ -235,8 +837,6 @@ class Note():
         ###########################################################################################
         # As such, the variable self.accidental determines whether an accidental appears and is used to
         # find the pitch for the MIDI output all the same.
-        self.agrement = agrement # Any agrement the note carries.
-        self.orientation = orientation # True if, for a quarter note, shaped like a d, False if like a p.
         ##################################################################################################
         ## Also seen throughout the piece are inverted notes with their stems proceeding from their middle,
         ## not the left side.  This change of appearance is reflect in the game.  And though today it is
@@ -244,7 +844,82 @@ class Note():
         ## central line of a staff, in Jacquet's pieces it is more often a function of its
         ## voicing (still typical of choral music today), so this orientation is determined by the player.
         ##################################################################################################
-    
+
+    # This method makes a note of a row already held in a staff's NoteTable, as when the staff is read
+    # from a saved score (see Staff.load()).
+    @classmethod
+    def of_row(cls,staff,row):
+        note = cls.__new__(cls)
+        note.staff, note.table, note.row = staff, staff.table, row
+        note.forget_position()
+        return note
+
+    # Each of the following is kept in the note's row of its staff's NoteTable.
+    @property
+    def time(self): # The position in time in which this note is played, as a tuple of measure and beat.
+        table, row = self.table, self.row
+        return (table.measure[row],table.beat[row])
+
+    @time.setter
+    def time(self,time):
+        self.table.measure[self.row], self.table.beat[self.row] = time
+
+    @property
+    def pitch(self): # The pitch of this note without accidental, e.g., 'c4' for C-sharp above middle C
+        return score.RUNG_NAMES[self.table.rung[self.row]]
+
+    @pitch.setter
+    def pitch(self,pitch):
+        self.rung = score.LETTERS.index(pitch[0]) + 7*int(pitch[1])
+
+    @property
+    def rung(self): # The pitch of this note without accidental, as the step of the scale it is on
+        return self.table.rung[self.row]
+
+    @rung.setter
+    def rung(self,rung):
+        self.table.rung[self.row] = rung
+
+    @property
+    def duration(self): # The duration for which this note is played; e.g., 0.75 for dotted half note.
+        return self.table.duration[self.row]
+
+    @duration.setter
+    def duration(self,duration):
+        self.table.duration[self.row] = duration
+
+    @property
+    def accidental(self): # Either 'sharp,' '' or 'flat.'
+        return score.ACCIDENTALS[self.table.accidental[self.row]]
+
+    @accidental.setter
+    def accidental(self,accidental):
+        self.table.accidental[self.row] = score.ACCIDENTAL_CODES[accidental]
+
+    @property
+    def agrement(self): # Any agrement the note carries.
+        return score.AGREMENTS[self.table.agrement[self.row]]
+
+    @agrement.setter
+    def agrement(self,agrement):
+        self.table.agrement[self.row] = score.AGREMENT_CODES[agrement]
+
+    @property
+    def orientation(self): # True if, for a quarter note, shaped like a d, False if like a p.
+        return self.table.orientation[self.row] == 1
+
+    @orientation.setter
+    def orientation(self,orientation):
+        self.table.orientation[self.row] = orientation
+
+    @property
+    def seq(self): # The order in which the note was placed in its staff, given by the staff.
+        return self.table.seq[self.row]
+
+    @seq.setter
+    def seq(self,seq):
+        self.table.seq[self.row] = seq
+
     def __str__(self): # This method isn't working but it isn't ever called either.
         return f"Note {self.pitch} at {self.time} in Staff #{self.staff.id}."
     
@@ -263,98 +938,104 @@ class Note():
         ## to, say, having notes be placed in the order the player clicks them.
         #################################################################################################
         # For the sake of simplicity, notes appear in precise locations based on beat.
-        distalong = int((self.time[0]-1+(self.time[1]-1)*self.staff.timesig[1]/(4*self.staff.timesig[0]))*STAFF_LENGTH/MEASURES_PER)
-        toprung = CLEF_NOTE_DICT[self.staff.clef]
-        self.rung = {'c':0,'d':1,'e':2,'f':3,'g':4,'a':5,'b':6}[self.pitch[0]] + 7*int(self.pitch[1])
-        self.stepsdown = toprung - self.rung
-        headdown = int(self.stepsdown*STAFF_HEIGHT/8)
+        measure, beat = self.time
+        distalong = int((measure-1+(beat-1)*self.staff.timesig[1]/(4*self.staff.timesig[0]))*STAFF_LENGTH/MEASURES_PER)
+        stepsdown = CLEF_NOTE_DICT[self.staff.clef] - self.rung
+        headdown = int(stepsdown*STAFF_HEIGHT/8)
         distdown = headdown - int(3*STAFF_HEIGHT/8)
         if self.orientation:
             distdown = headdown - int(9*STAFF_HEIGHT/8)
         self.position = ( int(self.staff.position[0]+STAFF_HEIGHT/2+SIGN_STAFF_LENGTH+distalong), int(self.staff.position[1]+STAFF_HEIGHT+distdown) )
+        self.rect = pygame.Rect(self.position[0],self.position[1],int(self.duration*STAFF_LENGTH*self.staff.timesig[1]/(MEASURES_PER*self.staff.timesig[0])),int(1.25*STAFF_HEIGHT))
         centerx = int(STAFF_LENGTH/(32*MEASURES_PER)) + self.position[0]
         if self.orientation:
             self.tip_position = (int(centerx+STAFF_HEIGHT/6-NOTE_LINE),int(STAFF_HEIGHT/4+self.position[1]))
         else:
             self.tip_position = (int(centerx-STAFF_HEIGHT/6+NOTE_LINE),self.position[1]+self.rect.height)
-        self.rect = pygame.Rect(self.position[0],self.position[1],int(self.duration*STAFF_LENGTH*self.staff.timesig[1]/(MEASURES_PER*self.staff.timesig[0])),int(1.25*STAFF_HEIGHT))
+        self.stem_tip = self.tip_position # Where the stem ends if it is not beamed; a beam may move the tip.
+        self.inked = self.rect.copy() # Until the note is drawn, assume its ink stays in its box.
+
+    # This method forgets where the note was laid out, as its staff goes out of view; set_position()
+    # lays it out again when the staff comes back into view.
+    def forget_position(self):
+        self.position = self.rect = self.tip_position = self.stem_tip = self.inked = None
     
     # This method convert the printed pitch (like 'b4' with a sharp or 'c5') to a MIDI pitch (like '72').
     def midi_pitch(self):
-        midi_pitch = {'c':0,'d':2,'e':4,'f':5,'g':7,'a':9,'b':11}[self.pitch[0]] + 12*int(self.pitch[1]) + 12
-        if self.accidental == 'sharp':
-            midi_pitch += 1
-        elif self.accidental == 'flat':
-            midi_pitch -= 1
-        return midi_pitch
+        return score.rung_pitch(self.rung,self.table.accidental[self.row])
 
     # This method returns the duration of the note in MIDI, which is in beats.
     def midi_duration(self):
         return self.duration*self.staff.timesig[1]
 
-    # This method draws the note onto the screen.
-    def generate_image(self):
+    # This method returns what the note sounds like on its own: its MIDI pitch, duration and agrément.
+    def heard(self):
+        return (self.midi_pitch(),self.midi_duration(),self.agrement)
+
+    # This method returns all that is kept of the note, as in its row of the NoteTable, in the order
+    # of a saved score's columns (see savefile.COLUMNS).
+    def kept(self):
+        return tuple(getattr(self.table,name)[self.row] for name, code in savefile.COLUMNS)
+
+    # This method draws the note onto the screen.  Unless told not to record (as when it is only
+    # being touched up inside a clipped area), it remembers in self.inked the bounding box of
+    # everything it drew, including marks that stray outside self.rect.
+    def generate_image(self,record=True):
+        screen = self.staff.screen
+        duration, orientation, rung = self.duration, self.orientation, self.rung # (Read from the note's row once.)
+        inked = []
         # Draw notehead to surface
         centerx = int(STAFF_LENGTH/(32*MEASURES_PER)) + self.position[0]
         headpos = (centerx,int(3*STAFF_HEIGHT/8) + self.position[1])
-        if self.orientation:
+        if orientation:
             headpos = (centerx,int(9*STAFF_HEIGHT/8) + self.position[1])
-        if self.duration >= 0.5:
-            pygame.draw.circle(self.staff.screen,INK_COLOR,headpos,int(STAFF_HEIGHT/6),NOTE_LINE)
-        else:
-            pygame.draw.circle(self.staff.screen,INK_COLOR,headpos,int(STAFF_HEIGHT/6))
+        inked.append(NOTE_SPRITES.notehead(screen,headpos,duration < 0.5))
         # Draw note stem to surface
-        if self.duration < 1:
-            if self.orientation:
-                pygame.draw.line(self.staff.screen,INK_COLOR,(int(centerx+STAFF_HEIGHT/6-NOTE_LINE),headpos[1]),self.tip_position,NOTE_LINE)
+        if duration < 1:
+            if orientation:
+                inked.append(NOTE_SPRITES.stem(screen,(int(centerx+STAFF_HEIGHT/6-NOTE_LINE),headpos[1]),self.tip_position))
             else:
-                pygame.draw.line(self.staff.screen,INK_COLOR,(int(centerx-STAFF_HEIGHT/6+NOTE_LINE),headpos[1]),self.tip_position,NOTE_LINE)
+                inked.append(NOTE_SPRITES.stem(screen,(int(centerx-STAFF_HEIGHT/6+NOTE_LINE),headpos[1]),self.tip_position))
         # Draw dot (if it exists)
-        if self.duration * 32 % 3 == 0:
-            pygame.draw.circle(self.staff.screen,INK_COLOR,(headpos[0]+int(STAFF_HEIGHT/4),headpos[1]),NOTE_LINE)
+        if duration * 32 % 3 == 0:
+            inked.append(NOTE_SPRITES.dot(screen,(headpos[0]+int(STAFF_HEIGHT/4),headpos[1])))
         # Draw accidental (if it is marked)
-        if self.accidental != '':
-            mark = pygame.transform.scale(ACCI_DICT[self.accidental],(int(STAFF_HEIGHT/3),int(STAFF_HEIGHT/2)))
-            self.staff.screen.blit(mark,(int(headpos[0]-STAFF_HEIGHT/3),int(headpos[1]-STAFF_HEIGHT/2)))
+        accidental = self.accidental
+        if accidental != '':
+            mark = GLYPHS.get(ACCI_DICT,accidental,(int(STAFF_HEIGHT/3),int(STAFF_HEIGHT/2)))
+            inked.append(screen.blit(mark,(int(headpos[0]-STAFF_HEIGHT/3),int(headpos[1]-STAFF_HEIGHT/2))))
         # Draw agrement (if it exists)
-        if self.agrement != '':
-            mark = pygame.transform.scale(AGREMENT_DICT[self.agrement],(int(STAFF_HEIGHT/2),int(STAFF_HEIGHT/2)))
-            self.staff.screen.blit(mark,(int(centerx-STAFF_HEIGHT/4),int(self.position[1]-STAFF_HEIGHT/3)))
+        agrement = self.agrement
+        if agrement != '':
+            mark = GLYPHS.get(AGREMENT_DICT,agrement,(int(STAFF_HEIGHT/2),int(STAFF_HEIGHT/2)))
+            inked.append(screen.blit(mark,(int(centerx-STAFF_HEIGHT/4),int(self.position[1]-STAFF_HEIGHT/3))))
         # Draw ledger lines (if necessary)
-        if self.rung > CLEF_NOTE_DICT[self.staff.clef]:
-            for l in range((self.rung - CLEF_NOTE_DICT[self.staff.clef]) // 2):
+        if rung > CLEF_NOTE_DICT[self.staff.clef]:
+            for l in range((rung - CLEF_NOTE_DICT[self.staff.clef]) // 2):
                 y = int(self.staff.position[1]+STAFF_HEIGHT-(l+1)*STAFF_HEIGHT/4)
-                pygame.draw.line(self.staff.screen,INK_COLOR,(int(centerx-STAFF_HEIGHT/6),y),(int(centerx+STAFF_HEIGHT/6),y))
-        elif self.rung < CLEF_NOTE_DICT[self.staff.clef] - 8:
-            for l in range((CLEF_NOTE_DICT[self.staff.clef] - 8 - self.rung) // 2):
+                inked.append(pygame.draw.line(screen,INK_COLOR,(int(centerx-STAFF_HEIGHT/6),y),(int(centerx+STAFF_HEIGHT/6),y)))
+        elif rung < CLEF_NOTE_DICT[self.staff.clef] - 8:
+            for l in range((CLEF_NOTE_DICT[self.staff.clef] - 8 - rung) // 2):
                 y = int(self.staff.position[1]+2*STAFF_HEIGHT+(l+1)*STAFF_HEIGHT/4)
-                pygame.draw.line(self.staff.screen,INK_COLOR,(int(centerx-STAFF_HEIGHT/6),y),(int(centerx+STAFF_HEIGHT/6),y))
+                inked.append(pygame.draw.line(screen,INK_COLOR,(int(centerx-STAFF_HEIGHT/6),y),(int(centerx+STAFF_HEIGHT/6),y)))
+        if record:
+            self.inked = inked[0].unionall(inked[1:])
 
     # This method draws an eighth note or sixteenth note's flag/tail.
-    def flag(self):
+    def flag(self,record=True):
         if self.duration < 0.25:
-            if self.orientation:
-                pygame.draw.line(self.staff.screen,INK_COLOR,self.tip_position,(self.tip_position[0]+2*NOTE_LINE,self.tip_position[1]+4*NOTE_LINE),NOTE_LINE)
-                pygame.draw.arc(self.staff.screen,INK_COLOR,[self.tip_position[0]-int(NOTE_LINE*6.4),self.tip_position[1]+2*NOTE_LINE,int(NOTE_LINE*9.2),int(8*NOTE_LINE)],-math.atan(1/2),math.atan(1/2)+0.1,NOTE_LINE)
-            else:
-                pygame.draw.line(self.staff.screen,INK_COLOR,self.tip_position,(self.tip_position[0]+2*NOTE_LINE,self.tip_position[1]-4*NOTE_LINE),NOTE_LINE)
-                pygame.draw.arc(self.staff.screen,INK_COLOR,[self.tip_position[0]-int(NOTE_LINE*6),self.tip_position[1]-10*NOTE_LINE,int(NOTE_LINE*9.2),int(8*NOTE_LINE)],-math.atan(1/2)-0.1,math.atan(1/2),NOTE_LINE)
-            if self.duration < 0.125:
-                if self.orientation:
-                    pygame.draw.line(self.staff.screen,INK_COLOR,(self.tip_position[0],self.tip_position[1]+4*NOTE_LINE),(self.tip_position[0]+2*NOTE_LINE,self.tip_position[1]+8*NOTE_LINE),NOTE_LINE)
-                    pygame.draw.arc(self.staff.screen,INK_COLOR,[self.tip_position[0]-int(NOTE_LINE*6.4),self.tip_position[1]+6*NOTE_LINE,int(NOTE_LINE*9.2),int(8*NOTE_LINE)],-math.atan(1/2),math.atan(1/2)+0.1,NOTE_LINE)
-                else:
-                    pygame.draw.line(self.staff.screen,INK_COLOR,(self.tip_position[0],self.tip_position[1]-4*NOTE_LINE),(self.tip_position[0]+2*NOTE_LINE,self.tip_position[1]-8*NOTE_LINE),NOTE_LINE)
-                    pygame.draw.arc(self.staff.screen,INK_COLOR,[self.tip_position[0]-int(NOTE_LINE*6),self.tip_position[1]-14*NOTE_LINE,int(NOTE_LINE*9.2),int(8*NOTE_LINE)],-math.atan(1/2)-0.1,math.atan(1/2),NOTE_LINE)
+            inked = NOTE_SPRITES.flags(self.staff.screen,self.tip_position,self.orientation,2 if self.duration < 0.125 else 1)
+            if record:
+                self.inked.union_ip(inked)
     
     # This method runs when a note (or the invisible box around it) is clicked on.
     # Note that the box pertains more to the portion of the measure in which the note is played and where the stem is;
     # agrements, accidentals, and dots can all be printed outside this box.
+    # The note is not drawn here; the staff draws it again, with its neighbors, afterwards.
     def feel_click(self,selected_function):
         # Clicking with the accidental function will cause that accidental to appear.
         if selected_function in ACCI_DICT:
             self.accidental = selected_function
-            self.generate_image()
         # Clicking with the inverse function will invert the note (d to q and vice versa).
         elif selected_function == "inverse":
             if self.orientation:
@@ -369,21 +1050,18 @@ class Note():
             elif self.duration * 32 % 3 == 0:
                 self.duration *= 2/3
                 self.rect.width = int(self.rect.width*2/3)
-                self.generate_image()
             elif self.accidental != '':
                 self.accidental = ''
             else:
-                self.staff.notes.remove(self)
+                self.staff.remove_note(self)
         # The dot function will add or remove a dot.
         elif selected_function == "dot":
             if self.duration * 32 % 3 != 0:
                 self.duration *= 1.5
                 self.rect.width = int(self.rect.width*1.5)
-                self.generate_image()
             else:
                 self.duration *= 2/3
                 self.rect.width = int(self.rect.width*2/3)
-                self.generate_image()
         # Agrement function causes agrement marks to appear.
         elif selected_function in AGREMENT_DICT:
             AGREMENT_DONE_DICT[selected_function] = True
@@ -394,123 +1072,478 @@ class Note():
             elif selected_function == 'tremblement' and self.duration * 32 % 3 == 0:
                 self.duration *= 2/3
                 self.rect.width = int(self.rect.width*2/3)
-            self.generate_image()
+
+# This class is a beam: the eighth and sixteenth notes on one beat of a staff whose stems point the same way.
+# Connect stems of eighth notes, sixteeth notes in same beat
+######################################################################################################
+## One thing of interest in Jacquet's original manuscript, not present in the newer copies, is the
+## way she beams notes.  If a sixteenth note follows a dotted eighth note, sharing a beat, as occurs
+## in the second measure of the Allemande and throughout, they are beamed together, but while today one
+## would usually indicate the latter note being a mere sixteeth by a tick towards the eighth, (as in
+## Gouin's edition of her work), in her original manuscript the sixteenth note points its tails
+## rightward.  Also of note is that her beams are not always straight as modern ones, especially when
+## notes on a beat are not purely in ascent or descent; they may curve and stems stick across the beam.
+## There is no clear pattern to these curves, however; they are not always a translation of the curved
+## line that would pass through the noteheads, for example, so for this program beams remain straight.
+########################################################################################################
+# Where the beam lies, where it leaves the stems' tips, and the strokes it is drawn with, are worked out
+# once, when it is made, from where the stems would end unbeamed; the staff makes the beam anew only
+# when the notes on its beat change.
+class Beam():
+    def __init__(self,notes):
+        self.notes = notes # In order, as in the staff.
+        self.strokes = [] # Each stroke of the beam: its image, the inked part of that, where that goes, and the notes it joins.
+        for eachnote in notes:
+            eachnote.tip_position = eachnote.stem_tip
+        # If there is only one note, it should flag itself.  Otherwise, assume any pattern of eighths and sixteenths.
+        if len(notes) > 1 and notes[-1].tip_position[0] != notes[0].tip_position[0]:
+            # Apply one line across all the tops of all the notes.  The stems are moved to meet it,
+            # and then it is drawn from where they end up.
+            self.settle()
+            self.stroke(notes[0].tip_position,notes[-1].tip_position,notes[0],notes[-1])
+            slope = self.settle()
+            for everypair in range(len(notes)-1):
+                left_note, right_note = notes[everypair], notes[everypair+1]
+                if left_note.duration < 0.125:
+                    if right_note.duration < 0.125:
+                        if left_note.orientation:
+                            self.stroke((left_note.tip_position[0],left_note.tip_position[1]+4*NOTE_LINE),(right_note.tip_position[0],right_note.tip_position[1]+4*NOTE_LINE),left_note,right_note)
+                        else:
+                            self.stroke((left_note.tip_position[0],left_note.tip_position[1]-4*NOTE_LINE),(right_note.tip_position[0],right_note.tip_position[1]-4*NOTE_LINE),left_note,right_note)
+                    else:
+                        xchange = (right_note.tip_position[0] - left_note.tip_position[0]) // 2
+                        if left_note.orientation:
+                            self.stroke((left_note.tip_position[0],left_note.tip_position[1]+4*NOTE_LINE),(left_note.tip_position[0]+xchange,int(left_note.tip_position[1]+slope*xchange+4*NOTE_LINE)),left_note)
+                        else:
+                            self.stroke((left_note.tip_position[0],left_note.tip_position[1]-4*NOTE_LINE),(left_note.tip_position[0]+xchange,int(left_note.tip_position[1]+slope*xchange-4*NOTE_LINE)),left_note)
+                elif right_note.duration < 0.125 and everypair == len(notes) - 2:
+                    xchange = (right_note.tip_position[0] - left_note.tip_position[0]) // 3
+                    if right_note.orientation:
+                        self.stroke((right_note.tip_position[0],right_note.tip_position[1]+4*NOTE_LINE),(right_note.tip_position[0]+xchange//2,int(right_note.tip_position[1]+slope*xchange/2+4*NOTE_LINE)),right_note)
+                        self.stroke((right_note.tip_position[0],right_note.tip_position[1]),(right_note.tip_position[0]+xchange//2,int(right_note.tip_position[1]+slope*xchange/2)),right_note)
+                    else:
+                        self.stroke((right_note.tip_position[0],right_note.tip_position[1]-4*NOTE_LINE),(right_note.tip_position[0]+xchange//2,int(right_note.tip_position[1]+slope*xchange/2-4*NOTE_LINE)),right_note)
+                        self.stroke((right_note.tip_position[0],right_note.tip_position[1]),(right_note.tip_position[0]+xchange//2,int(right_note.tip_position[1]+slope*xchange/2)),right_note)
+
+    # This method finds the slope of the line from the first stem's tip to the last's, moves the tips
+    # onto it, and returns the slope.
+    def settle(self):
+        first, last = self.notes[0], self.notes[-1]
+        slope = (last.tip_position[1]-first.tip_position[1]) / (last.tip_position[0]-first.tip_position[0])
+        for right_note in self.notes[1:]:
+            right_note.tip_position = (right_note.tip_position[0],int(first.tip_position[1]+slope*(right_note.tip_position[0]-first.tip_position[0])))
+        return slope
+
+    # This method adds a stroke of the beam, from start to end, joining the given notes.  Each stroke is
+    # drawn whole, once, on a clear surface of its own, which is blitted whenever the beam is drawn: pygame
+    # lays a thick line's pixels out differently once its ends are clipped (by the screen's edge, or by the
+    # area being redrawn), and this way a beam touched up in part matches one drawn all at once.
+    def stroke(self,start,end,*notes):
+        bound = pygame.Rect(min(start[0],end[0]),min(start[1],end[1]),abs(end[0]-start[0])+1,abs(end[1]-start[1])+1).inflate(4*NOTE_LINE+2,4*NOTE_LINE+2)
+        image = pygame.Surface(bound.size,pygame.SRCALPHA)
+        pygame.draw.line(image,INK_COLOR,(start[0]-bound.x,start[1]-bound.y),(end[0]-bound.x,end[1]-bound.y),2*NOTE_LINE)
+        ink = image.get_bounding_rect()
+        self.strokes.append((image,ink,ink.move(bound.topleft),notes))
+
+    # This method draws the beam (or a lone note's flag).  If recording, each stroke of the beam is
+    # added to the ink of the notes it joins.
+    def draw(self,screen,record=True):
+        if len(self.notes) == 1:
+            self.notes[0].flag(record)
+        for image, ink, place, notes in self.strokes:
+            inked = screen.blit(image,place,ink)
+            if record:
+                for eachnote in notes:
+                    eachnote.inked.union_ip(inked)
+
+# This class holds the notes of a staff in order: by when they are played (the staff's time_a_note(),
+# e.g. 6.5 for the second half of the sixth beat), then by the order they were placed in (their seq).
+# They are kept in blocks of at most 2*NOTE_BLOCK notes, each block sorted, with the last key of each
+# block listed apart, so that a note is put in its place or found and taken out by bisecting those
+# lists, and only one short block is shifted, however many notes the staff holds.
+class NoteList():
+    def __init__(self,beat):
+        self.beat = beat # The function giving each note's beat (the staff's time_a_note)
+        self.keys = {} # The key of each note held: its beat and seq
+        self.blocks = [] # The keys of each block, in order
+        self.blocknotes = [] # The notes of each block, in the same order
+        self.maxes = [] # The last key in each block
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self,note):
+        return note in self.keys
+
+    def __iter__(self):
+        for notes in self.blocknotes:
+            yield from notes
+
+    # A note may be had by its place in the order, though this walks the blocks to find it.
+    def __getitem__(self,i):
+        if i < 0:
+            i += len(self)
+        for notes in self.blocknotes:
+            if i < len(notes):
+                return notes[i]
+            i -= len(notes)
+        raise IndexError('note index out of range')
+
+    def add(self,note):
+        key = (self.beat(note),note.seq)
+        self.keys[note] = key
+        if not self.blocks:
+            self.blocks.append([key])
+            self.blocknotes.append([note])
+            self.maxes.append(key)
+            return
+        b = min(bisect.bisect_left(self.maxes,key),len(self.blocks)-1)
+        keys, notes = self.blocks[b], self.blocknotes[b]
+        i = bisect.bisect(keys,key)
+        keys.insert(i,key)
+        notes.insert(i,note)
+        self.maxes[b] = keys[-1]
+        if len(keys) > 2*NOTE_BLOCK: # Split a block grown too long in two.
+            self.blocks[b:b+1] = [keys[:NOTE_BLOCK],keys[NOTE_BLOCK:]]
+            self.blocknotes[b:b+1] = [notes[:NOTE_BLOCK],notes[NOTE_BLOCK:]]
+            self.maxes[b:b+1] = [keys[NOTE_BLOCK-1],keys[-1]]
+
+    def remove(self,note):
+        key = self.keys.pop(note)
+        b = bisect.bisect_left(self.maxes,key)
+        keys, notes = self.blocks[b], self.blocknotes[b]
+        i = bisect.bisect_left(keys,key)
+        del keys[i]
+        del notes[i]
+        if keys:
+            self.maxes[b] = keys[-1]
+        else:
+            del self.blocks[b], self.blocknotes[b], self.maxes[b]
+
+    # This method returns the notes just before and just after a note held, or None where there is none.
+    def neighbours(self,note):
+        key = self.keys[note]
+        b = bisect.bisect_left(self.maxes,key)
+        notes = self.blocknotes[b]
+        i = bisect.bisect_left(self.blocks[b],key)
+        before = notes[i-1] if i > 0 else (self.blocknotes[b-1][-1] if b > 0 else None)
+        after = notes[i+1] if i+1 < len(notes) else (self.blocknotes[b+1][0] if b+1 < len(self.blocks) else None)
+        return before, after
+
+    # This method yields the notes from beat 'start' up to (but not including) beat 'stop', in order.
+    def irange(self,start,stop):
+        b = bisect.bisect_left(self.maxes,(start,))
+        for keys, notes in zip(self.blocks[b:],self.blocknotes[b:]):
+            i = bisect.bisect_left(keys,(start,))
+            for key, note in zip(keys[i:],notes[i:]):
+                if key >= (stop,):
+                    return
+                yield note
+
+    # This method puts the notes in order afresh, as when the beats they fall on have changed.
+    # Where notes now fall on the same beat, they are left in the order they were in.
+    def resort(self,renumber):
+        notes = list(self)
+        for eachnote in notes:
+            renumber(eachnote)
+        self.keys = {}
+        self.blocks, self.blocknotes, self.maxes = [], [], []
+        keyed = sorted(((self.beat(eachnote),eachnote.seq),eachnote) for eachnote in notes)
+        for first in range(0,len(keyed),NOTE_BLOCK):
+            block = keyed[first:first+NOTE_BLOCK]
+            self.blocks.append([key for key, eachnote in block])
+            self.blocknotes.append([eachnote for key, eachnote in block])
+            self.maxes.append(block[-1][0])
+            self.keys.update((eachnote,key) for key, eachnote in block)
+
+# This class files the notes of a staff by where their boxes lie across it, in columns HIT_COLUMN
+# pixels wide, so that the notes under a click are found among those in that column rather than by
+# asking every note on the staff.  A note is filed in every column its box reaches into, in order
+# of the key it is given (the staff gives its time and the order it was placed in), and must be filed
+# again (with update()) whenever its box moves or changes width.
+class NoteIndex():
+    def __init__(self):
+        self.columns = {} # For each column by number, the keys of its notes, in order, and the notes.
+        self.filed = {} # The key of each note, and the columns it is filed in, as a range.
+
+    def add(self,note,key):
+        columns = range(note.rect.left//HIT_COLUMN,(note.rect.right-1)//HIT_COLUMN+1)
+        self.filed[note] = (key,columns)
+        for c in columns:
+            keys, notes = self.columns.setdefault(c,([],[]))
+            i = bisect.bisect(keys,key)
+            keys.insert(i,key)
+            notes.insert(i,note)
+
+    def remove(self,note):
+        key, columns = self.filed.pop(note)
+        for c in columns:
+            keys, notes = self.columns[c]
+            i = bisect.bisect_left(keys,key)
+            del keys[i]
+            del notes[i]
+            if not keys:
+                del self.columns[c]
+
+    def update(self,note):
+        if note in self.filed:
+            key = self.filed[note][0]
+            self.remove(note)
+            self.add(note,key)
+
+    def clear(self):
+        self.columns.clear()
+        self.filed.clear()
+
+    # This method returns the notes filed in the columns from x-positions left to right, in no particular order.
+    def within(self,left,right):
+        found = {}
+        for c in range(left//HIT_COLUMN,right//HIT_COLUMN+1):
+            if c in self.columns:
+                found.update(dict.fromkeys(self.columns[c][1]))
+        return found
+
+    # This method returns the first note, in order of their keys, whose box holds a point, or None.
+    def at(self,point):
+        for eachnote in self.columns.get(point[0]//HIT_COLUMN,((),()))[1]:
+            if eachnote.rect.collidepoint(point):
+                return eachnote
+        return None
 
 # This class - staff - includes a list of the Note objects that are the notes appearing on it,
 # as well as the clef, time signature, and other features.  All notes can refer to their Staff
 # object via the self.staff attribute.  This sort of circular reference is discouraged by
 # theoretical programmers because of the inherent dangers, but they aren't here.
 # Neither the programmers, nor the dangers.
+# A staff is only laid out on the screen while it is in view (see Page); out of view, it has no
+# position, and keeps only its notes.
 class Staff():
     def __init__(self,screen,position,id,clef='cclef',timename="common"):
         self.screen = screen
-        self.position = position # Absolute position on the screen.  Tuple.
+        self.position = None # Absolute position on the screen, while in view.  Tuple.
         self.clef = clef # Clef at the front, as a string.
         self.timename = timename # Time signature, as a string, e.g. "common"
         self.timesig = TIME_TUPLE_DICT[timename] # Time signature, as a tuple, e.g. (4,4)
-        self.notes = []
+        self.notes = NoteList(self.time_a_note) # In order of time_a_note(), and of placement among notes at the same time.
+        self.index = NoteIndex() # The notes, filed by where they are, for finding clicks.
+        self.beams = {} # The beams on each beat, as they are made (see beams_on()).
+        self.table = NoteTable(self) # What is kept of each note, column by column (see Note).
+        self.columns = None # The notes as the score holds them, once asked for (see note_columns()).
+        self.compiled = None # The notes compiled for export, and what they were compiled from (see kept_events()).
+        self.placed = 0 # How many notes have been placed, for numbering them.
+        self.sounded = None # The note the last click placed, or changed the sound of, to be heard (see audition()).
+        self.edited = None # The note the last click placed, changed or erased, to be journaled (see Autosave).
         self.id = id
+        self.rect = None # The staff's area of the screen, while in view.
+        self.inked = None # Bounding box of everything the staff and its notes have drawn, while in view.
+        self.background = None # The paper, lines, clef and time signature, while in view (see BackgroundPool).
+        if position is not None:
+            self.place(position)
+
+    # This method lays the staff out at a position on the screen, as it comes into view: it takes its
+    # background from the pool, and places its notes and files them for finding clicks anew.  The staff
+    # is then drawn with generate_image().
+    def place(self,position):
+        self.position = position
         self.rect = pygame.Rect(self.position[0],self.position[1],STAFF_LENGTH+SIGN_STAFF_LENGTH+STAFF_HEIGHT,3*STAFF_HEIGHT)
+        self.inked = self.rect.copy()
+        self.build_background()
+        self.beams.clear()
+        self.index.clear()
+        for eachnote in self.notes:
+            eachnote.set_position()
+            self.index.add(eachnote,self.notes.keys[eachnote])
+
+    # This method is called as the staff goes out of view, so that it keeps only its notes.
+    def put_away(self):
+        self.position = self.rect = self.inked = self.background = None
+        self.beams.clear()
+        self.index.clear()
+        for eachnote in self.notes:
+            eachnote.forget_position()
+
+    # This method takes the staff's background, for its clef and time signature, from the pool.
+    # It need only be called again when the clef or time signature changes.
+    def build_background(self):
+        self.background = BACKGROUNDS.get(self.clef,self.timename)
 
     # The process by which a staff renders itself, based on the notation in Elisabeth Jean-Claude Jacquet de la Guerre's
     # own score for her Suite in A Minor, is described below.
-    def generate_image(self):
-        # Erase the rest of what's in the staff's area
-        pygame.draw.rect(self.screen,PAPER_COLOR,self.rect)
-        # Draw five horizontal lines and vertical lines in between measures.
-        for l in range(5):
-            y = int(l*STAFF_HEIGHT/4+self.position[1]+STAFF_HEIGHT)
-            pygame.draw.line(self.screen,INK_COLOR,(int(STAFF_HEIGHT/2+self.position[0]),y),(int(STAFF_LENGTH+SIGN_STAFF_LENGTH+STAFF_HEIGHT/2)+self.position[0],y))
-        for m in range(MEASURES_PER):
-            pygame.draw.line(self.screen,INK_COLOR,(int(STAFF_HEIGHT/2+SIGN_STAFF_LENGTH+m*STAFF_LENGTH/MEASURES_PER+self.position[0]),STAFF_HEIGHT+self.position[1]),(int(STAFF_HEIGHT/2+SIGN_STAFF_LENGTH+m*STAFF_LENGTH/MEASURES_PER+self.position[0]),2*STAFF_HEIGHT+self.position[1]))
-        # Draw the clef at the front of each staff.  The C-clef can reach half the staff height below the staff.
-        self.screen.blit(pygame.transform.scale(CLEF_DICT[self.clef],(STAFF_HEIGHT,int(1.5*STAFF_HEIGHT))),(int(STAFF_HEIGHT/2+self.position[0]),STAFF_HEIGHT+self.position[1]))
-        # Draw the time signature immediately following the clef.
-        self.screen.blit(pygame.transform.scale(TIME_DICT[self.timename],(STAFF_HEIGHT,STAFF_HEIGHT)),(int(3*STAFF_HEIGHT/2+self.position[0]),STAFF_HEIGHT+self.position[1]))
+    # Without arguments, the whole staff is erased and drawn again.  Given an area, only what lies in that area
+    # is drawn again (it having already been blanked), except for the notes in 'dirty', which have changed
+    # and are drawn afresh in full, along with their beams.  Only the notes near the area are looked at.
+    def generate_image(self,area=None,dirty=()):
+        if area is None:
+            self.inked = self.rect.copy()
+        self.screen.set_clip(area)
+        # Erase the rest of what's in the staff's area (or in the area, if given) with the paper,
+        # lines, clef and time signature drawn in build_background().
+        self.screen.blit(self.background,self.position)
+        # Sort out which notes are drawn afresh, and which are only touched up where they cross the area.
+        if area is None:
+            drawn = list(self.notes)
+            fresh = set(drawn)
+            touched = set()
+        else:
+            fresh = set(eachnote for eachnote in dirty if eachnote in self.notes)
+            touched = set(eachnote for eachnote in self.notes_near(area) if eachnote not in fresh and eachnote.inked.colliderect(area))
+            drawn = sorted(fresh | touched,key=self.notes.keys.__getitem__)
+        # The beams of the beats drawn on, made if need be, which puts the stems' tips where they meet them.
+        beams = []
+        for beat in sorted(set(self.time_a_note(eachnote) // 1 for eachnote in drawn if eachnote.duration < 0.25)):
+            beams += self.beams_on(beat)
         # Draw the notes, or at least, their heads, stems, and special marks, as these can be done independently.
-        for eachnote in self.notes:
-            eachnote.generate_image()
-        # Connect stems of eighth notes, sixteeth notes in same beat
-        ######################################################################################################
-        ## One thing of interest in Jacquet's original manuscript, not present in the newer copies, is the
-        ## way she beams notes.  If a sixteenth note follows a dotted eighth note, sharing a beat, as occurs
-        ## in the second measure of the Allemande and throughout, they are beamed together, but while today one
-        ## would usually indicate the latter note being a mere sixteeth by a tick towards the eighth, (as in
-        ## Gouin's edition of her work), in her original manuscript the sixteenth note points its tails
-        ## rightward.  Also of note is that her beams are not always straight as modern ones, especially when
-        ## notes on a beat are not purely in ascent or descent; they may curve and stems stick across the beam.
-        ## There is no clear pattern to these curves, however; they are not always a translation of the curved
-        ## line that would pass through the noteheads, for example, so for this program beams remain straight.
-        ########################################################################################################
-        # This sub-method beams the set of notes on one beat in one staff.
-        def beam(noteset):
-            # Look at the d-notes and p-notes separately.  If there is only one, it should flag itself.
-            if len(noteset) == 1:
-                noteset[0].flag()
-               # Otherwise, assume any pattern of eighths and sixteenths.
-            elif len(noteset) > 1 and noteset[-1].tip_position[0] != noteset[0].tip_position[0]:
-                # Apply one line across all the tops of all the notes.
-                # Find the slope of this line and adjust tip positions to fit.
-                pygame.draw.line(self.screen,INK_COLOR,noteset[0].tip_position,noteset[-1].tip_position,2*NOTE_LINE)
-                slope = (noteset[-1].tip_position[1]-noteset[0].tip_position[1]) / (noteset[-1].tip_position[0]-noteset[0].tip_position[0])
-                for everypair in range(len(noteset)-1):
-                    left_note, right_note = noteset[everypair], noteset[everypair+1]
-                    right_note.tip_position = (right_note.tip_position[0],int(noteset[0].tip_position[1]+slope*(right_note.tip_position[0]-noteset[0].tip_position[0])))
-                    if left_note.duration < 0.125:
-                        if right_note.duration < 0.125:
-                            if left_note.orientation:
-                                pygame.draw.line(self.screen,INK_COLOR,(left_note.tip_position[0],left_note.tip_position[1]+4*NOTE_LINE),(right_note.tip_position[0],right_note.tip_position[1]+4*NOTE_LINE),2*NOTE_LINE)
-                            else:
-                                pygame.draw.line(self.screen,INK_COLOR,(left_note.tip_position[0],left_note.tip_position[1]-4*NOTE_LINE),(right_note.tip_position[0],right_note.tip_position[1]-4*NOTE_LINE),2*NOTE_LINE)
-                        else:
-                            xchange = (right_note.tip_position[0] - left_note.tip_position[0]) // 2
-                            if left_note.orientation:
-                                pygame.draw.line(self.screen,INK_COLOR,(left_note.tip_position[0],left_note.tip_position[1]+4*NOTE_LINE),(left_note.tip_position[0]+xchange,int(left_note.tip_position[1]+slope*xchange+4*NOTE_LINE)),2*NOTE_LINE)
-                            else:
-                                pygame.draw.line(self.screen,INK_COLOR,(left_note.tip_position[0],left_note.tip_position[1]-4*NOTE_LINE),(left_note.tip_position[0]+xchange,int(left_note.tip_position[1]+slope*xchange-4*NOTE_LINE)),2*NOTE_LINE)
-                    elif right_note.duration < 0.125 and everypair == len(noteset) - 2:
-                        xchange = (right_note.tip_position[0] - left_note.tip_position[0]) // 3
-                        if right_note.orientation:
-                            pygame.draw.line(self.screen,INK_COLOR,(right_note.tip_position[0],right_note.tip_position[1]+4*NOTE_LINE),(right_note.tip_position[0]+xchange//2,int(right_note.tip_position[1]+slope*xchange/2+4*NOTE_LINE)),2*NOTE_LINE)
-                            pygame.draw.line(self.screen,INK_COLOR,(right_note.tip_position[0],right_note.tip_position[1]),(right_note.tip_position[0]+xchange//2,int(right_note.tip_position[1]+slope*xchange/2)),2*NOTE_LINE)
-                        else:
-                            pygame.draw.line(self.screen,INK_COLOR,(right_note.tip_position[0],right_note.tip_position[1]-4*NOTE_LINE),(right_note.tip_position[0]+xchange//2,int(right_note.tip_position[1]+slope*xchange/2-4*NOTE_LINE)),2*NOTE_LINE)
-                            pygame.draw.line(self.screen,INK_COLOR,(right_note.tip_position[0],right_note.tip_position[1]),(right_note.tip_position[0]+xchange//2,int(right_note.tip_position[1]+slope*xchange/2)),2*NOTE_LINE)
-                        
-        # Iterate through notes.
-        beat = 0
-        shared_upper_notes = []
-        shared_lower_notes = []
-        itsbeat = 0
-        for eachnote in range(len(self.notes)):
-            # Go through notes, beat by beat, ignoring all quarter notes and above.
-            if self.notes[eachnote].duration < 0.25:
-                itsbeat = self.time_a_note(self.notes[eachnote]) // 1
-                if itsbeat > beat:
-                    # This means we have reached a new beat.  First stem the old:
-                    for noteset in [shared_lower_notes,shared_upper_notes]:
-                        beam(noteset)
-                    # Then start the new.
-                    beat = itsbeat
-                    shared_upper_notes = []
-                    shared_lower_notes = []
-                if self.notes[eachnote].orientation:
-                    shared_upper_notes.append(self.notes[eachnote])
-                else:
-                    shared_lower_notes.append(self.notes[eachnote])
-        for noteset in [shared_lower_notes,shared_upper_notes]:
-            beam(noteset)
+        for eachnote in drawn:
+            if eachnote in fresh:
+                self.screen.set_clip(None)
+                eachnote.generate_image()
+                self.inked.union_ip(eachnote.inked)
+            else:
+                self.screen.set_clip(area)
+                eachnote.generate_image(record=False)
+        # Then the beams (and flags) that join them.
+        for eachbeam in beams:
+            if fresh.intersection(eachbeam.notes):
+                self.screen.set_clip(None)
+                eachbeam.draw(self.screen)
+                for eachnote in eachbeam.notes:
+                    self.inked.union_ip(eachnote.inked)
+            elif touched.intersection(eachbeam.notes):
+                self.screen.set_clip(area)
+                eachbeam.draw(self.screen,record=False)
+        self.screen.set_clip(None)
+
+    # This method returns the beams on one beat: those of the eighth and sixteenth notes with stems down,
+    # then with stems up.  They are kept until the notes on that beat change (see forget_beams()).
+    def beams_on(self,beat):
+        if beat not in self.beams:
+            shared_upper_notes = []
+            shared_lower_notes = []
+            for eachnote in self.notes.irange(beat,beat+1):
+                # Ignore all quarter notes and above.
+                if eachnote.duration < 0.25:
+                    if eachnote.orientation:
+                        shared_upper_notes.append(eachnote)
+                    else:
+                        shared_lower_notes.append(eachnote)
+            self.beams[beat] = [Beam(shared_lower_notes),Beam(shared_upper_notes)]
+        return self.beams[beat]
+
+    # This method is called when the notes on a beat have changed, so that its beams will be made anew.
+    def forget_beams(self,beat):
+        self.beams.pop(beat,None)
+
+    # This method returns the notes whose ink might reach into an area.  A note's ink strays from its box
+    # by no more than its beam, which keeps to the note's beat, and its marks, which keep within a staff
+    # height; so the notes filed within that distance either side of the area are all that can.
+    def notes_near(self,area):
+        beat = STAFF_LENGTH*self.timesig[1]/(MEASURES_PER*4*self.timesig[0]) # The width of a beat, in pixels
+        return self.index.within(int(area.left-2*beat-STAFF_HEIGHT),int(area.right+2*beat+STAFF_HEIGHT))
+
+    # This method finds the notes on one beat of the staff, e.g., beat 6 holds the notes from 6 up to 7.
+    def beat_notes(self,beat):
+        return list(self.notes.irange(beat,beat+1))
+
+    # This method finds the notes in one measure of the staff, e.g., in 3/4 time, measure 2 holds those
+    # on beats 7 up to 10 (measures are numbered from 1, and beats within them too).  A note placed in a
+    # longer time signature keeps its beat when it changes, so the notes are looked for as far as the
+    # longest measure of any reaches.
+    def measure_notes(self,measure):
+        start = measure*self.timesig[0] + 1
+        return [eachnote for eachnote in self.notes.irange(start,start+LONGEST_MEASURE) if eachnote.time[0] == measure]
+
+    # This method reports what must be drawn again after the notes on a beat have changed:
+    # the area where those notes were inked before the change (as 'before', a list of their inked
+    # rectangles, copied before the change), and the notes there now.
+    # These are passed on to generate_image() (by way of the staff paper, as ink can stray onto other staves).
+    def damage(self,beat,before):
+        dirty = self.beat_notes(beat)
+        rects = before + [eachnote.rect for eachnote in dirty]
+        if not rects:
+            return None
+        return rects[0].unionall(rects[1:]), dirty
+
+    # This method puts a note in the staff, in order.  Each note is numbered as it is placed, so that
+    # notes at the same time keep the order they were placed in.
+    def add_note(self,note):
+        note.seq = self.placed
+        self.placed += 1
+        self.notes.add(note)
+        if self.position is not None:
+            self.index.add(note,self.notes.keys[note])
+        self.forget_beams(self.time_a_note(note) // 1)
+        self.forget_compiled()
+
+    # This method fills the staff, while it is still empty, with the notes of a saved score: the columns
+    # of its NoteTable, by name, with the notes in order (see SavedScore.columns()).
+    def load(self,columns):
+        for name, column in columns.items():
+            setattr(self.table,name,column)
+        for row in range(len(self.table.seq)):
+            self.notes.add(Note.of_row(self,row))
+        self.placed = max(self.table.seq,default=-1) + 1
+
+    # This method puts a note in the staff as a journal kept it (see Page.replay()): with the seq it
+    # had, in place of the given note if there is one (the one with that seq), and returns it.
+    def restore(self,values,note=None):
+        measure, beat, duration, seq, *rest = values
+        if note is None:
+            note = Note.of_row(self,self.table.new_row(measure,beat,duration,*rest,seq))
+            self.notes.add(note)
+            self.placed = max(self.placed,seq+1)
+        else:
+            moved = note.time != (measure,beat) # Only then is it put in its place again.
+            if moved:
+                self.notes.remove(note)
+            for (name, code), value in zip(savefile.COLUMNS,values):
+                getattr(self.table,name)[note.row] = value
+            if moved:
+                self.notes.add(note)
+        self.forget_compiled()
+        return note
+
+    def remove_note(self,note):
+        self.notes.remove(note)
+        if self.position is not None:
+            self.index.remove(note)
+        self.forget_beams(self.time_a_note(note) // 1)
+        self.forget_compiled()
+        self.table.free_row(note.row) # (Its values are kept until the row is handed out again.)
+
+    # This method puts the notes in order and files them again, as after the time signature changes.
+    def reindex(self):
+        def renumber(eachnote):
+            eachnote.seq = self.placed
+            self.placed += 1
+        self.notes.resort(renumber)
+        self.beams.clear()
+        self.forget_compiled()
+        self.index.clear()
+        if self.position is not None:
+            for eachnote in self.notes:
+                self.index.add(eachnote,self.notes.keys[eachnote])
+
+    # This method returns the note at a point, or None.  Where several notes' boxes overlap,
+    # it is the earliest, as it would be going through the notes in order.
+    def note_at(self,point):
+        return self.index.at(point)
 
     # This method is called to set the clef on a staff.
     def change_clef(self,clef):
         self.clef = clef
-        self.generate_image()
+        self.forget_compiled()
+        if self.position is not None:
+            self.build_background()
+            self.generate_image()
     
     # This method is called to set the time signature on a staff.
     def change_time(self,time):
         self.timename = time 
         self.timesig = TIME_TUPLE_DICT[time]
-        self.generate_image()
+        self.reindex()
+        if self.position is not None:
+            self.build_background()
+            self.generate_image()
     
     # This note determines on what beat in a staff a note appears,
     # e.g., an eighth note at the end of the second measure of 3/4 time
@@ -518,18 +1551,66 @@ class Staff():
     def time_a_note(self,note):
         return note.time[0]*self.timesig[0] + note.time[1]
 
+    # This method lists the staff's notes as the score (see score.py) holds them: each one's beat,
+    # duration and pitch in MIDI terms, and its agrément's name (read from note_columns()).
+    def score_notes(self):
+        return [(beat,duration,pitch,score.AGREMENTS[agrement]) for beat, duration, pitch, agrement in self.note_columns().tolist()]
+
+    # This method returns the staff's notes as an array of score.NOTE, made from their columns in the
+    # staff's NoteTable (see score.table_columns()) only when the notes have changed since it was last asked for.
+    def note_columns(self):
+        if self.columns is None:
+            self.columns = score.table_columns(self.table,[eachnote.row for eachnote in self.notes],self.timesig)
+        return self.columns
+
+    # This method returns the staff's notes as compiled for export (see score.compile_staff()) from
+    # columns (as note_columns() gave them) for job, the (offset, track, context) they are compiled
+    # with, if they have been kept since, or None.  They are kept for as long as the staff and its job
+    # stay the same, so that exporting after an edit compiles only the staves it touched.  As an export
+    # is compiled on a thread of its own (see ExportWorker) while the player may go on editing, what is
+    # kept is tied to the very columns it was compiled from, which are made anew after any edit, so
+    # that nothing compiled from notes that have since changed is ever given again.
+    def kept_events(self,columns,job):
+        compiled = self.compiled
+        if compiled is not None and compiled[0] is columns and compiled[1] == job:
+            COMPILED.hits += 1
+            return compiled[2]
+        COMPILED.misses += 1
+        return None
+
+    # This method keeps the staff's notes as compiled for export (see score.compiled_events()) from
+    # columns for a job, as above.
+    def keep_events(self,columns,job,events):
+        self.compiled = (columns,job,events)
+
+    # This method is called when the staff's notes, clef or time signature have changed, so that they
+    # will be compiled anew at the next export.
+    def forget_compiled(self):
+        self.columns = None
+        self.compiled = None
+
     # This method is how a staff responds to being clicked, in the loop
     # after clef and time signature have been set.
     def feel_click(self,mousepos,selected_function):
         # Where in the staff's rectangle it was clicked.
         relpos = (mousepos[0]-self.position[0],mousepos[1]-self.position[1])
+        self.sounded = self.edited = None
         if relpos[0] > 2.5*STAFF_HEIGHT: # Only matters if clicked in music part.
             # If a note is clicked on, it gets priority.
-            for eachnote in self.notes:
-                if eachnote.rect.collidepoint(mousepos):
-                    eachnote.feel_click(selected_function)
-                    self.generate_image()
-                    return False # Only one note responds to click.
+            eachnote = self.note_at(mousepos)
+            if eachnote is not None:
+                beat = self.time_a_note(eachnote) // 1
+                before = [eachnote.inked.copy() for eachnote in self.beat_notes(beat)]
+                heard, kept = eachnote.heard(), eachnote.kept()
+                eachnote.feel_click(selected_function)
+                if eachnote in self.notes and eachnote.heard() != heard:
+                    self.sounded = eachnote
+                if eachnote not in self.notes or eachnote.kept() != kept:
+                    self.edited = eachnote
+                self.index.update(eachnote) # Its box may have moved or changed width (unless it was erased).
+                self.forget_beams(beat)
+                self.forget_compiled()
+                return self.damage(beat,before) # Only one note responds to click.
             if selected_function in NOTE_TIME_DICT:
                 # Algorithm for when a staff is clicked on with the note placement tool.
                 # First, find the time of the note.
@@ -551,14 +1632,765 @@ class Staff():
                 noteoctave = (toprung-stepsdown) // 7
                 newnote = Note(self,time,duration,notename+str(noteoctave))
                 newnote.set_position()
-                self.notes.append(newnote)
-                self.notes.sort(key=self.time_a_note)
-                self.generate_image()
+                beat = self.time_a_note(newnote) // 1
+                before = [eachnote.inked.copy() for eachnote in self.beat_notes(beat)]
+                self.add_note(newnote)
+                self.sounded = self.edited = newnote
+                return self.damage(beat,before)
+        return None
+
+# This class - page - is the whole of the score: its staves, system by system, for as many systems as
+# the piece runs to, of which SYSTEMS at a time are in view.  Only the staves in view are laid out and
+# drawn (see Staff.place()); the rest keep only their notes.  Systems are made as they first come into
+# view, and the page can be scrolled one system past the last with any notes on it, so the piece can
+# always be carried on.  However long it grows, then, scrolling lays out and draws the same few staves.
+# A page may also be opened from a saved score (see open_page()), whose staves are read from the file
+# only as they are made.
+class Page():
+    def __init__(self,screen,clefs,timename="common",saved=None,top=0):
+        self.screen = screen
+        self.clefs = list(clefs) # The clef of each staff of a system, from the top, as systems are made
+        self.timename = timename # The time signature, as systems are made
+        self.staves = [] # Every staff, system by system, in order, or None for those not yet made; each one's id is its place here.
+        self.saved = saved # The saved score the page was opened from, if any (a savefile.SavedScore)
+        self.top = None # The first system in view
+        self.shown = [] # The staves in view, from the top
+        self.scroll_to(top)
+
+    # This method returns the sth staff (from 0), making it if need be, with its notes read from the
+    # saved score if the page was opened from one.
+    def staff(self,s):
+        if s >= len(self.staves):
+            self.staves.extend([None]*(s+1-len(self.staves)))
+        if self.staves[s] is None:
+            self.staves[s] = Staff(self.screen,None,s,self.clefs[s % STAVES_PER],self.timename)
+            if self.saved is not None and s < self.saved.staves:
+                self.staves[s].load(self.saved.columns(s))
+        return self.staves[s]
+
+    # This method returns the staves of the nth system (from 0), making them if need be.
+    def system(self,n):
+        return [self.staff(s) for s in range(n*STAVES_PER,(n+1)*STAVES_PER)]
+
+    # This method returns how many notes the sth staff has, without making it.
+    def count(self,s):
+        if s < len(self.staves) and self.staves[s] is not None:
+            return len(self.staves[s].notes)
+        if self.saved is not None and s < self.saved.staves:
+            return self.saved.counts(s)[1]
+        return 0
+
+    # This method returns the last system with any notes on it, or -1 if there are none.
+    def last_written(self):
+        for s in range(max(len(self.staves),self.saved.staves if self.saved is not None else 0)-1,-1,-1):
+            if self.count(s):
+                return s // STAVES_PER
+        return -1
+
+    # This method returns the staves of the piece: those of every system up to the last with any
+    # notes on it, and at least those of the first page.  Any not yet made are made.
+    def written(self):
+        return [self.staff(s) for s in range(max(self.last_written()+1,SYSTEMS)*STAVES_PER)]
+
+    # This method takes what is to be saved of the piece, as savefile.write() is given it.  The columns
+    # of the staves made are copied, so that they may be edited while it is written out, and their notes
+    # are put in order only then (see savefile.ordered()); the staves not yet made are as they were
+    # saved, and are read from the saved score only as it is written.
+    def snapshot(self):
+        staves = []
+        for s in range(max(self.last_written()+1,SYSTEMS)*STAVES_PER):
+            eachstaff = self.staves[s] if s < len(self.staves) else None
+            if eachstaff is not None:
+                table = eachstaff.table
+                staves.append(({name:getattr(table,name)[:] for name, code in savefile.COLUMNS},
+                               lambda columns, free=table.free[:], beats=eachstaff.timesig[0]: savefile.ordered(columns,free,beats)))
+            elif self.saved is not None and s < self.saved.staves:
+                staves.append((self.saved,s))
+            else:
+                staves.append(({},[]))
+        return self.timename,list(self.clefs),(STAVES_PER,MEASURES_PER,SYSTEMS),self.top,staves
+
+    # This method puts a score written with savefile.write() ('written') in the place of 'path', and
+    # reads the staves not yet made from it from then on.  The score the page was opened from is closed
+    # first, so that it may be saved over.
+    def reopen(self,written,path):
+        opened = self.saved.path if self.saved is not None else None
+        if self.saved is not None:
+            self.saved.close()
+            self.saved = None
+        try:
+            os.replace(written,path)
+        except OSError:
+            if opened is not None:
+                self.saved = savefile.SavedScore(opened)
+            raise
+        self.saved = savefile.SavedScore(path)
+
+    # This method saves the piece to a file (see savefile.py), and reads it from there from then on.
+    def save(self,path):
+        savefile.write(path + '.tmp',*self.snapshot())
+        self.reopen(path + '.tmp',path)
+
+    # This method brings the systems from 'top' down into view (as far as the page may be scrolled).
+    # The staves going out of view are put away, and those in view laid out in their places, each in
+    # the place the staves have always been, e.g. the first in view is always at the top left; they
+    # are then drawn by drawing the page anew.  It returns whether anything moved.
+    def scroll_to(self,top):
+        top = max(0,min(top,self.last_written()+1))
+        if top == self.top:
+            return False
+        shown = [eachstaff for n in range(top,top+SYSTEMS) for eachstaff in self.system(n)]
+        for eachstaff in self.shown:
+            if eachstaff not in shown:
+                eachstaff.put_away()
+        for s, eachstaff in enumerate(shown):
+            eachstaff.place((int(STAFF_HEIGHT/2),int((6*s+0.5)*STAFF_HEIGHT/2)))
+        self.top = top
+        self.shown = shown
+        return True
+
+    # This method finds the staff in view at a point.  The staves are evenly spaced down the page,
+    # so the one a point is nearest is worked out from its height, and only it and its neighbors are asked.
+    def staff_at(self,pos):
+        s = int((pos[1]-STAFF_HEIGHT/4)//(3*STAFF_HEIGHT))
+        for eachstaff in self.shown[max(0,s-1):s+2]:
+            if eachstaff.rect.collidepoint(pos):
+                return eachstaff
+        return None
+
+    # This method sets the clef of the nth staff of every system (from the top, from 0).
+    def change_clef(self,n,clef):
+        self.clefs[n] = clef
+        for eachstaff in self.staves[n::STAVES_PER]:
+            if eachstaff is not None:
+                eachstaff.change_clef(clef)
+
+    # This method sets the time signature of every staff.
+    def change_time(self,timename):
+        self.timename = timename
+        for eachstaff in self.staves:
+            if eachstaff is not None:
+                eachstaff.change_time(timename)
+
+    # This method makes again the edits read from a journal (see savefile.Journal), returning how many
+    # there were, and how many of them placed or changed notes.  The staves in view are put away
+    # meanwhile, and laid out again afterwards.
+    def replay(self,records):
+        shown = [(eachstaff,eachstaff.position) for eachstaff in self.shown]
+        for eachstaff, position in shown:
+            eachstaff.put_away()
+        times, clefs = list(TIME_TUPLE_DICT), list(CLEF_NOTE_DICT)
+        seqs = {} # The notes of each staff edited, by seq
+        count = notes = 0
+        for kind, s, code, values in records:
+            count += 1
+            if kind == savefile.TIME:
+                if times[code] != self.timename:
+                    self.change_time(times[code])
+                    seqs.clear() # The notes are numbered anew.
+            elif kind == savefile.CLEF:
+                if clefs[code] != self.clefs[s]:
+                    self.change_clef(s,clefs[code])
+            else:
+                if s not in seqs:
+                    seqs[s] = {eachnote.seq:eachnote for eachnote in self.staff(s).notes}
+                seq = values[3] # (Its place in savefile.COLUMNS.)
+                if kind == savefile.NOTE:
+                    seqs[s][seq] = self.staves[s].restore(values,seqs[s].get(seq))
+                    notes += 1
+                elif seq in seqs[s]:
+                    self.staves[s].remove_note(seqs[s].pop(seq))
+        for eachstaff, position in shown:
+            eachstaff.place(position)
+        return count, notes
+
+# This function opens a score saved with Page.save() as a page, scrolled to where it was saved.  Only
+# the staves in view are read from the file, and the rest as they are scrolled to.
+def open_page(screen,path):
+    saved = savefile.SavedScore(path)
+    if (saved.staves_per,saved.measures_per) != (STAVES_PER,MEASURES_PER):
+        saved.close()
+        raise ValueError(f"{path} was saved with {saved.measures_per} measures on each of {saved.staves_per} staves a system, not {MEASURES_PER} on {STAVES_PER}")
+    if saved.timename not in TIME_TUPLE_DICT or any(clef not in CLEF_NOTE_DICT for clef in saved.clefs):
+        saved.close()
+        raise ValueError(f"{path} has a time signature or clef the game does not know")
+    return Page(screen,saved.clefs,saved.timename,saved,saved.top)
+
+# This class - scheduler - paces the loops of the game.  Instead of asking pygame for events
+# as fast as the processor allows, it sleeps in pygame.event.wait() until the player does
+# something, and it only presents a frame when something has been drawn since the last one,
+# and no more often than its frame rate allows.  Only the rectangles drawn on are presented.  It also keeps count of the time spent asleep
+# (idle) and awake (busy), so one may confirm the game is not working while the player reads.
+class Scheduler():
+    def __init__(self,fps=FRAME_RATE,idle_timeout=IDLE_TIMEOUT):
+        self.fps = fps # Most frames presented per second; 0 for no cap.
+        self.idle_timeout = idle_timeout # Longest sleep, in milliseconds, when nothing is pending.
+        self.damaged = False # Whether anything has been drawn since the last frame.
+        self.dirty_rects = [] # What has been drawn on since the last frame, or None for the whole window.
+        self.last_frame = None # The clock() at the last frame presented.
+        self.frames = 0
+        self.idle_time = 0.0 # Seconds spent waiting on events.
+        self.started = time.perf_counter()
+        self.first_frame = None # perf_counter() at the first frame presented.
+
+    # This method is called whenever something has been drawn to the screen, with the
+    # rectangle drawn on, or with nothing if the whole window must be presented.
+    def damage(self,rect=None):
+        self.damaged = True
+        if rect is None:
+            self.dirty_rects = None
+        elif self.dirty_rects is not None:
+            self.dirty_rects.append(pygame.Rect(rect))
+
+    # This method returns the time in milliseconds.  (pygame.time.get_ticks() would need the
+    # timer started, which pygame.init() is no longer called to do.)
+    def clock(self):
+        return 1000*time.perf_counter()
+
+    # This method returns how many milliseconds remain before another frame may be presented.
+    def frame_wait(self):
+        if self.fps <= 0 or self.last_frame is None:
+            return 0
+        return max(0,int(self.last_frame + 1000/self.fps - self.clock()))
+
+    # This method returns the events waiting in the queue, sleeping until one arrives if the queue is
+    # empty.  If a frame is waiting to be presented, it sleeps no longer than the frame cap requires.
+    def next_events(self):
+        timeout = self.frame_wait() if self.damaged else self.idle_timeout
+        events = []
+        if timeout > 0 and not pygame.event.peek():
+            start = time.perf_counter()
+            event = pygame.event.wait(timeout)
+            self.idle_time += time.perf_counter() - start
+            if event.type != pygame.NOEVENT:
+                events.append(event)
+        events += pygame.event.get()
+        for e in events: # If the window is uncovered, it must be drawn again.
+            if e.type == pygame.VIDEOEXPOSE:
+                self.damage()
+        return events
+
+    # This method presents a frame, if anything has been drawn and the frame cap allows it.
+    def present(self):
+        if self.damaged and self.frame_wait() == 0:
+            if self.dirty_rects is None:
+                pygame.display.update()
+            else:
+                pygame.display.update(self.dirty_rects)
+            self.damaged = False
+            self.dirty_rects = []
+            self.last_frame = self.clock()
+            self.frames += 1
+            if self.first_frame is None:
+                self.first_frame = time.perf_counter()
+
+    # This method describes how the time since the scheduler was made has been spent.
+    def report(self):
+        total = time.perf_counter() - self.started
+        busy = total - self.idle_time
+        first = '' if self.first_frame is None else f"; first frame after {self.first_frame - self.started:.3f} s"
+        return f"{self.frames} frames in {total:.2f} s: busy {busy:.2f} s, idle {self.idle_time:.2f} s ({100*self.idle_time/max(total,1e-9):.1f}% idle){first}."
+
+# This function gives the track of the MIDI file a staff's notes are exported on: all on one,
+# each staff on its own, or each system on its own, as EXPORT_TRACKS says.
+def export_track(staff):
+    if EXPORT_TRACKS == 'staff':
+        return staff.id
+    elif EXPORT_TRACKS == 'system':
+        return staff.id // STAVES_PER
+    return 0
+
+# This function lists what exporting each staff takes: the staff, its notes' columns (see
+# Staff.note_columns()), and its job - its first beat in the piece (the first of its system), its
+# track, and what it is handed by the staves before it (see score.handed_on()).  Those can be
+# compiled apart, and on another thread, as nothing more is asked of the staves themselves.
+def export_jobs(staves):
+    beats_per_staff = staves[0].timesig[0]*MEASURES_PER
+    jobs = []
+    context = score.START
+    for eachstaff in staves:
+        columns = eachstaff.note_columns()
+        track = export_track(eachstaff)
+        jobs.append((eachstaff,columns,(beats_per_staff*(eachstaff.id//STAVES_PER),track,context)))
+        context = score.handed_on(columns,track,context)
+    return jobs
+
+# This function compiles the jobs (as export_jobs() gave them) into each staff's notes played (as
+# Score.compile_staves() would), taking what each staff keeps compiled (see Staff.kept_events()), and
+# compiling the staves not kept by as many workers as are given.
+def compile_streams(jobs,workers=1):
+    streams = [eachstaff.kept_events(columns,job) for eachstaff, columns, job in jobs]
+    missed = [k for k, events in enumerate(streams) if events is None]
+    staff_jobs = [(offset,columns,track,context) for eachstaff, columns, (offset, track, context) in (jobs[k] for k in missed)]
+    compiled = score.pool_map(score.compiled_events,staff_jobs,workers,sum(len(columns) for offset, columns, track, context in staff_jobs))
+    for k, events in zip(missed,compiled):
+        eachstaff, columns, job = jobs[k]
+        eachstaff.keep_events(columns,job,events)
+        streams[k] = events
+    return streams
+
+# This function compiles the jobs into the score's timeline of notes played (as Score.compile() would).
+def compile_jobs(jobs,workers=1):
+    return score.merge(compile_streams(jobs,workers))
+
+# This function compiles the staves into the score's timeline of notes played.
+def compile_staves(staves,workers=1):
+    return compile_jobs(export_jobs(staves),workers)
+
+# This class - export - is an export of the staves' music as a MIDI file.  What it needs of the staves
+# is taken when it is made, so that the rest (run()) may be done on another thread while the player
+# goes on editing.  The file is named for the music in it, so the same piece is always the same file
+# (see ExportCache); the key it is in is taken from its last note.
+class Export():
+    def __init__(self,staves,cache=EXPORTS):
+        self.jobs = export_jobs(staves)
+        self.music = score.Score()
+        for eachstaff, columns, (offset, track, context) in self.jobs:
+            self.music.add_columns(offset,columns,track)
+        self.key = 'c'
+        for eachstaff in staves:
+            if len(eachstaff.notes):
+                self.key = eachstaff.notes[-1].pitch[0]
+        self.tempo = staves[0].timesig[0]*30
+        self.cache = cache
+        self.path = None # The file's path, once it is exported.
+        self.error = None # Anything that went wrong exporting or playing it (see ExportWorker).
+
+    # This method writes the file, or finds it written already, and returns its path.
+    def run(self):
+        filename = f"Harpischord in {self.key.upper()}, No. {self.music.digest(self.tempo)}.mid"
+        def written(output_file):
+            score.write_midi(compile_streams(self.jobs,EXPORT_WORKERS),output_file,self.tempo,EXPORT_WORKERS)
+        self.path = self.cache.fetch(filename,written)
+        return self.path
+
+# This class - export worker - exports the music and plays it on a thread of its own, so that the game
+# goes on drawing and answering the player meanwhile.  When an export is done (or has failed), an
+# EXPORT_DONE event is posted, bearing it, for the game's loop to answer.  If play is pressed again
+# before then, only the latest music asked for is exported next.
+class ExportWorker():
+    def __init__(self,play=True):
+        self.play = play # Whether to play each file once it is exported.
+        self.lock = threading.Lock()
+        self.waiting = None # The export to be run next.
+        self.thread = None # The thread running exports, while there are any to run.
+
+    # This method asks for an export to be run, starting a thread to run it if there is none.
+    def start(self,export):
+        with self.lock:
+            self.waiting = export
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.work,daemon=True)
+                self.thread.start()
+
+    # This method runs the exports asked for, one after another, until there are none left.
+    def work(self):
+        while True:
+            with self.lock:
+                export = self.waiting
+                self.waiting = None
+                if export is None:
+                    self.thread = None
+                    return
+            try:
+                export.run()
+                if self.play:
+                    play(export)
+            except Exception as error: # Reported by the game's loop, rather than lost with the thread.
+                export.error = error
+            pygame.event.post(pygame.event.Event(EXPORT_DONE,export=export))
+
+    # Whether an export is being run or waiting to be.
+    def busy(self):
+        return self.thread is not None
+
+# This function plays the music of an export: on Windows, its MIDI file, in whatever program opens
+# such files, as the game always has; elsewhere, where there is no os.startfile(), on the game's own
+# harpsichord (see harpsichord.py), streamed to the mixer as it is rendered (see Player).
+def play(export):
+    if hasattr(os,'startfile'):
+        os.startfile(export.path)
+    else:
+        PLAYER.play(compile_jobs(export.jobs,EXPORT_WORKERS),export.tempo)
+
+# This function writes the piece saved at 'path' (with whatever has been journaled since) to a WAV file,
+# played on the game's harpsichord, without opening the window.  The journal is read, not kept.
+def render_wav(path,output_file):
+    page = open_page(pygame.Surface(WINDOW_DIM),path)
+    page.replay(savefile.Journal(path + '.journal').read())
+    export = Export(page.written(),None)
+    harpsichord.write_wav(compile_jobs(export.jobs,EXPORT_WORKERS),output_file,export.tempo)
+
+# The mixer is started the first time there is something to play, rather than with the game, handed
+# so many samples at a time (the Player's buffers should be no smaller, or it will run dry between
+# them).  It yields the mixer's (frequency, format, channels).
+def init_audio(buffer=MIXER_BUFFER):
+    if not pygame.mixer.get_init():
+        pygame.mixer.init(harpsichord.SAMPLE_RATE,-16,2,buffer)
+        pygame.mixer.set_reserved(1) # Channel 0 is kept for the Player.
+    return pygame.mixer.get_init()
+
+# This class - player - plays notes (as Score.compile() makes them) on the game's harpsichord, rendering
+# them only a little ahead of what is being heard, rather than the whole piece before the first note, so
+# that playing begins at once however long the piece.  On a thread of its own, it keeps 'lookahead'
+# seconds of music rendered (in buffers of 'buffer' samples), and hands the mixer's channel the next
+# buffer as soon as the channel will take it (as each begins to play, the one after may be queued).
+# It counts the times the channel ran dry before the next buffer was ready (underruns), and how
+# late each buffer was handed over, after the moment it could have been (jitter).
+class Player():
+    def __init__(self,buffer=PLAYBACK_BUFFER,lookahead=PLAYBACK_LOOKAHEAD):
+        self.buffer = buffer
+        self.lookahead = lookahead
+        self.thread = None
+        self.stopping = threading.Event()
+        self.underruns = 0
+        self.lateness = [] # Seconds each buffer was handed over after it could have been.
+        self.first_sound = None # Seconds from play() to the first buffer being handed over, the last time.
+
+    # This method begins playing the notes, at the given tempo, stopping whatever was playing.
+    def play(self,events,tempo):
+        asked = time.perf_counter()
+        self.stop()
+        frequency, size, channels = init_audio()
+        instrument = harpsichord.Harpsichord(events,tempo,frequency)
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run,args=(instrument,channels,self.stopping,asked),daemon=True)
+        self.thread.start()
+
+    # This method stops playing, if anything is playing.
+    def stop(self):
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+            pygame.mixer.Channel(0).stop()
+
+    # Whether anything is still playing.
+    def busy(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    # This method renders and hands over the buffers, until the piece is done or stopping is set.
+    def run(self,instrument,channels,stopping,asked):
+        channel = pygame.mixer.Channel(0)
+        seconds = self.buffer/instrument.sample_rate # How long each buffer plays for
+        ready = deque() # Buffers rendered, not yet handed over
+        ahead = max(1,math.ceil(self.lookahead/seconds))
+        first = 0 # The first sample not yet rendered
+        free = None # When the channel could next take a buffer
+        while not stopping.is_set():
+            while len(ready) < ahead and first < instrument.length:
+                samples = instrument.samples(first,min(self.buffer,instrument.length-first))
+                ready.append(pygame.mixer.Sound(buffer=harpsichord.pcm(samples,channels)))
+                first += len(samples)
+            now = time.perf_counter()
+            if not ready:
+                if not channel.get_busy():
+                    return
+            elif not channel.get_busy():
+                if free is None:
+                    self.first_sound = now - asked
+                else:
+                    self.underruns += 1
+                channel.play(ready.popleft())
+                free = now
+            elif channel.get_queue() is None:
+                self.lateness.append(max(0,now - free))
+                channel.queue(ready.popleft())
+                free += seconds
+                continue # The next buffer may be rendered at once.
+            # Sleep until the channel should take the next buffer, and then look again every millisecond
+            # until it does; but look at least four times a buffer, as the mixer may take each a little
+            # ahead of time (the sound card's clock need not keep perfect time with this one).
+            stopping.wait(min(seconds/4,max(free - time.perf_counter(),0.001)) if free is not None else 0.001)
+
+    def report(self):
+        if not self.lateness:
+            return f"Player: {self.underruns} underruns."
+        return (f"Player: {self.underruns} underruns, {len(self.lateness)} buffers handed over "
+                f"{1000*sum(self.lateness)/len(self.lateness):.2f} ms late on average, at most {1000*max(self.lateness):.2f} ms; "
+                f"first sound after {1000*(self.first_sound or 0):.1f} ms.")
+
+PLAYER = Player()
+
+# This class - preview cache - keeps the sound of notes as they are heard when placed or changed
+# (see audition()), each rendered on the game's harpsichord, with its agrément, the first time it is
+# wanted.  A sound kept is played at once; one not yet kept is rendered (and the mixer started, the
+# first time) on a thread of the cache's own, so that the game goes on drawing meanwhile, and only
+# the last note asked for is rendered should several be asked for while it works.  Should the mixer
+# not start or a sound not render (as where there is no sound card), notes are heard no more.  The
+# sounds played longest ago are dropped once those kept take more than 'budget' bytes.  It also keeps
+# the time from each click to its note being heard (to the mixer, that is; the mixer takes a buffer's
+# worth more to reach the speakers).
+class PreviewCache():
+    def __init__(self,budget=PREVIEW_BUDGET):
+        self.budget = budget
+        self.lock = threading.Lock() # Held while the sounds, or the note waiting, are looked at or changed
+        self.sounds = OrderedDict() # Each sound, and its size in bytes, by what it sounds like
+        self.size = 0 # Bytes of all the sounds kept
+        self.waiting = None # The note to be rendered next, and when it was clicked
+        self.thread = None # The thread rendering notes, while there are any to render
+        self.failed = None # The error that stopped notes being heard, if one has
+        self.hits = 0
+        self.misses = 0
+        self.latencies = [] # Seconds from each click to its note being played, and whether it was kept
+
+    # What a note sounds like, as given to play(): its agrément, MIDI duration and pitch, the pitches
+    # of the notes around it (which only matter to some agréments), and the tempo.
+    def key(self,agrement,duration,pitch,previous,next,tempo):
+        roles = score.roles(agrement)
+        return (agrement,duration,pitch,previous if 'previous' in roles else None,next if 'next' in roles else None,tempo)
+
+    # This method plays a note, clicked at the perf_counter() 'clicked': at once if its sound is kept,
+    # and otherwise once the cache's thread has rendered it.
+    def play(self,clicked,*note):
+        if self.failed is not None:
+            return
+        key = self.key(*note)
+        with self.lock:
+            kept = self.sounds.get(key)
+            if kept is None:
+                self.waiting = (clicked,note)
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.work,daemon=True)
+                    self.thread.start()
+                return
+            self.hits += 1
+            self.sounds.move_to_end(key)
+        kept[0].play()
+        self.latencies.append((time.perf_counter() - clicked,True))
+
+    # This method renders and plays the notes asked for, until there are none left.
+    def work(self):
+        while True:
+            with self.lock:
+                waiting = self.waiting
+                self.waiting = None
+                if waiting is None or self.failed is not None:
+                    self.thread = None
+                    return
+            clicked, note = waiting
+            try:
+                self.render(*note).play()
+            except Exception as error: # Reported once, rather than lost with the thread.
+                self.failed = error
+                print(f"Notes will not be heard as they are placed: {error}",file=sys.stderr)
+                continue
+            self.latencies.append((time.perf_counter() - clicked,False))
+
+    # This method renders the sound of a note (as play() is given it), and keeps it.
+    def render(self,agrement,duration,pitch,previous,next,tempo):
+        self.misses += 1
+        frequency, size, channels = init_audio()
+        events = score.ornament_events(agrement,duration,pitch,previous,next,PREVIEW_LONGEST*tempo/60)
+        pcm = b''.join(harpsichord.pcm(samples,channels) for samples in harpsichord.render(events,tempo,frequency))
+        sound = pygame.mixer.Sound(buffer=pcm)
+        with self.lock:
+            self.sounds[self.key(agrement,duration,pitch,previous,next,tempo)] = (sound,len(pcm))
+            self.size += len(pcm)
+            while self.size > self.budget and len(self.sounds) > 1:
+                self.size -= self.sounds.popitem(last=False)[1][1]
+        return sound
+
+    # This method waits until every note asked for has been rendered and played.
+    def finish(self):
+        thread = self.thread
+        if thread is not None:
+            thread.join()
+
+    def report(self):
+        if self.failed is not None:
+            return f"Previews: not heard, as {self.failed}."
+        line = f"Previews: {len(self.sounds)} sounds in {self.size/2**20:.1f} MB, {self.hits} hits, {self.misses} misses"
+        warm = [latency for latency, kept in self.latencies if kept]
+        if warm:
+            line += f"; heard {1000*sum(warm)/len(warm):.2f} ms after the click when kept, at most {1000*max(warm):.2f} ms"
+        return line + f" (and a {1000*MIXER_BUFFER/harpsichord.SAMPLE_RATE:.1f} ms mixer buffer)."
+
+PREVIEWS = PreviewCache()
+
+# This function sounds a note as it is played, with its agrément, as when it has just been placed or
+# changed, at the tempo the piece is played at.  The notes around it on its staff give the pitches some
+# agréments borrow (a note without one borrowing its own).  'clicked' is the perf_counter() at the click.
+# It is called once the note has been drawn, so that it is seen before it is heard.
+def audition(note,clicked):
+    before, after = note.staff.notes.neighbours(note)
+    pitch = note.midi_pitch()
+    PREVIEWS.play(clicked,note.agrement,note.midi_duration(),pitch,before.midi_pitch() if before else pitch,
+                  after.midi_pitch() if after else pitch,note.staff.timesig[0]*30)
+
+# This class - autosave - keeps the piece on the disk as it is written, so that nothing is lost should
+# the game be closed, or crash, before it is saved.  Each edit (a note placed, changed or erased, or the
+# time signature or a clef set) is added to a journal beside the piece saved last (see savefile.Journal),
+# which writes it out in the background.  As the game starts, the journal is replayed onto that piece.
+# Once the journal has grown long, and whenever the player saves or the game closes, the piece is saved
+# whole in its place, and the journal saved with it forgotten, so that it is never long to replay.  The
+# piece is written out by a thread of its own, as music is exported (see ExportWorker), while the edits made meanwhile
+# are journaled anew, so that the game never waits on the disk for it.
+class Autosave():
+    def __init__(self,interval=JOURNAL_INTERVAL,longest=JOURNAL_LONGEST):
+        self.interval = interval # Most seconds an edit waits to be written to the disk
+        self.longest = longest # Most bytes of edits journaled before the piece is saved whole
+        self.page = None # The piece kept
+        self.path = None # Where it is saved; the journal is beside it
+        self.journal = None
+        self.thread = None # Saving the piece whole, while it is
+        self.saved = None # The last segment of the journal it was saved with, and the error, if any
+        self.asked = False # Whether the player asked for the save under way (see save()), to be told how it went
+        self.unanswered = None # Whether the last save the player is yet to be told of was saved (see answer())
+        self.error = None # Why the last save failed, if it did
+        self.replayed = 0 # Edits replayed as the game started
+        self.compactions = 0 # Times the piece was saved whole
+        self.compacting = 0.0 # Seconds the game spent taking what was to be saved
+
+    # This method starts keeping a page, replaying onto it the journal kept beside 'path', and returns
+    # how many of the edits replayed placed or changed notes.
+    def start(self,page,path):
+        self.page, self.path = page, path
+        self.journal = savefile.Journal(path + '.journal',self.interval)
+        self.replayed, notes = page.replay(self.journal.read())
+        if self.journal.size() > self.longest:
+            self.compact()
+        return notes
+
+    # This method journals the edit made by the last click on a staff, if it made one (see Staff.edited).
+    def edited(self,staff):
+        note = staff.edited
+        if note is not None:
+            self.journal.add(savefile.NOTE if note in staff.notes else savefile.ERASED,staff.id,0,note.kept())
+            if self.journal.size() > self.longest:
+                self.compact()
+
+    def time(self,timename):
+        self.journal.add(savefile.TIME,0,list(TIME_TUPLE_DICT).index(timename))
+
+    def clef(self,n,clef):
+        self.journal.add(savefile.CLEF,n,list(CLEF_NOTE_DICT).index(clef))
+
+    # This method begins saving the piece whole, unless it is being saved already, and returns whether
+    # it did.  What is to be saved is taken at once (see Page.snapshot()), and the journal cut, so that
+    # the edits made from then on are kept apart from those it is saved with; it is then written out,
+    # and synced, by the thread.
+    def compact(self):
+        self.finish()
+        if self.thread is not None:
+            return False
+        start = time.perf_counter()
+        snapshot = self.page.snapshot()
+        last = self.journal.cut()
+        self.compacting += time.perf_counter() - start
+        self.thread = threading.Thread(target=self.work,args=(snapshot,last),daemon=True)
+        self.thread.start()
+        return True
+
+    def work(self,snapshot,last):
+        try:
+            self.journal.write() # So that the segments it is saved with are written out and closed
+            savefile.write(self.path + '.tmp',*snapshot)
+            self.saved = last, None
+        except OSError as error:
+            self.saved = last, error
+
+    # This method, once the piece has been saved whole, puts it in place of the one saved before and
+    # forgets the journal it was saved with (or, if it could not be saved, keeps the journal), and
+    # returns whether it did; with 'wait', it waits for the piece to be saved.  It is called as the
+    # game goes round its loop.
+    def finish(self,wait=False):
+        if self.thread is None or (self.thread.is_alive() and not wait):
+            return False
+        self.thread.join()
+        self.thread = None
+        last, error = self.saved
+        if error is None:
+            try:
+                self.page.reopen(self.path + '.tmp',self.path)
+            except (OSError,ValueError) as reopening:
+                error = reopening
+        asked, self.asked, self.error = self.asked, False, error
+        if error is not None: # The journal still holds the edits.
+            print(f"The piece could not be saved: {error}",file=sys.stderr)
+            self.unanswered = False
+            return False
+        self.journal.forget(last)
+        self.compactions += 1
+        if asked:
+            self.unanswered = True
+        return True
+
+    # This method saves the piece whole as the player asks (with Ctrl+S): once any save under way is
+    # done, it begins another, so that every edit made so far is in it, and the player is told how it
+    # went once it is done (see answer()).
+    def save(self):
+        self.finish(wait=True)
+        self.compact()
+        self.asked = True
+
+    # This method returns, once a save is done that the player is to be told of, whether the piece was
+    # saved, and None until then.  Every save that fails is told of, asked for or not.
+    def answer(self):
+        answer, self.unanswered = self.unanswered, None
+        return answer
+
+    # As the game closes, the piece is saved whole if anything has been journaled since it last was.
+    def close(self):
+        if self.journal is not None:
+            self.finish(wait=True)
+            if self.journal.size():
+                self.compact()
+                self.finish(wait=True)
+            self.journal.close()
+
+    def report(self):
+        if self.journal is None:
+            return "Autosave: not started."
+        return (f"Autosave: {self.journal.records} edits journaled in {self.journal.syncs} syncs, {self.replayed} replayed; "
+                f"saved whole {self.compactions} times, the game taking {1000*self.compacting:.0f} ms to begin it.")
+
+AUTOSAVE = Autosave()
+
+# This function returns the perf_counter() at which this process started, or None if that can't be
+# known.  On Linux, /proc gives the process's start in clock ticks (usually hundredths of a second)
+# after boot, which is compared with the time since boot.
+def process_start():
+    try:
+        with open('/proc/self/stat') as statfile:
+            fields = statfile.read().rsplit(')',1)[1].split() # The name, in parentheses, may hold spaces.
+        with open('/proc/uptime') as uptimefile:
+            uptime = float(uptimefile.read().split()[0])
+        now = time.perf_counter()
+        return now - (uptime - int(fields[19])/os.sysconf('SC_CLK_TCK'))
+    except (OSError,ValueError,IndexError,AttributeError):
+        return None
+
+# This function describes how long each phase of starting up took, from the process's start (or, if
+# that is unknown, the first line of this file) to the first frame presented.
+def startup_profile(first_frame):
+    started = process_start()
+    phases = STARTUP_PHASES[:] + [('first frame',first_frame)]
+    if started is None:
+        started = phases.pop(0)[1]
+        lines = ["Startup, from the game's first line (the process's start is unknown here):"]
+    else:
+        lines = ["Startup, from the process's start:"]
+    previous = started
+    for name, end in phases:
+        if end is None:
+            break
+        lines.append(f"  {name:<22}{1000*(end-previous):8.1f} ms")
+        previous = end
+    lines.append(f"  {'total':<22}{1000*(previous-started):8.1f} ms")
+    return '\n'.join(lines)
 
 # The 'main' function, the part of the program that runs.
-def main():
-    # Initialize display window
+# The scheduler paces its loops; one is made if it is not given.
+def main(scheduler=None,score_path=SCORE_FILE):
+    start_pygame()
+    if scheduler is None:
+        scheduler = Scheduler()
+    # Initialize display window, and find the asset bundle if there is one
     screen = pygame.display.set_mode(pygame.Rect((0,0,WINDOW_DIM[0],WINDOW_DIM[1])).size)
+    startup_phase('window')
+    ASSETS.read_bundle()
+    startup_phase('asset bundle')
     screen.fill(WINDOW_BACKGROUND)
     pygame.display.set_caption("Elisabeth and the Music Maker")
 
@@ -606,50 +2438,83 @@ def main():
     screen.blit(playbutton.image,playbutton.rect)
     buttons.draw(screen)
 
-    # Draw Elisabeth
-    screen.blit(lispic,(CHAT_RECT.left,0))
+    # Draw Elisabeth, with the chat box beneath her
+    portrait = portrait_size()
+    CHAT_RECT.top = portrait[1]
+    CHAT_RECT.height = BUTTON_RECT.top - portrait[1]
+    screen.blit(ASSETS.picture(PORTRAIT,(portrait,)),(CHAT_RECT.left,0))
+    startup_phase('buttons and portrait')
     # The parle() method places text (a long string in the 'mots' argument) under the portrait.
     def parle(screen,mots):
         pygame.draw.rect(screen,PAPER_COLOR,CHAT_RECT)
-        bliterate(screen,mots,CHAT_RECT.left,LIS_HEIGHT,CHAT_WIDTH,outerbuffer=10,buffer=5)
-        pygame.display.update()
+        bliterate(screen,mots,CHAT_RECT.left,CHAT_RECT.top,CHAT_WIDTH,outerbuffer=10,buffer=5)
+        scheduler.damage(CHAT_RECT)
     # The wait_press() waits for the player to click on something or press a key;
     # if the player clicks on the 'x' button; it returns -1.  The syntax:
     # if wait_press() == -1:
     #   return
     # will allow the game to proceed as one expects, with the 'x' button working
-    # and the game waiting for the player's move.
+    # and the game waiting for the player's move.  The scheduler sleeps while it waits.
     def wait_press():
         while True:
-            for e in pygame.event.get():
+            scheduler.present()
+            for e in scheduler.next_events():
                 if e.type == pygame.QUIT:
                     return -1
                 elif e.type == pygame.KEYDOWN or e.type == pygame.MOUSEBUTTONDOWN:
                     return 0
     
-    # Draw staff paper
+    # Draw staff paper, with the piece saved last, if there is one
     pygame.draw.rect(screen,PAPER_COLOR,PAPER_RECT)
-    staves = []
-    for s in range(SYSTEMS*STAVES_PER):
-        staves.append(Staff(screen,(int(STAFF_HEIGHT/2),int((6*s+0.5)*STAFF_HEIGHT/2)),s))
-    for eachstaff in range(len(staves)):
-        if eachstaff % STAVES_PER != 0:
-            staves[eachstaff].change_clef("bass")
-        staves[eachstaff].generate_image()
-    #staves.draw(screen)
+    opened = False
+    if os.path.exists(score_path):
+        try:
+            page = open_page(screen,score_path)
+            opened = True
+        except (OSError,ValueError) as error:
+            print(f"The piece could not be opened: {error}",file=sys.stderr)
+    if not opened:
+        page = Page(screen,['cclef']+['bass']*(STAVES_PER-1))
+    if AUTOSAVE.start(page,score_path): # Anything done since it was saved is recovered; the piece
+        opened = True                   # has been begun only if a note was placed.
+    for eachstaff in page.shown:
+        eachstaff.generate_image()
     
-    pygame.display.update()
+    scheduler.damage()
 
     selected_function = 'select'
 
     # The redraw_staff_paper() blanks the staff area and redraws every staff and note.
     # Useful for when some part of a note is not erased because it strayed outside its staff.
-    def redraw_staff_paper():
-        pygame.draw.rect(screen,PAPER_COLOR,(int(STAFF_HEIGHT/2),int(STAFF_HEIGHT/2),PAGEDIM[0],PAGEDIM[1]))
-        for eachstaff in staves:
-            eachstaff.generate_image()
-    
-    # This code takes the notes on-screen and makes a MIDI piece of them.
+    # Given an area, it blanks and redraws only that area, drawing the changed notes in 'dirty'
+    # afresh; the area and wherever those notes now reach are all that is presented.  Should those
+    # notes' ink stray beyond the area, the area is widened to hold it and drawn again, so that
+    # a staff drawn after theirs covers the strays as it would in a full redraw.
+    def redraw_staff_paper(area=None,dirty=()):
+        if area is None:
+            pygame.draw.rect(screen,PAPER_COLOR,(int(STAFF_HEIGHT/2),int(STAFF_HEIGHT/2),PAGEDIM[0],PAGEDIM[1]))
+            for eachstaff in page.shown:
+                eachstaff.generate_image()
+            scheduler.damage(PAPER_RECT)
+            return
+        area = area.clip(PAPER_RECT)
+        while True:
+            pygame.draw.rect(screen,PAPER_COLOR,area)
+            for eachstaff in page.shown:
+                if eachstaff.inked.colliderect(area) or any(eachnote.staff is eachstaff for eachnote in dirty):
+                    eachstaff.generate_image(area,dirty)
+            reach = area.unionall([eachnote.inked for eachnote in dirty]).clip(PAPER_RECT)
+            if area.contains(reach):
+                break
+            area = reach
+        scheduler.damage(area.unionall([eachnote.inked for eachnote in dirty]))
+
+    # The scroll() function brings the systems from 'top' down into view, and draws them.
+    def scroll(top):
+        if page.scroll_to(top):
+            redraw_staff_paper()
+
+    # This code takes the notes on-screen and makes a MIDI piece of them, by way of their score (see score.py).
     # It also gauges whether the player uses agréments, and returns that Boolean.
     ################################################################################
     ## In producing the game's MIDI output, it was necessary to make assumptions
@@ -684,142 +2549,10 @@ def main():
     ## interpretation of how the piece should sound is preserved to the best of one's 
     ## ability with the information that is known about her work.
     ###################################################################################
+    exporter = ExportWorker()
     def output_music():
-        agrements = False
-        BEATS_PER_STAFF = staves[0].timesig[0]*MEASURES_PER
-        outputMIDI = MIDIFile(1) # A one-track MIDI file
-        outputMIDI.addTempo(0,0,staves[0].timesig[0]*30) # The arguments here are track, time in beats when track begins, and tempo.
-        outputMIDI.addProgramChange(0,0,0,6) # Changes instrument to harpsichord (first three args are track, channel, time)
-        # Note that a harpsichord is 7 is standard MIDI's 1-origin list, but 6 in the library's 0-origin list.
-        # These allow for agrements on multiple notes.
-        previousnote = ''
-        previoushaddouble = False
-        for eachstaff in staves:
-            for eachnote in eachstaff.notes:
-                ###############################################################################
-                ## The way the game interprets agréments is determined from numerous sources.
-                ## Most pertinent to Jacquet's own work are the pincé, tremblement (long trill),
-                ## doublé, and port de voix, which are described in Burkholder's annotation to her work.
-                ## The pincé on a note indicates that the performer
-                ## plays it, the note below, and it again, in the span of the note, while
-                ## the tremblement, or long trill, trills between the indicated pitch and the one above for
-                ## length of the note.  This is fairly consistent with other sources' indications
-                ## for this, though Broude suggests that the trill occurs before the note on which it
-                ## applies, and not during.  It should also be noted that the number of trills - or
-                ## repercussions, as Hashimoto's sources translate them - varies, with a case being
-                ## made even for slowing in tempo during trills in vocal music.  However, d'Anglebert
-                ## and Couperin, in harpsichord music, seem content to indicate that precisely
-                ## four be played.  As for the doublé, its function seems to vary,
-                ## but is generally assumed to occur in a note adjacent to two others and involve
-                ## playing it and the others around it twice in a fashion similar to the shape
-                ## of the symbol.  In this game, it is interpreted quite strictly as the next
-                ## note, followed by the preceding, followed by the indicated, then the next, then
-                ## the preceding, each in a quarter of the time of the original indicated note.
-                ## Interpretation of the port de voix (+) is more difficult.
-                ## 
-                ## Reeves writes that the + symbol could indicate virtually any ornament (as it
-                ## seems to throughout editions of Rameau), and Hashimoto assigns various meanings
-                ## to it.  Burkholder, however, demonstrates it as playing the previous note and the
-                ## indicated in the span of the indicates, and d'Anglebert confirms this with
-                ## examples of ascendant and descedant.  D'Anglebert's table also provides a few
-                ## more easily implement agrements to the game, such as the tremblement appuye
-                ## (a special trill on dotted notes), the cadence (a trill which dips down an extra
-                ## step at one point), and the mordent, a preceding trill more like Broude's
-                ## depiction of the pince.
-                ##
-                ## It should also be noted that, according to Kroll, composers such as Couperin
-                ## would put multiple ornaments on the same note.  Kroll is mystified as to how
-                ## one such combination was intended to be played, the doublé with the tremblement,
-                ## which appear in both orders in Couperin's work.  Kroll concludes that it is
-                ## to begin with a doublé that finishes tremblement, which Panov and Rosanov
-                ## state has long been known to the Baroque performance tradition.
-                ##
-                ## Remarkably, nearly every table of agrements demonstrates them on the note C,
-                ## with every pincé thus involving C and B, and leaving it ambiguous whether
-                ## trills in general are intended to span a semitone or a step in whatever
-                ## scale is in use.  Hashimoto writes that "the question of whether the interval
-                ## between the main note and the lower auxiliary should be a semitone or a whole
-                ## tone ... a great majority of composers left it to the performer's taste and
-                ## judgment."  It may vary by key or by the character of the music.  For simplicity,
-                ## this program elects to play trills always diatonically.  Also for simplicity,
-                ## it does not permit multiple ornaments on the same note, which does not occur
-                ## in Jacquet's first suite anyway.
-                ###############################################################################
-                if previoushaddouble and previousnote != '':
-                    outputMIDI.addNote(0,0,eachnote.midi_pitch(),BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(previousnote[1]),previousnote[1].midi_duration()/4,100)
-                    outputMIDI.addNote(0,0,previousnote[1].midi_pitch(),BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(previousnote[1])+previousnote[1].midi_duration()/4,previousnote[1].midi_duration()/4,100)
-                    outputMIDI.addNote(0,0,previousnote[0].midi_pitch(),BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(previousnote[1])+previousnote[1].midi_duration()/2,previousnote[1].midi_duration()/4,100)
-                    outputMIDI.addNote(0,0,previousnote[1].midi_pitch(),BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(previousnote[1])+3*previousnote[1].midi_duration()/4,previousnote[1].midi_duration()/4,100)
-                    previoushaddouble = False
-                # No agrement - normal note!
-                if eachnote.agrement == '': # The arguments are track, channel (as in both, left, or right), pitch, time, duration, and volume
-                    outputMIDI.addNote(0,0,eachnote.midi_pitch(),BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote),eachnote.midi_duration(),100)
-                else:
-                    agrements = True # Add code for agréments here!
-                    if eachnote.agrement == 'pince':
-                        outputMIDI.addNote(0,0,eachnote.midi_pitch(),BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote),eachnote.midi_duration()/4,100)
-                        if eachnote.midi_pitch() % 12 in [2,4,7,9,11]:
-                            outputMIDI.addNote(0,0,eachnote.midi_pitch()-2,BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote)+eachnote.midi_duration()/4,eachnote.midi_duration()/4,100)
-                        else:
-                            outputMIDI.addNote(0,0,eachnote.midi_pitch()-1,BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote)+eachnote.midi_duration()/4,eachnote.midi_duration()/4,100)
-                        outputMIDI.addNote(0,0,eachnote.midi_pitch(),BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote)+eachnote.midi_duration()/2,eachnote.midi_duration()/2,100)
-                    elif eachnote.agrement == 'tremblement':
-                        d = eachnote.midi_duration()/8
-                        p = eachnote.midi_pitch()
-                        if p % 12 in [0,2,5,7,9]:
-                            m = p + 2
-                        else:
-                            m = p + 1
-                        for i in range(4):
-                            outputMIDI.addNote(0,0,m,BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote)+2*i*d,d,100)
-                            outputMIDI.addNote(0,0,p,BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote)+2*i*d+d,d,100)
-                    elif eachnote.agrement == 'appuye':
-                        d = eachnote.midi_duration()/12
-                        p = eachnote.midi_pitch()
-                        if p % 12 in [0,2,5,7,9]:
-                            m = p + 2
-                        else:
-                            m = p + 1
-                        outputMIDI.addNote(0,0,m,BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote),d*3,100)
-                        outputMIDI.addNote(0,0,p,BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote)+d*3,d,100)
-                        for i in range(2,6):
-                            outputMIDI.addNote(0,0,m,BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote)+2*i*d,d,100)
-                            outputMIDI.addNote(0,0,p,BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote)+2*i*d+d,d,100)
-                    elif eachnote.agrement == 'portdevoix':
-                        outputMIDI.addNote(0,0,previousnote.midi_pitch(),BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote),eachnote.midi_duration()/2,100)
-                        outputMIDI.addNote(0,0,eachnote.midi_pitch(),BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote)+eachnote.midi_duration()/2,eachnote.midi_duration()/2,100)
-                    elif eachnote.agrement == 'mordent':
-                        outputMIDI.addNote(0,0,eachnote.midi_pitch(),BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote)-1/16,1/32,100)
-                        outputMIDI.addNote(0,0,eachnote.midi_pitch()-1,BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote)-1/32,1/32,100)
-                        outputMIDI.addNote(0,0,eachnote.midi_pitch(),BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote),eachnote.midi_duration(),100)
-                    elif eachnote.agrement == 'cadence':
-                        d = eachnote.midi_duration()/12
-                        p = eachnote.midi_pitch()
-                        if p % 12 in [0,2,5,7,9]:
-                            m = p + 2
-                        else:
-                            m = p + 1
-                        if p % 12 in [2,4,7,9,11]:
-                            b = p - 2
-                        else:
-                            b = p - 1
-                        outputMIDI.addNote(0,0,m,BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote),d,100)
-                        outputMIDI.addNote(0,0,b,BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote)+2*d,d,100)
-                        for i in range(6):
-                            outputMIDI.addNote(0,0,p,BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote)+2*i*d+d,d,100)
-                        for i in range(2,6):
-                            outputMIDI.addNote(0,0,m,BEATS_PER_STAFF*(eachstaff.id//STAVES_PER)+eachstaff.time_a_note(eachnote)+2*i*d,d,100)
-                if eachnote.agrement == 'double':
-                    previoushaddouble = True
-                    previousnote = [previousnote,eachnote]
-                else:
-                    previousnote = eachnote
-        filename = f"Harpischord in {previousnote.pitch[0].upper()}, No. {int(random.random()*100)}.mid"
-        with open(filename,"wb") as output_file:
-            outputMIDI.writeFile(output_file)
-        os.startfile(filename)
-        return agrements
-    
+        exporter.start(Export(page.written()))
+
     # The real game begins here!
     #########################################################################################
     ## Three things were considered in writing the dialogue for the character of Elisabeth
@@ -839,67 +2572,83 @@ def main():
     parle(screen,speech) # Put her words up and wait for a keypress or mouse click.
     if wait_press() == -1:
         return
-    speech = '''Incroyable!  First, let us commence with the time signature.
-    Do you see the 'C' for 'common time'?  Click through the choices.
-    Find a rhythm that suits you and choose what you must.'''
-    parle(screen,speech)
-    timebutton.selectable = True # Let player click on the time signature button to scroll
-    while timebutton.selectable: # through the time signatures available, then apply it
-        for e in pygame.event.get(): # the moment staff paper is clicked.
-            if e.type == pygame.QUIT:
-                return
-            elif e.type == pygame.KEYDOWN and e.key == pygame.K_ESCAPE:
-                return
-            elif e.type == pygame.MOUSEBUTTONDOWN and e.button == 1:
-                if timebutton.rect.collidepoint(e.pos):
-                    timebutton.feel_click()
-                    screen.blit(timebutton.image,timebutton.rect)
-                    pygame.display.update()
-                elif PAPER_RECT.collidepoint(e.pos):
-                    for s in range(SYSTEMS*STAVES_PER):
-                        staves[s].change_time(timebutton.statuslist[timebutton.status])
-                    #####################################################################
-                    ## She makes comments to the player about the choice of time signature, mentioning
-                    ## the things she has done in that time (in her Suite in A Minor) and assuming
-                    ## player has done the same.  She also takes time to point out the use of the
-                    ## baritone clef and explain the C-clef, which does not resemble a C.
-                    ####################################################################
-                    if timebutton.statuslist[timebutton.status] == 'common':
-                        speech = 'Ah, common time.  Very common dans l\'Allemagne.  Perhaps you are writing an allemande?'
-                    elif timebutton.statuslist[timebutton.status] == 'three':
-                        speech = 'Triple meter, magnifique!  So many possiblilities - la sarabande, la chaconne, le menuet...'
-                    elif timebutton.statuslist[timebutton.status] == 'cut':
-                        speech = 'Cut time - writing a gavotte, perhaps?'
-                    elif timebutton.statuslist[timebutton.status] == 'three-two':
-                        speech = 'Ah, the courante, such a popular dance in my day.'
-                    elif timebutton.statuslist[timebutton.status] == 'six-four':
-                        speech = 'Writing a lively jigue, I see!'
-                    timebutton.grey() # After time signature is chosen, player cannot change it.
-                    screen.blit(timebutton.image,timebutton.rect) # What would that do to all the notes?
-                    timebutton.selectable = False
-    speech += '''\n\nChange or add a clef in your piece with this tool here.
-    I always use the baritone clef, but will leave you your choice of the treble
-    or the C-clef, which places middle C on the bottom line of the upper staff.
-    '''
-    parle(screen,speech) # Same process with choosing a C-clef or a G-clef for the upper register.
-    clefbutton.selectable = True
-    while clefbutton.selectable:
-        for e in pygame.event.get():
-            if e.type == pygame.QUIT:
-                return
-            elif e.type == pygame.KEYDOWN and e.key == pygame.K_ESCAPE:
-                return
-            elif e.type == pygame.MOUSEBUTTONDOWN and e.button == 1:
-                if clefbutton.rect.collidepoint(e.pos):
-                    clefbutton.feel_click()
-                    screen.blit(clefbutton.image,clefbutton.rect)
-                    pygame.display.update()
-                elif PAPER_RECT.collidepoint(e.pos):
-                    for s in range(SYSTEMS):
-                        staves[2*s].change_clef(clefbutton.statuslist[clefbutton.status])
-                    clefbutton.grey()
-                    screen.blit(clefbutton.image,clefbutton.rect)
-                    clefbutton.selectable = False
+    # A piece opened from a file already has its time signature and clefs, which are shown on their
+    # buttons; otherwise the player chooses them.
+    if opened:
+        for eachbutton, chosen in ((timebutton,page.timename),(clefbutton,page.clefs[0])):
+            if chosen in eachbutton.statuslist:
+                eachbutton.status = eachbutton.statuslist.index(chosen)
+            eachbutton.grey()
+            screen.blit(eachbutton.image,eachbutton.rect)
+            scheduler.damage(eachbutton.rect)
+    else:
+        speech = '''Incroyable!  First, let us commence with the time signature.
+        Do you see the 'C' for 'common time'?  Click through the choices.
+        Find a rhythm that suits you and choose what you must.'''
+        parle(screen,speech)
+        timebutton.selectable = True # Let player click on the time signature button to scroll
+        while timebutton.selectable: # through the time signatures available, then apply it
+            scheduler.present()        # the moment staff paper is clicked.
+            for e in scheduler.next_events():
+                if e.type == pygame.QUIT:
+                    return
+                elif e.type == pygame.KEYDOWN and e.key == pygame.K_ESCAPE:
+                    return
+                elif e.type == pygame.MOUSEBUTTONDOWN and e.button == 1:
+                    if timebutton.rect.collidepoint(e.pos):
+                        timebutton.feel_click()
+                        screen.blit(timebutton.image,timebutton.rect)
+                        scheduler.damage(timebutton.rect)
+                    elif PAPER_RECT.collidepoint(e.pos):
+                        page.change_time(timebutton.statuslist[timebutton.status])
+                        AUTOSAVE.time(page.timename)
+                        scheduler.damage(PAPER_RECT)
+                        #####################################################################
+                        ## She makes comments to the player about the choice of time signature, mentioning
+                        ## the things she has done in that time (in her Suite in A Minor) and assuming
+                        ## player has done the same.  She also takes time to point out the use of the
+                        ## baritone clef and explain the C-clef, which does not resemble a C.
+                        ####################################################################
+                        if timebutton.statuslist[timebutton.status] == 'common':
+                            speech = 'Ah, common time.  Very common dans l\'Allemagne.  Perhaps you are writing an allemande?'
+                        elif timebutton.statuslist[timebutton.status] == 'three':
+                            speech = 'Triple meter, magnifique!  So many possiblilities - la sarabande, la chaconne, le menuet...'
+                        elif timebutton.statuslist[timebutton.status] == 'cut':
+                            speech = 'Cut time - writing a gavotte, perhaps?'
+                        elif timebutton.statuslist[timebutton.status] == 'three-two':
+                            speech = 'Ah, the courante, such a popular dance in my day.'
+                        elif timebutton.statuslist[timebutton.status] == 'six-four':
+                            speech = 'Writing a lively jigue, I see!'
+                        timebutton.grey() # After time signature is chosen, player cannot change it.
+                        screen.blit(timebutton.image,timebutton.rect) # What would that do to all the notes?
+                        scheduler.damage(timebutton.rect)
+                        timebutton.selectable = False
+        speech += '''\n\nChange or add a clef in your piece with this tool here.
+        I always use the baritone clef, but will leave you your choice of the treble
+        or the C-clef, which places middle C on the bottom line of the upper staff.
+        '''
+        parle(screen,speech) # Same process with choosing a C-clef or a G-clef for the upper register.
+        clefbutton.selectable = True
+        while clefbutton.selectable:
+            scheduler.present()
+            for e in scheduler.next_events():
+                if e.type == pygame.QUIT:
+                    return
+                elif e.type == pygame.KEYDOWN and e.key == pygame.K_ESCAPE:
+                    return
+                elif e.type == pygame.MOUSEBUTTONDOWN and e.button == 1:
+                    if clefbutton.rect.collidepoint(e.pos):
+                        clefbutton.feel_click()
+                        screen.blit(clefbutton.image,clefbutton.rect)
+                        scheduler.damage(clefbutton.rect)
+                    elif PAPER_RECT.collidepoint(e.pos):
+                        page.change_clef(0,clefbutton.statuslist[clefbutton.status])
+                        AUTOSAVE.clef(0,page.clefs[0])
+                        clefbutton.grey()
+                        screen.blit(clefbutton.image,clefbutton.rect)
+                        scheduler.damage(PAPER_RECT)
+                        scheduler.damage(clefbutton.rect)
+                        clefbutton.selectable = False
     speech = '''Excellente!  To place a note, find whichever note on the bottom left of the parchment tickles your fancy.
     Then, let the artiste in you choose where in the piece to place it.
     \n\n
@@ -926,11 +2675,43 @@ def main():
     # 'explain' means player has just clicked on Elisabeth and whatever is clicked on next gives explanation, not function
     # anything else (the function of the most recently clicked button) is passed to staves/notes clicked on.
     while True:
-        for e in pygame.event.get():
+        scheduler.present()
+        AUTOSAVE.finish() # The piece is put in place once it has been saved whole.
+        saved = AUTOSAVE.answer()
+        if saved:
+            parle(screen,'''Your parchment is rolled up and put away safely.  It will be here, just as you left it, when you return.''')
+        elif saved is not None:
+            parle(screen,f'''Hélas!  Your parchment could not be put away ({AUTOSAVE.error}).  See to it, and press
+            Ctrl+S to try again before you leave.''')
+        for e in scheduler.next_events():
             if e.type == pygame.QUIT:
                 return
             if e.type == pygame.KEYDOWN and e.key == pygame.K_ESCAPE:
                 return
+            # The wheel, arrow keys, and page keys scroll through the systems; Home goes back to the
+            # first, and End on to the last with any notes on it.
+            if e.type == pygame.MOUSEWHEEL:
+                scroll(page.top - e.y)
+            if e.type == pygame.KEYDOWN:
+                if e.key in SCROLL_KEYS:
+                    scroll(page.top + SCROLL_KEYS[e.key])
+                elif e.key == pygame.K_HOME:
+                    scroll(0)
+                elif e.key == pygame.K_END:
+                    scroll(page.last_written())
+            # Ctrl+S saves the piece whole (though every edit is kept as it is made; see Autosave).
+            # Elisabeth answers once it is saved (see above).
+            if e.type == pygame.KEYDOWN and e.key == pygame.K_s and e.mod & pygame.KMOD_CTRL:
+                AUTOSAVE.save()
+            if e.type == EXPORT_DONE:
+                if e.export.error is not None:
+                    print(f"The music could not be played: {e.export.error}",file=sys.stderr)
+                if e.export.music.agrements():
+                    speech = '''Magnifique! I had my doubts, however, you have made a Baroque piece to rival even my talents (not really).'''
+                else:
+                    speech = '''How dreadfully plain… so rigid and boring. What is a piece without embellishment?
+                    Spice it up with some agréments, no?'''
+                parle(screen,speech)
             if e.type == pygame.MOUSEBUTTONDOWN and e.button == 1:
                 if BUTTON_RECT.collidepoint(e.pos):
                     if selected_function == 'explain':
@@ -949,24 +2730,22 @@ def main():
                             else:
                                 eachbutton.unselect()
                         buttons.draw(screen)
+                        scheduler.damage(BUTTON_RECT)
                         if playbutton.rect.collidepoint(e.pos):
-                            if output_music():
-                                speech = '''Magnifique! I had my doubts, however, you have made a Baroque piece to rival even my talents (not really).'''
-                            else:
-                                speech = '''How dreadfully plain… so rigid and boring. What is a piece without embellishment?
-                                Spice it up with some agréments, no?'''
-                            parle(screen,speech)
+                            output_music() # Elisabeth answers once the music is exported (see below).
                 elif PAPER_RECT.collidepoint(e.pos):
                     new_agrement = False
                     if selected_function in AGREMENT_DONE_DICT and AGREMENT_DONE_DICT[selected_function] == False:
                         new_agrement = True
-                    for eachstaff in staves:
-                        if eachstaff.rect.collidepoint(e.pos):
-                            eachstaff.feel_click(e.pos,selected_function)
-                            if selected_function in ["eraser","inverse"]:
-                                redraw_staff_paper()
-                            elif selected_function in ["eighth","sixteenth"]:
-                                eachstaff.generate_image()
+                    eachstaff = page.staff_at(e.pos)
+                    if eachstaff is not None:
+                        clicked = time.perf_counter()
+                        change = eachstaff.feel_click(e.pos,selected_function)
+                        AUTOSAVE.edited(eachstaff)
+                        if change:
+                            redraw_staff_paper(*change)
+                        if eachstaff.sounded is not None:
+                            audition(eachstaff.sounded,clicked)
                     if new_agrement and AGREMENT_DONE_DICT[selected_function]:
                         if selected_function == 'pince':
                             speech = "Pincé ... just a quaint little trill, is it not? Perfect for a penultimate note."
@@ -1002,10 +2781,52 @@ def main():
                         parle(screen,speech)
                         selected_function = 'explain'
 
-            pygame.display.update()
-
 if __name__ == '__main__':
-    main()
+    multiprocessing.freeze_support() # (So that, built into one program, it can start the export's workers; see score.pool_map().)
+    parser = argparse.ArgumentParser(description="Elisabeth and the Music Maker")
+    parser.add_argument('--fps',type=int,default=FRAME_RATE,help="most frames drawn per second (0 for no cap)")
+    parser.add_argument('--frame-stats',action='store_true',help="report busy and idle time on exit")
+    parser.add_argument('--startup-profile',action='store_true',help="report how long each phase of starting up took, on exit")
+    parser.add_argument('--tracks',choices=['one','staff','system'],default=EXPORT_TRACKS,help="export all the music on one track of the MIDI file, or each staff or system on its own")
+    parser.add_argument('--export-workers',type=int,default=EXPORT_WORKERS,help="how many processes export a large piece at once (more than one only pays where there are cores to spare)")
+    parser.add_argument('--audio-buffer',type=int,default=PLAYBACK_BUFFER,help="samples in each buffer the music is played in")
+    parser.add_argument('--score',default=SCORE_FILE,help="the file the piece is saved to with Ctrl+S, and opened from at startup if it is there")
+    parser.add_argument('--bundle-assets',action='store_true',help="write the pictures, already scaled, to a bundle read at startup, and exit")
+    parser.add_argument('--render-wav',metavar='WAV',help="write the piece saved in --score to a WAV file, played on the game's harpsichord, and exit")
+    args = parser.parse_args()
+    EXPORT_TRACKS = args.tracks
+    EXPORT_WORKERS = args.export_workers
+    PLAYER.buffer = args.audio_buffer
+    startup_phase('game code')
+    if args.bundle_assets:
+        start_pygame()
+        ASSETS.save_bundle(bundled_pictures())
+        print(f"Wrote {ASSETS.bundle_path}.")
+        sys.exit()
+    if args.render_wav:
+        start_pygame()
+        try:
+            render_wav(args.score,args.render_wav)
+        except (OSError,ValueError) as error:
+            print(f"The piece could not be rendered: {error}",file=sys.stderr)
+            sys.exit(1)
+        print(f"Wrote {args.render_wav}.")
+        sys.exit()
+    scheduler = Scheduler(args.fps)
+    main(scheduler,args.score)
+    AUTOSAVE.close()
+    if args.startup_profile:
+        print(startup_profile(scheduler.first_frame))
+    if args.frame_stats:
+        print(scheduler.report())
+        print(GLYPHS.report())
+        print(BACKGROUNDS.report())
+        print(COMPILED.report())
+        print(EXPORTS.report())
+        print(PLAYER.report())
+        print(PREVIEWS.report())
+        print(AUTOSAVE.report())
+        print(ASSETS.report())
 
 ##########################
 ## Bibliography
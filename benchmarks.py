@@ -0,0 +1,1099 @@
+# Benchmarks for Elisabeth and the Music Maker.
+#
+# These time the parts of the game that matter when a piece grows large, without opening
+# a real window (SDL's dummy video driver is used).  Run all of them with
+#   python benchmarks.py
+# or only some of them by name, e.g.
+#   python benchmarks.py staff_background
+from os import environ
+environ.setdefault('SDL_VIDEODRIVER','dummy')
+environ.setdefault('SDL_AUDIODRIVER','dummy')
+import os
+import gc
+import sys
+import time
+import importlib.util
+import subprocess
+import tempfile
+import shutil
+
+MAIN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),'Elisabeth and the Music Maker.py')
+
+# The game lives in a file whose name has spaces in it, so it is loaded by path rather than imported.
+# Its assets are found relative to the working directory, so that is changed to the game's folder.
+def load_game():
+    os.chdir(os.path.dirname(MAIN_FILE))
+    spec = importlib.util.spec_from_file_location('music_maker',MAIN_FILE)
+    game = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(game)
+    game.start_pygame() # As main() would, before anything is drawn
+    return game
+
+# Calls func() repeat times and returns the mean time per call in milliseconds.
+def per_call(func,repeat):
+    start = time.perf_counter()
+    for r in range(repeat):
+        func()
+    return 1000*(time.perf_counter()-start)/repeat
+
+# Makes a window (in memory only) and a staff on it, as main() does.
+def make_staff(game,id=0):
+    import pygame
+    screen = pygame.display.get_surface()
+    if screen is None:
+        screen = pygame.display.set_mode(game.WINDOW_DIM)
+        screen.fill(game.PAPER_COLOR)
+    return game.Staff(screen,(int(game.STAFF_HEIGHT/2),int((6*id+0.5)*game.STAFF_HEIGHT/2)),id)
+
+# Fills a staff with sixteenth notes, in chords of 'voices' notes on every sixteenth of every measure,
+# alternating stems up and down so that every beat has two beams.
+def fill_sixteenths(game,staff,voices=2):
+    slots = int(16*staff.timesig[0]/staff.timesig[1])
+    for measure in range(1,game.MEASURES_PER+1):
+        for slot in range(slots):
+            for voice in range(voices):
+                pitch = 'cdefgab'[(slot+3*voice) % 7] + str(4 + voice % 2)
+                note = game.Note(staff,(measure,slot/4+1),0.0625,pitch,orientation=(voice % 2 == 0))
+                note.set_position()
+                staff.add_note(note)
+
+# Staff.generate_image() with and without the cached background layer, on a staff dense with sixteenths.
+# "Rebuilt" repaints the lines, barlines, clef and time signature (rescaling the latter two) every time,
+# as every redraw used to.
+def bench_staff_background(game):
+    staff = make_staff(game)
+    fill_sixteenths(game,staff)
+    staff.generate_image()
+    def rebuilt():
+        staff.background = game.staff_background(staff.clef,staff.timename)
+        staff.generate_image()
+    repeat = 200
+    before = per_call(rebuilt,repeat)
+    after = per_call(staff.generate_image,repeat)
+    area = staff.notes[len(staff.notes)//2].inked
+    partial = per_call(lambda: staff.generate_image(area,()),repeat)
+    print(f"staff_background: {len(staff.notes)} sixteenths on one staff")
+    print(f"  background rebuilt each redraw: {before:8.3f} ms per redraw")
+    print(f"  cached background:              {after:8.3f} ms per redraw ({before/after:.2f}x)")
+    print(f"  cached background, one note's area: {partial:8.3f} ms per redraw")
+
+# Drawing notes that carry accidentals and agréments, with the glyph cache and with a cache that
+# keeps nothing (so every mark is rescaled for every note, as it used to be).
+def bench_glyph_cache(game):
+    staff = make_staff(game)
+    fill_sixteenths(game,staff)
+    agrements = list(game.AGREMENT_DICT)
+    for n, note in enumerate(staff.notes):
+        note.accidental = ['sharp','flat'][n % 2]
+        note.agrement = agrements[n % len(agrements)]
+    def draw_notes():
+        for note in staff.notes:
+            note.generate_image()
+    repeat = 50
+    capacity = game.GLYPHS.capacity
+    game.GLYPHS.capacity = 0
+    game.GLYPHS.flush()
+    before = per_call(draw_notes,repeat)
+    game.GLYPHS.capacity = capacity
+    game.GLYPHS.hits = game.GLYPHS.misses = 0
+    after = per_call(draw_notes,repeat)
+    print(f"glyph_cache: {len(staff.notes)} notes, each with an accidental and an agrément")
+    print(f"  rescaled for every note: {before:8.3f} ms per pass")
+    print(f"  glyph cache:             {after:8.3f} ms per pass ({before/after:.2f}x)")
+    print(f"  {game.GLYPHS.report()}")
+
+# Fills a staff with one of every kind of note: every length, dotted or not, with stems up and down,
+# alone on their beats (so eighths and sixteenths are flagged) and in beamed pairs.
+def fill_assorted(game,staff):
+    for measure in range(1,game.MEASURES_PER+1):
+        beat = 1.0
+        for duration in [0.25,0.125,0.0625,0.1875,0.0625,0.125,0.125]:
+            for orientation in [True,False]:
+                pitch = 'cdefgab'[int(beat*4) % 7] + ('5' if orientation else '3')
+                note = game.Note(staff,(measure,beat),duration,pitch,orientation=orientation)
+                note.set_position()
+                staff.add_note(note)
+            beat += 4*duration
+    for measure, duration in [(1,1.0),(2,0.5),(3,0.75),(4,1.5)]:
+        note = game.Note(staff,(measure,1.0),duration,'g4')
+        note.set_position()
+        staff.add_note(note)
+
+# Notes drawn per second with the parts of each note copied from the sprite atlas and drawn in place,
+# after checking that both draw the same pixels.
+def bench_note_sprites(game):
+    import pygame
+    staff = make_staff(game)
+    fill_assorted(game,staff)
+    fill_sixteenths(game,staff)
+    screen = staff.screen
+    def snapshot():
+        staff.generate_image()
+        return pygame.image.tobytes(screen.subsurface(staff.inked.clip(screen.get_rect())),'RGB')
+    game.NOTE_SPRITES.enabled = False
+    procedural = snapshot()
+    game.NOTE_SPRITES.enabled = True
+    sprites = snapshot()
+    differing = sum(procedural[i:i+3] != sprites[i:i+3] for i in range(0,len(procedural),3))
+    def draw_notes():
+        for note in staff.notes:
+            note.generate_image()
+            note.flag()
+    repeat = 50
+    results = {}
+    for enabled in [False,True]:
+        game.NOTE_SPRITES.enabled = enabled
+        results[enabled] = len(staff.notes)/per_call(draw_notes,repeat)*1000
+    print(f"note_sprites: {len(staff.notes)} notes of every kind; {differing} pixels differ between the two")
+    print(f"  drawn in place:  {results[False]:10.0f} notes per second")
+    print(f"  sprite atlas:    {results[True]:10.0f} notes per second ({results[True]/results[False]:.2f}x)")
+
+# The line breaking the game used to do, rendering every word, and every line with each word added,
+# to find their widths; kept here to check the new layout against and to time it.
+def rendered_linebreak(text,width,font,color):
+    pars = text.split('\n\n')
+    for i in range(len(pars)):
+        par = pars[i].replace('\n',' ')
+        while '  ' in par:
+            par = par.replace('  ',' ')
+        pars[i] = par
+    words = ' \n '.join(pars).split(' ')
+    texts = []
+    line = words[0]
+    if font.render(words[0],True,color).get_width() > width:
+        return False
+    for word in words[1:]:
+        if font.render(word,True,color).get_width() > width:
+            return False
+        linextend = ' '.join([line,word])
+        if word == '\n':
+            texts.append(line)
+            line = ''
+        elif font.render(linextend,True,color).get_width() > width:
+            texts.append(line)
+            line = word
+        else:
+            line = linextend
+    texts.append(line)
+    return [font.render(line,True,color) for line in texts]
+
+# Laying out a long text at the chat box's width and a little narrower: the old way, measured without caches, and
+# shown again from the cache of laid-out blocks, after checking that the lines come out the same.
+def bench_text_layout(game):
+    import pygame
+    screen = pygame.display.get_surface() or pygame.display.set_mode(game.WINDOW_DIM)
+    # Plenty of English: the game's own comments, a paragraph to a comment.
+    with open(MAIN_FILE,encoding='utf-8') as source:
+        comments = [line.strip().lstrip('#').strip() for line in source if line.strip().startswith('#')]
+    text = '\n\n'.join(comment for comment in comments if comment)[:20000]
+    font, color = game.DEFAULT_FONT, game.INK_COLOR
+    widths = [game.CHAT_WIDTH-20-8*n for n in range(8)]
+    differing = 0
+    for width in widths:
+        old = rendered_linebreak(text,width,font,color)
+        new = game.linebreak(text,width,0,font,color)
+        differing += len(old) != len(new) or any(pygame.image.tobytes(a,'RGBA') != pygame.image.tobytes(b,'RGBA') for a, b in zip(old,new))
+    def rendered():
+        for width in widths:
+            rendered_linebreak(text,width,font,color)
+    def measured():
+        game.WORD_WIDTHS.clear()
+        for width in widths:
+            game.linebreak(text,width,0,font,color)
+    def shown():
+        for width in widths:
+            game.bliterate(screen,text,0,0,width+20,outerbuffer=10,buffer=5)
+    repeat = 20
+    before = per_call(rendered,repeat)
+    cold = per_call(measured,repeat)
+    shown()
+    warm = per_call(shown,repeat)
+    print(f"text_layout: {len(text.split())} words at {len(widths)} widths; {differing} layouts differ from the old")
+    print(f"  rendered to measure:    {before:8.3f} ms per pass")
+    print(f"  measured, no caches:    {cold:8.3f} ms per pass ({before/cold:.2f}x)")
+    print(f"  laid out and cached:    {warm:8.3f} ms per pass ({before/warm:.2f}x)")
+
+# Run in a fresh process by bench_startup: starts the game, quits as soon as it can, and prints
+# the wall-clock time at which the first frame was presented.
+STARTUP_SCRIPT = '''
+import sys, time, threading
+sys.path.insert(0,sys.argv[1])
+import benchmarks, pygame
+game = benchmarks.load_game()
+game.ASSETS.bundle_path = sys.argv[2]
+scheduler = game.Scheduler()
+done = threading.Event()
+def quit_soon(): # Events posted before the window is made are lost, so keep posting.
+    while not done.wait(0.005):
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
+threading.Thread(target=quit_soon,daemon=True).start()
+game.main(scheduler)
+done.set()
+print(time.time() - (time.perf_counter() - scheduler.first_frame))
+'''
+
+# Cold start: the time from launching the game's process to its first frame, with the pictures
+# decoded and scaled from their files, and read from an asset bundle.
+def bench_startup(game):
+    folder = os.path.dirname(MAIN_FILE)
+    runs = 5
+    with tempfile.TemporaryDirectory() as scratch:
+        bundle = os.path.join(scratch,'assets.bundle')
+        store = game.AssetStore(bundle)
+        store.save_bundle(game.bundled_pictures())
+        results = {}
+        for label, path in [('no bundle',os.path.join(scratch,'none')),('bundle',bundle)]:
+            times = []
+            for r in range(runs):
+                launched = time.time()
+                output = subprocess.run([sys.executable,'-c',STARTUP_SCRIPT,folder,path],capture_output=True,text=True,check=True).stdout
+                times.append(1000*(float(output.split()[-1])-launched))
+            results[label] = sorted(times)[runs//2]
+        # The pictures alone, in this process, from a store that has loaded none of them yet.
+        import pygame
+        pygame.display.get_surface() or pygame.display.set_mode(game.WINDOW_DIM)
+        wanted = game.bundled_pictures()
+        def load_all(path):
+            store = game.AssetStore(path)
+            store.read_bundle()
+            for filename, sizes in wanted:
+                store.picture(filename,sizes)
+        from_files = per_call(lambda: load_all(os.path.join(scratch,'none')),20)
+        from_bundle = per_call(lambda: load_all(bundle),20)
+    print(f"startup: launch to first frame, median of {runs} runs; the bundle holds {len(wanted)} pictures")
+    print(f"  pictures from their files: {results['no bundle']:8.1f} ms")
+    print(f"  pictures from the bundle:  {results['bundle']:8.1f} ms")
+    print(f"  loading the pictures alone: {from_files:7.2f} ms from files, {from_bundle:7.2f} ms from the bundle ({from_files/from_bundle:.1f}x)")
+
+# Fills a staff with n notes of every length at random places on it (any number may share a place).
+def fill_random(game,staff,n,seed=0):
+    import random
+    rng = random.Random(seed)
+    durations = list(game.NOTE_TIME_DICT.values())
+    for i in range(n):
+        duration = rng.choice(durations)
+        slots = int(staff.timesig[0]/staff.timesig[1]/duration)
+        pitch = 'cdefgab'[rng.randrange(7)] + str(rng.randrange(3,6))
+        note = game.Note(staff,(rng.randrange(1,game.MEASURES_PER+1),rng.randrange(slots)*4*duration+1),duration,pitch,orientation=rng.random() < 0.5)
+        note.set_position()
+        staff.add_note(note)
+
+# Finding the note under a click, going through every note on the staff as the game used to, and
+# with the staff's index, on staves of 10, 1,000 and 100,000 notes.  Both must find the same notes.
+def bench_hit_test(game):
+    import random
+    rng = random.Random(1)
+    print("hit_test: finding the note under a click")
+    for n in [10,1000,100000]:
+        staff = make_staff(game)
+        fill_random(game,staff,n)
+        points = [(rng.randrange(staff.rect.left,staff.rect.right),rng.randrange(staff.rect.top,staff.rect.bottom)) for i in range(200)]
+        def scanned(point):
+            for eachnote in staff.notes:
+                if eachnote.rect.collidepoint(point):
+                    return eachnote
+            return None
+        mismatches = sum(scanned(point) is not staff.note_at(point) for point in points)
+        repeat = max(1,20000//n)
+        before = per_call(lambda: [scanned(point) for point in points],repeat)/len(points)
+        after = per_call(lambda: [staff.note_at(point) for point in points],repeat)/len(points)
+        print(f"  {n:>7} notes: every note {1000*before:10.2f} us, index {1000*after:8.2f} us per click ({before/after:.0f}x); {mismatches} mismatches")
+
+# Building a staff one note at a time, as the player does, and then erasing every note, with the
+# staff's NoteList and with a plain list sorted after every note (as the game used to), checking that
+# both hold the notes in the same order.  The plain list is only timed on 5,000 notes, as sorting
+# after every one of 50,000 notes would take many minutes.
+def bench_note_store(game):
+    import random
+    def make_notes(staff,n):
+        rng = random.Random(2)
+        durations = list(game.NOTE_TIME_DICT.values())
+        notes = []
+        for i in range(n):
+            duration = rng.choice(durations)
+            slots = int(staff.timesig[0]/staff.timesig[1]/duration)
+            note = game.Note(staff,(rng.randrange(1,game.MEASURES_PER+1),rng.randrange(slots)*4*duration+1),duration,'cdefgab'[rng.randrange(7)]+'4')
+            note.set_position()
+            notes.append(note)
+        return notes
+    print("note_store: placing notes one at a time, then erasing them all in random order")
+    for n in [5000,50000]:
+        staff = make_staff(game)
+        notes = make_notes(staff,n)
+        order = notes[:]
+        random.Random(3).shuffle(order)
+        start = time.perf_counter()
+        for note in notes:
+            staff.add_note(note)
+        built = time.perf_counter() - start
+        beats = set(int(staff.time_a_note(note)) for note in notes)
+        wrong = sum(staff.beat_notes(beat) != [note for note in staff.notes if staff.time_a_note(note)//1 == beat] for beat in beats)
+        wrong += sum(staff.measure_notes(m) != [note for note in staff.notes if note.time[0] == m] for m in range(1,game.MEASURES_PER+1))
+        line = f"  {n:>6} notes: NoteList {1000*built:9.1f} ms to place"
+        if n <= 5000:
+            plain = []
+            start = time.perf_counter()
+            for note in notes:
+                plain.append(note)
+                plain.sort(key=staff.time_a_note)
+            listed = time.perf_counter() - start
+            wrong += plain != list(staff.notes)
+            start = time.perf_counter()
+            for note in order:
+                plain.remove(note)
+            unlisted = time.perf_counter() - start
+        start = time.perf_counter()
+        for note in order:
+            staff.remove_note(note)
+        erased = time.perf_counter() - start
+        line += f", {1000*erased:8.1f} ms to erase"
+        if n <= 5000:
+            line += f"; sorted list {1000*listed:9.1f} ms to place ({listed/built:.0f}x), {1000*unlisted:8.1f} ms to erase ({unlisted/erased:.0f}x)"
+        print(line + f"; {wrong} disagreements")
+
+# Redrawing a staff dense with sixteenths after one note on it changes.  "Whole staff" rebuilds every
+# beat's beams and draws every note, as every redraw used to; "edited beat" forgets only the beams of
+# the note's beat and redraws what lies near it, as the game now does.  The last column checks that
+# both leave the same pixels on the screen.
+def bench_beam_redraw(game):
+    import pygame
+    print("beam_redraw: redrawing a staff after one note changes")
+    for voices in [2,8,32]:
+        staff = make_staff(game)
+        fill_sixteenths(game,staff,voices)
+        staff.generate_image()
+        note = staff.beat_notes(staff.time_a_note(staff.notes[len(staff.notes)//2])//1)[0]
+        beat = staff.time_a_note(note)//1
+        area = note.inked.unionall([eachnote.inked for eachnote in staff.beat_notes(beat)])
+        def whole():
+            staff.beams.clear()
+            staff.generate_image()
+        def edited():
+            staff.forget_beams(beat)
+            staff.generate_image(area,[note])
+        edited()
+        partial = pygame.image.tobytes(staff.screen.subsurface(area),'RGB')
+        whole()
+        same = partial == pygame.image.tobytes(staff.screen.subsurface(area),'RGB')
+        repeat = max(3,600//voices)
+        before = per_call(whole,repeat)
+        after = per_call(edited,repeat)
+        print(f"  {len(staff.notes):>5} notes: whole staff {before:8.2f} ms, edited beat {after:6.2f} ms ({before/after:.0f}x); same pixels: {same}")
+
+# Compiling a score (see score.py) into its timeline of MIDI notes, on six staves of random notes,
+# one in twenty with an agrément.  The score is built from arrays directly, as making a million
+# of the game's Note objects would take longer than anything timed here.
+def random_score(n,seed=4,ornamented=0.05):
+    import numpy
+    import score
+    rng = numpy.random.default_rng(seed)
+    music = score.Score()
+    per_staff = n // 6
+    for s in range(6):
+        notes = numpy.zeros(per_staff,dtype=score.NOTE)
+        notes['duration'] = rng.choice([0.25,0.5,1.0,2.0,4.0],per_staff)
+        notes['beat'] = numpy.sort(rng.integers(0,per_staff//2+1,per_staff)/4 + 5)
+        notes['pitch'] = rng.integers(36,84,per_staff)
+        notes['agrement'] = numpy.where(rng.random(per_staff) < ornamented,rng.integers(1,len(score.AGREMENTS),per_staff),0)
+        music.add_columns(16*(s//2),notes)
+    return music
+
+def bench_score_compile(game):
+    print("score_compile: compiling a score into its timeline of MIDI notes")
+    for n in [10000,100000,1000000]:
+        music = random_score(n)
+        repeat = max(1,100000//n)
+        took = per_call(music.compile,repeat)
+        events = music.compile()
+        print(f"  {len(music):>7} notes: {took:9.1f} ms, {len(events):>8} notes played ({1000*took/len(music):.2f} us a note)")
+
+# The notes a score is played as, worked out one written note at a time with the if/elif
+# branches output_music() used to have, as (onset, duration, pitch).
+def realized_one_by_one(music):
+    import score
+    def above(p):
+        return p + 2 if p % 12 in [0,2,5,7,9] else p + 1
+    def below(p):
+        return p - 2 if p % 12 in [2,4,7,9,11] else p - 1
+    played = []
+    previousnote = None
+    double = None
+    for offset, notes, track in music.staves:
+        for beat, duration, pitch, code in notes.tolist():
+            agrement = score.AGREMENTS[code]
+            start = offset + beat
+            if double is not None:
+                (before, doublebeat, doubleduration, doublepitch) = double
+                played.append((offset+doublebeat,doubleduration/4,pitch))
+                played.append((offset+doublebeat+doubleduration/4,doubleduration/4,doublepitch))
+                played.append((offset+doublebeat+doubleduration/2,doubleduration/4,before))
+                played.append((offset+doublebeat+3*doubleduration/4,doubleduration/4,doublepitch))
+                double = None
+            previous = pitch if previousnote is None else previousnote
+            if agrement == '':
+                played.append((start,duration,pitch))
+            elif agrement == 'pince':
+                played.append((start,duration/4,pitch))
+                played.append((start+duration/4,duration/4,below(pitch)))
+                played.append((start+duration/2,duration/2,pitch))
+            elif agrement == 'tremblement':
+                d = duration/8
+                for i in range(4):
+                    played.append((start+2*i*d,d,above(pitch)))
+                    played.append((start+2*i*d+d,d,pitch))
+            elif agrement == 'appuye':
+                d = duration/12
+                played.append((start,d*3,above(pitch)))
+                played.append((start+d*3,d,pitch))
+                for i in range(2,6):
+                    played.append((start+2*i*d,d,above(pitch)))
+                    played.append((start+2*i*d+d,d,pitch))
+            elif agrement == 'portdevoix':
+                played.append((start,duration/2,previous))
+                played.append((start+duration/2,duration/2,pitch))
+            elif agrement == 'mordent':
+                played.append((start-1/16,1/32,pitch))
+                played.append((start-1/32,1/32,pitch-1))
+                played.append((start,duration,pitch))
+            elif agrement == 'cadence':
+                d = duration/12
+                played.append((start,d,above(pitch)))
+                played.append((start+2*d,d,below(pitch)))
+                for i in range(6):
+                    played.append((start+2*i*d+d,d,pitch))
+                for i in range(2,6):
+                    played.append((start+2*i*d,d,above(pitch)))
+            elif agrement == 'double':
+                double = (previous,beat,duration,pitch)
+            previousnote = pitch
+    return played
+
+# Realizing a score in which every note has an agrément: all at once from the table of ornaments in
+# score.py, and one note at a time as output_music() used to, checking both give the same notes.
+def bench_ornaments(game):
+    print("ornaments: realizing the agréments of a score where every note has one")
+    for n in [10000,100000]:
+        music = random_score(n,ornamented=1.0)
+        events = music.compile()
+        played = realized_one_by_one(music)
+        same = [tuple(event) for event in events[['onset','duration','pitch']].tolist()] == played
+        table = per_call(music.compile,max(1,100000//n))
+        one_by_one = per_call(lambda: realized_one_by_one(music),1)
+        print(f"  {len(music):>6} ornaments: table {table:7.1f} ms, one by one {one_by_one:8.1f} ms ({one_by_one/table:.0f}x); {len(events)} notes played, identical: {same}")
+
+# A score of six staves, each a line of one note after another, in a register of its own, with about
+# one note in twenty ornamented, no two of them within four notes of each other.  Unlike random_score(),
+# notes of one pitch seldom sound together, which midiutil cannot always write.
+def melodic_score(n,seed=5):
+    import numpy
+    import score
+    rng = numpy.random.default_rng(seed)
+    music = score.Score()
+    per_staff = n // 6
+    for s in range(6):
+        notes = numpy.zeros(per_staff,dtype=score.NOTE)
+        notes['duration'] = rng.choice([0.25,0.5,1.0,2.0],per_staff)
+        notes['beat'] = numpy.cumsum(notes['duration']) - notes['duration'] + 5
+        notes['pitch'] = rng.integers(32+10*s,38+10*s,per_staff)
+        notes['agrement'] = numpy.where(rng.random(per_staff) < 0.2,rng.integers(1,len(score.AGREMENTS),per_staff),0)
+        notes['agrement'][numpy.arange(per_staff) % 4 != 2] = 0
+        music.add_columns(0,notes)
+    return music
+
+# A score of n notes laid out as the game lays out a piece: two staves to a system, each of sixteen
+# beats, one system after another, as Score.compile_staves() compiles it staff by staff.
+def paged_score(n,seed=5,beats=16):
+    import numpy
+    import score
+    rng = numpy.random.default_rng(seed)
+    music = score.Score()
+    s = 0
+    while len(music) < n:
+        durations = rng.choice([0.25,0.5,1.0,2.0],beats*2)
+        starts = numpy.cumsum(durations) - durations
+        fits = starts + durations <= beats
+        notes = numpy.zeros(fits.sum(),dtype=score.NOTE)
+        notes['duration'] = durations[fits]
+        notes['beat'] = starts[fits] + 5
+        notes['pitch'] = rng.integers(40+12*(s%2),50+12*(s%2),len(notes))
+        notes['agrement'] = numpy.where(rng.random(len(notes)) < 0.2,rng.integers(1,len(score.AGREMENTS),len(notes)),0)
+        notes['agrement'][numpy.arange(len(notes)) % 4 != 2] = 0 # (As in melodic_score(), so that midiutil can write it.)
+        music.add_columns(beats*(s//2),notes)
+        s += 1
+    return music
+
+# Writing a compiled score's MIDI file with midiutil, as the game used to.
+def written_by_midiutil(events,output_file,tempo):
+    from midiutil import MIDIFile
+    tracks = int(events['track'].max()) + 1 if len(events) else 1
+    outputMIDI = MIDIFile(tracks)
+    outputMIDI.addTempo(0,0,tempo)
+    for track in range(tracks):
+        outputMIDI.addProgramChange(track,0,0,6)
+    for onset, duration, pitch, velocity, track in events.tolist():
+        outputMIDI.addNote(track,0,pitch,onset,duration,velocity)
+    outputMIDI.writeFile(output_file)
+
+# Writing the MIDI file of a compiled score, with score.write_midi() and with midiutil, timing each and
+# measuring the most memory each held at once (as traced by tracemalloc, which counts NumPy's arrays too,
+# but not the compiled score both are given).  score.write_midi() is given the staves' compiled runs,
+# as the game gives them, so that what it holds at once should not grow with the piece.  midiutil is
+# only tried up to 100,000 notes, as it takes minutes and gigabytes beyond that.  Where both write a
+# file, the files are compared.
+def bench_midi_export(game):
+    import tracemalloc
+    import score
+    def measured(write,events,path):
+        def written():
+            with open(path,'wb') as output_file:
+                write(events,output_file,90)
+        took = per_call(written,1)
+        tracemalloc.start() # (Which slows what it traces, so it is traced apart from being timed.)
+        written()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return took, peak
+    print("midi_export: writing a compiled score's MIDI file")
+    with tempfile.TemporaryDirectory() as folder:
+        streamed_path = os.path.join(folder,'streamed.mid')
+        midiutil_path = os.path.join(folder,'midiutil.mid')
+        for n in [10000,100000,1000000]:
+            streams = paged_score(n).compile_staves()
+            took, peak = measured(score.write_midi,streams,streamed_path)
+            line = f"  {sum(map(len,streams)):>7} notes: streamed {took:8.1f} ms, {peak/2**20:6.1f} MB"
+            if n <= 100000:
+                old_took, old_peak = measured(written_by_midiutil,score.merge(streams),midiutil_path)
+                with open(streamed_path,'rb') as streamed, open(midiutil_path,'rb') as written:
+                    same = streamed.read() == written.read()
+                line += f"; midiutil {old_took:8.1f} ms, {old_peak/2**20:6.1f} MB; same bytes: {same}"
+            print(line + f"; {os.path.getsize(streamed_path)/2**20:.1f} MB written")
+
+# Editing one note and exporting again, as the player does between presses of play: with each staff's
+# compiled notes kept (see Staff.kept_events()), and with every staff compiled anew, as before.
+# Each export is checked against the whole score compiled at once from the staves' notes.
+def bench_incremental_export(game):
+    import io
+    import random
+    import score
+    rng = random.Random(6)
+    agrements = list(game.AGREMENT_DICT)
+    print("incremental_export: exporting again after editing one note")
+    for n in [100,1000,10000]:
+        staves = [make_staff(game,id) for id in range(game.SYSTEMS*game.STAVES_PER)]
+        for eachstaff in staves:
+            fill_random(game,eachstaff,n,seed=eachstaff.id)
+            for eachnote in eachstaff.notes:
+                if rng.random() < 0.05:
+                    eachnote.agrement = rng.choice(agrements)
+        def exported():
+            output_file = io.BytesIO()
+            score.write_midi(game.compile_staves(staves),output_file,120)
+            return output_file.getvalue()
+        def edited():
+            eachstaff = rng.choice(staves)
+            eachnote = eachstaff.notes[rng.randrange(len(eachstaff.notes))]
+            eachstaff.feel_click(eachnote.rect.center,rng.choice(['sharp','flat','dot']+agrements))
+        def compiled_anew():
+            for eachstaff in staves:
+                eachstaff.forget_compiled()
+        exported()
+        game.COMPILED.hits = game.COMPILED.misses = 0
+        wrong = 0
+        for i in range(20):
+            edited()
+            whole = score.Score()
+            for eachstaff in staves:
+                whole.add_staff(eachstaff.timesig[0]*game.MEASURES_PER*(eachstaff.id//game.STAVES_PER),eachstaff.score_notes())
+            output_file = io.BytesIO()
+            score.write_midi(whole.compile(),output_file,120)
+            wrong += exported() != output_file.getvalue()
+        report = game.COMPILED.report()
+        repeat = max(3,2000//n)
+        kept = per_call(lambda: (edited(),exported()),repeat)
+        anew = per_call(lambda: (edited(),compiled_anew(),exported()),repeat)
+        print(f"  {sum(len(eachstaff.notes) for eachstaff in staves):>6} notes: compiled anew {anew:7.2f} ms, kept {kept:7.2f} ms ({anew/kept:.1f}x); {wrong} exports differing")
+        print(f"    {report}")
+
+# Exporting a large score with each staff on its own track, its staves compiled and its tracks
+# written by 1, 2, 4 and 8 worker processes at once.  Every file must be the same, byte for byte.
+# The speedup can be no more than the cores there are to run them on; on one core, what is shown is
+# only what handing the work out costs.
+def bench_multitrack_export(game):
+    import score
+    print(f"multitrack_export: compiling and writing each staff on its own track ({os.cpu_count()} cores here)")
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder,'tracks.mid')
+        for n, staves in [(120000,24),(1200000,24)]:
+            music = score.Score()
+            for track, (offset, notes, _) in enumerate(melodic_score(n,seed=7).staves*(staves//6)):
+                music.add_columns(offset,notes[track//6::staves//6],track)
+            times, outputs = [], []
+            for workers in [1,2,4,8]:
+                def exported():
+                    with open(path,'wb') as output_file:
+                        score.write_midi(music.compile_staves(workers),output_file,90,workers)
+                times.append(per_call(exported,3 if n < 1000000 else 1))
+                with open(path,'rb') as written:
+                    outputs.append(written.read())
+            line = ", ".join(f"{workers} {'worker' if workers == 1 else 'workers'} {took:7.1f} ms ({times[0]/took:.1f}x)" for workers, took in zip([1,2,4,8],times))
+            print(f"  {len(music):>7} notes on {staves} tracks: {line}; same bytes: {len(set(outputs)) == 1}")
+
+# Pressing play on a piece that has not changed since it was last played: the file is found in the
+# export cache by the music's name, without compiling or writing anything, rather than written
+# again.  The names must be the same for the same music in another cache, and the cache must keep
+# within its capacity as pieces are edited and played.
+def bench_export_cache(game):
+    import random
+    print("export_cache: pressing play again on the same piece")
+    rng = random.Random(8)
+    with tempfile.TemporaryDirectory() as folder:
+        for n in [100,1000,10000]:
+            staves = [make_staff(game,id) for id in range(game.SYSTEMS*game.STAVES_PER)]
+            for eachstaff in staves:
+                fill_random(game,eachstaff,n,seed=eachstaff.id)
+            def written():
+                cache = game.ExportCache(os.path.join(folder,f'written{n}'))
+                return game.Export(staves,cache).run()
+            cache = game.ExportCache(os.path.join(folder,f'kept{n}'))
+            path = game.Export(staves,cache).run()
+            other = written()
+            with open(path,'rb') as kept, open(other,'rb') as again:
+                same = os.path.basename(path) == os.path.basename(other) and kept.read() == again.read()
+            repeat = max(3,1000//n)
+            before = per_call(lambda: (shutil.rmtree(os.path.join(folder,f'written{n}'),ignore_errors=True),written()),repeat)
+            after = per_call(lambda: game.Export(staves,cache).run(),repeat)
+            print(f"  {sum(len(eachstaff.notes) for eachstaff in staves):>6} notes: written {before:7.2f} ms, found {after:6.2f} ms ({before/after:.0f}x); same name and bytes elsewhere: {same}")
+        cache = game.ExportCache(os.path.join(folder,'small'),capacity=64*2**10)
+        for i in range(200):
+            eachstaff = rng.choice(staves)
+            eachnote = eachstaff.notes[rng.randrange(len(eachstaff.notes))]
+            eachstaff.feel_click(eachnote.rect.center,rng.choice(['sharp','flat','dot']))
+            game.Export(staves[:2],cache).run()
+        kept = sum(entry.stat().st_size for entry in os.scandir(cache.folder))
+        print(f"  200 edits played with a {cache.capacity//2**10} kB cache: {kept//2**10} kB kept; {cache.report()}")
+
+# Pressing play on a large piece, and drawing frames (each redrawing a beat of a staff, as after an
+# edit) until it is exported: with the export run where play is pressed, as it used to be, the game
+# draws nothing until it is done; with it run by an ExportWorker, the longest wait between frames
+# is what matters.  Every export is of music neither compiled nor exported before (though the notes'
+# columns are kept, as only an edited staff's would need making again), and nothing is played.
+def bench_background_export(game):
+    import pygame
+    print("background_export: drawing frames while the music is exported")
+    with tempfile.TemporaryDirectory() as folder:
+        for n in [1000,10000,30000]:
+            staves = [make_staff(game,id) for id in range(game.SYSTEMS*game.STAVES_PER)]
+            for eachstaff in staves:
+                fill_random(game,eachstaff,n,seed=eachstaff.id)
+            note = staves[0].notes[0]
+            area = note.inked.copy()
+            def frame():
+                staves[0].generate_image(area,[note])
+            def exported(k):
+                for eachstaff in staves:
+                    eachstaff.compiled = None
+                return game.Export(staves,game.ExportCache(os.path.join(folder,f'{n}-{k}')))
+            for eachstaff in staves:
+                eachstaff.note_columns()
+            alone = per_call(frame,20)
+            blocked = per_call(lambda: exported('here').run(),1)/1000
+            pygame.event.clear()
+            worker = game.ExportWorker(play=False)
+            started = time.perf_counter()
+            worker.start(exported('worker'))
+            handed = time.perf_counter() - started
+            frames = []
+            done = False
+            while not done:
+                before = time.perf_counter()
+                frame()
+                done = any(e.type == game.EXPORT_DONE for e in pygame.event.get())
+                frames.append(time.perf_counter() - before)
+                time.sleep(max(0,1/game.FRAME_RATE - frames[-1]))
+            took = time.perf_counter() - started
+            print(f"  {6*n:>6} notes: {1000*blocked:7.1f} ms with no frames drawn; in the background, play returns in {1000*handed:6.1f} ms, "
+                  f"{len(frames)} frames in {1000*took:7.1f} ms, slowest {1000*max(frames):5.1f} ms (alone {alone:4.1f} ms)")
+
+# Rendering a score with the game's own harpsichord (see harpsichord.py) to a WAV file, with no sound
+# card: how many times faster than it plays, and the most memory taken, which should not grow with
+# the length of the piece, as the samples are rendered and written a block at a time.
+def bench_render_wav(game):
+    import tracemalloc
+    import harpsichord
+    print("render_wav: rendering a score to a WAV file")
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder,'rendered.wav')
+        for n in [300,3000]:
+            events = melodic_score(n).compile()
+            took = per_call(lambda: harpsichord.write_wav(events,path,90),1)/1000
+            seconds = (os.path.getsize(path)-44)/2/harpsichord.SAMPLE_RATE
+            tracemalloc.start() # (Traced apart from being timed, as tracing slows it.)
+            harpsichord.write_wav(events,path,90)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"  {len(events):>5} notes, {seconds:6.1f} s of music: rendered in {took:5.2f} s ({seconds/took:.0f}x as fast as played), "
+                  f"{peak/2**20:5.1f} MB at most ({events.nbytes/2**20:.2f} MB of it the notes)")
+
+# Playing a long piece through the mixer (SDL's dummy audio driver plays in real time, with no sound
+# card) for a few seconds, with the Player's buffers of several sizes (the mixer itself is handed
+# MIXER_BUFFER samples at a time, as in the game): how soon the first buffer is handed over,
+# how often the mixer ran dry, and how late the buffers were handed over.  For comparison, how long
+# rendering the whole piece before playing it would take, from how long a few seconds of it take.
+def bench_streaming_playback(game):
+    import pygame
+    import harpsichord
+    events = melodic_score(200000).compile()
+    tempo = 90
+    instrument = harpsichord.Harpsichord(events,tempo)
+    sample = 3*harpsichord.SAMPLE_RATE
+    took = per_call(lambda: [instrument.samples(first,4096) for first in range(60*harpsichord.SAMPLE_RATE,61*harpsichord.SAMPLE_RATE+sample,4096)],1)/1000
+    print(f"streaming_playback: playing {instrument.length/harpsichord.SAMPLE_RATE/60:.0f} minutes of music "
+          f"(which would take {took*instrument.length/sample:.0f} s to render whole)")
+    for buffer in [512,1024,2048,4096]:
+        pygame.mixer.quit()
+        player = game.Player(buffer)
+        started = time.perf_counter()
+        player.play(events,tempo)
+        returned = time.perf_counter() - started
+        time.sleep(3)
+        player.stop()
+        print(f"  {buffer:>4} samples a buffer ({1000*buffer/harpsichord.SAMPLE_RATE:5.1f} ms): play returned in {1000*returned:.1f} ms; {player.report()}")
+    pygame.mixer.quit()
+
+# Hearing notes as they are placed: the same clicks - placing notes of every length about a staff,
+# then adding accidentals and agréments to them - on two empty staves in turn, so that every sound the
+# second wants was rendered for the first.  Each time is from the click to the note being played,
+# as the game's loop takes it.  Then a small budget, which the sounds kept must keep within.
+def bench_audition_latency(game):
+    import random
+    import pygame
+    rng = random.Random(9)
+    pygame.mixer.quit()
+    game.PREVIEWS = game.PreviewCache()
+    clicks = []
+    for i in range(150):
+        tool = rng.choice(list(game.NOTE_TIME_DICT))
+        clicks.append((rng.randrange(3*game.STAFF_HEIGHT,game.STAFF_LENGTH),rng.randrange(game.STAFF_HEIGHT,2*game.STAFF_HEIGHT),tool))
+    for i in range(150):
+        x, y, tool = rng.choice(clicks[:150])
+        clicks.append((x,y,rng.choice(['sharp','flat','dot']+list(game.AGREMENT_DICT))))
+    print("audition_latency: hearing a note as it is placed or changed")
+    for name in ['cold','warm']:
+        staff = make_staff(game)
+        game.PREVIEWS.latencies = []
+        for x, y, tool in clicks:
+            clicked = time.perf_counter()
+            staff.feel_click((staff.position[0]+x,staff.position[1]+y),tool)
+            if staff.sounded is not None:
+                game.audition(staff.sounded,clicked)
+                game.PREVIEWS.finish() # (A sound not kept is rendered on the cache's thread.)
+        latencies = sorted(latency for latency, kept in game.PREVIEWS.latencies)
+        print(f"  {name}: {len(latencies)} notes heard {1000*sum(latencies)/len(latencies):6.2f} ms after the click on average, "
+              f"{1000*latencies[len(latencies)*95//100]:6.2f} ms at the 95th percentile, {1000*latencies[-1]:6.2f} ms at most")
+    print(f"  {game.PREVIEWS.report()}")
+    game.PREVIEWS = game.PreviewCache(budget=2**20)
+    for x, y, tool in clicks:
+        clicked = time.perf_counter()
+        staff.feel_click((staff.position[0]+x,staff.position[1]+y),tool)
+        if staff.sounded is not None:
+            game.audition(staff.sounded,clicked)
+            game.PREVIEWS.finish()
+    print(f"  with a 1 MB budget: {game.PREVIEWS.report()}")
+    pygame.mixer.quit()
+
+# Scrolling through a piece of 12 measures, then of 12,000, a system at a time and a page at a time,
+# as the game does: every scroll lays out the staves come into view and draws the page anew.  The
+# time should not grow with the piece, nor should the surfaces held, which the staves in view share
+# (see BackgroundPool); with a background for every staff, as before, they would take as much more
+# as there are more staves.  The memory traced is what scrolling through the whole piece adds, less
+# what its notes took to begin with.
+def bench_scrolling(game):
+    import random
+    import tracemalloc
+    import pygame
+    rng = random.Random(10)
+    screen = make_staff(game).screen
+    print("scrolling: scrolling through the systems of a piece")
+    for measures in [12,12000]:
+        page = game.Page(screen,['treble','bass'])
+        systems = measures//game.MEASURES_PER
+        for n in range(systems):
+            for eachstaff in page.system(n):
+                for measure in range(1,game.MEASURES_PER+1):
+                    for beat in range(4):
+                        note = game.Note(eachstaff,(measure,beat+1.0),0.25,'cdefgab'[rng.randrange(7)]+('5' if eachstaff.clef == 'treble' else '3'))
+                        if eachstaff.position is not None: # Only the staves in view lay their notes out.
+                            note.set_position()
+                        eachstaff.add_note(note)
+        def scrolled(top):
+            page.scroll_to(top)
+            pygame.draw.rect(screen,game.PAPER_COLOR,game.PAPER_RECT)
+            for eachstaff in page.shown:
+                eachstaff.generate_image()
+        tops = [rng.randrange(systems) for i in range(100)]
+        by_system = per_call(lambda: scrolled(page.top+1 if page.top < systems-1 else 0),100)
+        by_page = per_call(lambda: scrolled(page.top+game.SYSTEMS if page.top < systems-game.SYSTEMS else 0),100)
+        jumps = per_call(lambda: scrolled(tops.pop()),100)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for top in range(systems):
+            scrolled(top)
+        grown = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        held = [eachstaff for eachstaff in page.staves if eachstaff.background is not None]
+        each = game.BACKGROUNDS.size()/len(game.BACKGROUNDS.backgrounds)
+        print(f"  {measures:>5} measures ({len(page.staves)} staves, {sum(len(eachstaff.notes) for eachstaff in page.staves)} notes): "
+              f"{by_system:5.2f} ms a system, {by_page:5.2f} ms a page, {jumps:5.2f} ms a jump; "
+              f"{len(held)} staves laid out, {grown/2**10:.0f} kB more after scrolling through")
+        print(f"    surfaces: {game.BACKGROUNDS.size()/2**20:.1f} MB shared, against {len(page.staves)*each/2**20:.1f} MB for one a staff; {game.BACKGROUNDS.report()}")
+
+# A note as each used to be held: an object of its own, with a dict of its attributes (as placed,
+# before it is laid out on the screen).
+class DictNote():
+    def __init__(self,staff,time,duration,pitch,accidental='',agrement='',orientation=True):
+        self.staff = staff
+        self.time = time
+        self.duration = duration
+        self.pitch = pitch
+        self.accidental = accidental
+        self.agrement = agrement
+        self.orientation = orientation
+        self.seq = 0
+
+# The memory a note takes, and how fast the notes can be gone through, in a score of a million notes
+# (sixteenths, a sixth with accidentals and a tenth with agréments, on staves out of view), held as
+# they used to be (DictNote), and column by column in each staff's NoteTable.  Each is held in its
+# staff's NoteList, which is counted too.  Going through them is reading each note's time, duration,
+# pitch and agrément, as drawing and playing them does, and making the columns the score is compiled
+# from (see Staff.note_columns()), as exporting does; the columns must come out the same.
+def bench_note_memory(game):
+    import random
+    import tracemalloc
+    import score
+    n, per_staff = 1000000, 64
+    agrements = list(game.AGREMENT_DICT)
+    def fill(make,staves):
+        rng = random.Random(11)
+        notes = []
+        for eachstaff, add in staves:
+            for k in range(per_staff):
+                r = rng.random()
+                note = make(eachstaff,(k//16+1,(k % 16)/4+1),0.0625,'cdefgab'[rng.randrange(7)]+'4',
+                            rng.choice(['sharp','flat']) if r < 1/6 else '',rng.choice(agrements) if r < 0.1 else '',r < 0.5)
+                note.seq = k
+                add(note)
+    def traced(build):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        built = build()
+        took = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        return built, took
+    print(f"note_memory: {n} notes, {per_staff} to a staff")
+    def as_before():
+        lists = [game.NoteList(lambda note: note.time[0]*4 + note.time[1]) for s in range(n//per_staff)]
+        fill(DictNote,[(None,notes.add) for notes in lists])
+        return lists
+    lists, old_size = traced(as_before)
+    def read_before():
+        for notes in lists:
+            for note in notes:
+                note.time, note.duration, note.pitch, note.agrement
+    def columns_before():
+        return [score.note_columns([(note.time[0]*4 + note.time[1],note.duration*4,score.midi_pitch(note.pitch,note.accidental),note.agrement) for note in notes]) for notes in lists]
+    old_read = per_call(read_before,1)
+    old_columns = per_call(columns_before,1)
+    expected = b''.join(columns.tobytes() for columns in columns_before())
+    del lists
+    screen = make_staff(game).screen
+    def as_columns():
+        page = game.Page(screen,['cclef','bass'])
+        staves = [page.staff(s) for s in range(len(page.shown),len(page.shown) + n//per_staff)] # Those out of view
+        fill(game.Note,[(eachstaff,eachstaff.add_note) for eachstaff in staves])
+        return staves
+    staves, new_size = traced(as_columns)
+    def read_columns():
+        for eachstaff in staves:
+            for note in eachstaff.notes:
+                note.time, note.duration, note.pitch, note.agrement
+    def columns_now():
+        for eachstaff in staves:
+            eachstaff.columns = None
+        return [eachstaff.note_columns() for eachstaff in staves]
+    new_read = per_call(read_columns,1)
+    new_columns = per_call(columns_now,1)
+    same = b''.join(columns.tobytes() for columns in columns_now()) == expected
+    print(f"  as before:    {old_size/n:5.0f} bytes a note; read in {old_read:6.0f} ms, columns made in {old_columns:6.0f} ms")
+    print(f"  column by column: {new_size/n:5.0f} bytes a note ({old_size/new_size:.1f}x less); read in {new_read:6.0f} ms ({old_read/new_read:.2f}x), "
+          f"columns made in {new_columns:6.0f} ms ({old_columns/new_columns:.1f}x); same columns: {same}")
+
+# Saving a piece of a thousand notes, then of a million, and opening it again (see savefile.py).
+# Opening reads only the staves in view, so it should take no longer for the longer piece; reading
+# every staff is timed apart.  The piece opened, read whole, must hold every note just as it was
+# saved - its time, duration, pitch, accidental, agrément, orientation and the order it was placed
+# in - on staves of the same clefs and time signature; and saved again, whether read whole or only
+# in part (over the file it was opened from), it must make the very same file.
+def bench_save_and_open(game):
+    import random
+    import pygame
+    agrements = list(game.AGREMENT_DICT)
+    screen = make_staff(game).screen
+    per_staff = 16
+    fields = lambda note: (note.time,note.duration,note.pitch,note.accidental,note.agrement,note.orientation,note.seq)
+    print("save_and_open: saving a piece, and opening it again")
+    for n in [1000,1000000]:
+        rng = random.Random(12)
+        page = game.Page(screen,['treble','bass'],'three-two')
+        for s in range(n//per_staff):
+            eachstaff = page.staff(s)
+            for k in range(per_staff):
+                r = rng.random()
+                note = game.Note(eachstaff,(rng.randrange(game.MEASURES_PER)+1,rng.randrange(12)/4+1),rng.choice([0.0625,0.125,0.25,0.375,0.5]),
+                                 'cdefgab'[rng.randrange(7)]+str(rng.randrange(2,6)),rng.choice(['sharp','flat']) if r < 1/6 else '',
+                                 rng.choice(agrements) if r < 0.1 else '',r < 0.5)
+                if eachstaff.position is not None:
+                    note.set_position()
+                eachstaff.add_note(note)
+            for note in rng.sample(list(eachstaff.notes),per_staff//8): # So that the rows saved are not all in order
+                eachstaff.remove_note(note)
+        page.scroll_to(page.last_written()//2)
+        expected = [(eachstaff.clef,eachstaff.timename,[fields(note) for note in eachstaff.notes]) for eachstaff in page.written()]
+        with tempfile.TemporaryDirectory() as folder:
+            path, again = os.path.join(folder,'piece.score'), os.path.join(folder,'again.score')
+            saved = per_call(lambda: page.save(path),1)
+            size = os.path.getsize(path)
+            def opened():
+                opened = game.open_page(screen,path)
+                pygame.draw.rect(screen,game.PAPER_COLOR,game.PAPER_RECT)
+                for eachstaff in opened.shown:
+                    eachstaff.generate_image()
+                return opened
+            start = time.perf_counter()
+            reopened = opened()
+            took = 1000*(time.perf_counter()-start)
+            made = sum(eachstaff is not None for eachstaff in reopened.staves)
+            reopened.save(again)
+            same_in_part = open(again,'rb').read() == open(path,'rb').read()
+            reopened = opened()
+            start = time.perf_counter()
+            staves = reopened.written()
+            read = 1000*(time.perf_counter()-start)
+            same = [(eachstaff.clef,eachstaff.timename,[fields(note) for note in eachstaff.notes]) for eachstaff in staves] == expected
+            reopened.save(path)
+            same_whole = open(again,'rb').read() == open(path,'rb').read()
+        print(f"  {n:>7} notes: saved in {saved:7.1f} ms ({size/n:.0f} bytes a note); opened and drawn in {took:5.1f} ms, "
+              f"reading {made} of {len(staves)} staves; read whole in {read:7.1f} ms")
+        print(f"    every note as saved: {same}; the same file saved again, read in part: {same_in_part}, read whole: {same_whole}")
+
+# Journaling a million edits as the game does (see Autosave): notes placed, changed and erased at random
+# across the staves of a long piece, each edit added to the journal as it is made.  What each edit costs
+# the game is timed apart, against writing and syncing each to the disk as it is made.  The journal is
+# then replayed onto a new page, which must hold every note just as the page edited does; and the page
+# is saved whole (compacted), as the game does once the journal has grown long.
+def bench_autosave(game):
+    import random
+    import savefile
+    n, staves = 1000000, 8000
+    agrements = list(game.AGREMENT_DICT)
+    screen = make_staff(game).screen
+    print(f"autosave: journaling {n} edits, and replaying them")
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder,'piece.score')
+        page = game.Page(screen,['treble','bass'],'three')
+        autosave = game.Autosave(longest=2**40)
+        autosave.start(page,path)
+        rng = random.Random(13)
+        journaled = 0.0
+        first = len(page.shown) # The staves out of view, as most are in a long piece
+        for e in range(n):
+            eachstaff = page.staff(first + rng.randrange(staves))
+            r = rng.random()
+            if r < 0.6 or not len(eachstaff.notes):
+                note = game.Note(eachstaff,(rng.randrange(game.MEASURES_PER)+1,rng.randrange(12)/4+1),rng.choice([0.0625,0.125,0.25,0.5]),
+                                 'cdefgab'[rng.randrange(7)]+str(rng.randrange(2,6)))
+                eachstaff.add_note(note)
+            else:
+                note = eachstaff.notes[rng.randrange(len(eachstaff.notes))]
+                if r < 0.85:
+                    change = rng.randrange(4)
+                    if change == 0:
+                        note.accidental = rng.choice(['','sharp','flat'])
+                    elif change == 1:
+                        note.agrement = rng.choice(agrements+[''])
+                    elif change == 2:
+                        note.duration *= 2/3 if note.duration * 32 % 3 == 0 else 1.5
+                    else:
+                        note.orientation = not note.orientation
+                else:
+                    eachstaff.remove_note(note)
+            eachstaff.edited = note
+            start = time.perf_counter()
+            autosave.edited(eachstaff)
+            journaled += time.perf_counter() - start
+        autosave.journal.close()
+        size = sum(os.path.getsize(autosave.journal.named(number)) for number in autosave.journal.segments())
+        expected = [[eachnote.kept() for eachnote in eachstaff.notes] for eachstaff in page.written()]
+        # Each edit written and synced as it is made, for a thousand edits
+        record = savefile.RECORD.pack(savefile.NOTE,0,0,*savefile.NO_VALUES)
+        with open(os.path.join(folder,'synced'),'wb') as file:
+            def synced():
+                file.write(record)
+                file.flush()
+                os.fsync(file.fileno())
+            each = per_call(synced,1000)
+        print(f"  journaled: {1e6*journaled/n:.2f} us an edit, in {autosave.journal.syncs} syncs ({size/n:.0f} bytes an edit); "
+              f"writing and syncing each as made: {1e3*each:.0f} us an edit")
+        journal = savefile.Journal(path + '.journal')
+        start = time.perf_counter()
+        read = sum(1 for record in journal.read())
+        reading = time.perf_counter() - start
+        replayed = game.Page(screen,['treble','bass'])
+        start = time.perf_counter()
+        count, notes = replayed.replay(savefile.Journal(path + '.journal').read())
+        replaying = time.perf_counter() - start
+        same = [[eachnote.kept() for eachnote in eachstaff.notes] for eachstaff in replayed.written()] == expected
+        print(f"  replayed {count} edits in {replaying:.2f} s ({1e6*replaying/count:.1f} us an edit; {1e6*reading/read:.1f} us of that reading them); "
+              f"every note as edited: {same}")
+        autosave.page, autosave.journal = replayed, journal
+        gc.collect() # So that the garbage of replaying, collected whenever it may be, is not counted here.
+        start = time.perf_counter()
+        autosave.compact()
+        begun = time.perf_counter() - start
+        autosave.finish(wait=True)
+        compacted = time.perf_counter() - start
+        print(f"  saved whole in {1000*compacted:.0f} ms ({sum(replayed.count(s) for s in range(len(replayed.staves)))} notes), the game waiting {1000*begun:.0f} ms of it; "
+              f"journal left: {len(journal.segments())} segments")
+
+BENCHMARKS = {
+    'staff_background':bench_staff_background,
+    'glyph_cache':bench_glyph_cache,
+    'note_sprites':bench_note_sprites,
+    'text_layout':bench_text_layout,
+    'startup':bench_startup,
+    'hit_test':bench_hit_test,
+    'note_store':bench_note_store,
+    'beam_redraw':bench_beam_redraw,
+    'score_compile':bench_score_compile,
+    'ornaments':bench_ornaments,
+    'midi_export':bench_midi_export,
+    'incremental_export':bench_incremental_export,
+    'multitrack_export':bench_multitrack_export,
+    'export_cache':bench_export_cache,
+    'background_export':bench_background_export,
+    'render_wav':bench_render_wav,
+    'streaming_playback':bench_streaming_playback,
+    'audition_latency':bench_audition_latency,
+    'scrolling':bench_scrolling,
+    'note_memory':bench_note_memory,
+    'save_and_open':bench_save_and_open,
+    'autosave':bench_autosave,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            sys.exit(f"Unknown benchmark {name!r}; choose from {', '.join(BENCHMARKS)}.")
+    game = load_game()
+    for name in names:
+        BENCHMARKS[name](game)
@@ -0,0 +1,337 @@
+# Checks for Elisabeth and the Music Maker.
+#
+# Where benchmarks.py times the game, these make sure that what is made faster still comes out the
+# same, each in a second or two, failing (with an AssertionError, and the script with it) at the first
+# thing that does not.  A check that cannot be made here says why, and is skipped.  Run all of them with
+#   python checks.py
+# or only some of them by name, e.g.
+#   python checks.py save_and_open
+import os
+import sys
+import tempfile
+import savefile
+from benchmarks import load_game, make_staff
+
+# Saving a piece and opening it again (see savefile.py): every note must come back just as it was - its
+# time, duration, pitch, accidental, agrément, orientation and the order it was placed in - whether
+# the staff it is on is read whole or only in part, and saving it again must make the very same file.
+# The piece has notes erased, leaving gaps in the order they were placed in, and notes placed since in
+# the rows those left free, so that the rows of a staff's notes are not in their order.
+def check_save_and_open(game):
+    import random
+    rng = random.Random(1)
+    fields = lambda note: (note.time,note.duration,note.pitch,note.accidental,note.agrement,note.orientation,note.seq)
+    screen = make_staff(game).screen
+    page = game.Page(screen,['treble','bass'],'three')
+    accidentals, agrements = ['','sharp','flat'], ['']+list(game.AGREMENT_DICT)
+    def place(eachstaff):
+        note = game.Note(eachstaff,(rng.randrange(game.MEASURES_PER)+1,rng.randrange(12)/4+1),rng.choice([0.0625,0.09375,0.125,0.1875,0.25,0.375,0.5,1]),
+                         'cdefgab'[rng.randrange(7)]+str(rng.randrange(1,7)),rng.choice(accidentals),rng.choice(agrements),rng.random() < 0.5)
+        if eachstaff.position is not None:
+            note.set_position()
+        eachstaff.add_note(note)
+        return note
+    staves = 4*game.SYSTEMS*game.STAVES_PER # The first page in view, and three more out of it
+    for s in range(staves):
+        eachstaff = page.staff(s)
+        for k in range(40):
+            place(eachstaff)
+        for note in rng.sample(list(eachstaff.notes),15):
+            eachstaff.remove_note(note)
+        for k in range(10):
+            place(eachstaff)
+    page.staff(staves) # A staff left empty, after the last with notes
+    assert any([note.row for note in eachstaff.notes] != sorted(note.row for note in eachstaff.notes) for eachstaff in page.written()), "no rows were handed out again"
+    assert any(max(note.seq for note in eachstaff.notes) - min(note.seq for note in eachstaff.notes) >= len(eachstaff.notes) for eachstaff in page.written()), "no gaps in seq"
+    page.scroll_to(1)
+    expected = [(eachstaff.clef,eachstaff.timename,[fields(note) for note in eachstaff.notes]) for eachstaff in page.written()]
+    with tempfile.TemporaryDirectory() as folder:
+        path, again = os.path.join(folder,'piece.score'), os.path.join(folder,'again.score')
+        page.save(path)
+        saved = open(path,'rb').read()
+        written = savefile.SavedScore(path) # Each staff's notes in the order the staff keeps them
+        for s, eachstaff in enumerate(page.written()):
+            assert list(written.columns(s)['seq']) == [note.seq for note in eachstaff.notes], f"staff {s} was saved out of order"
+        written.close()
+        opened = game.open_page(screen,path)
+        assert opened.top == 1 and opened.timename == 'three' and opened.clefs == ['treble','bass']
+        assert sum(eachstaff is not None for eachstaff in opened.staves) == len(opened.shown), "staves out of view were read"
+        opened.save(again) # Having read only the staves in view
+        assert open(again,'rb').read() == saved, "saving again, read in part, made another file"
+        opened = game.open_page(screen,path)
+        got = [(eachstaff.clef,eachstaff.timename,[fields(note) for note in eachstaff.notes]) for eachstaff in opened.written()]
+        assert len(got) == len(expected)
+        for s, (was, now) in enumerate(zip(expected,got)):
+            assert was == now, f"staff {s} came back otherwise: {was} against {now}"
+        opened.save(path) # Over the very file it was opened from
+        assert open(path,'rb').read() == saved, "saving again, read whole, made another file"
+        for eachstaff in opened.written(): # Notes placed now come after those placed before.
+            seqs = [note.seq for note in eachstaff.notes]
+            assert place(eachstaff).seq > max(seqs,default=-1)
+
+# Replaying the journal (see Autosave): a piece edited after it was saved - notes placed, changed by
+# clicks, erased and others placed in the rows they left free, the time signature and a clef set, over
+# two segments of the journal - must come back, from the piece saved and the journal beside it, just
+# as it was left.  A last record cut short, or with the wrong checksum, must be left out and nothing
+# else; and a segment that is not a journal must be kept aside as .bad, the rest replayed all the same.
+def check_journal_replay(game):
+    import random
+    rng = random.Random(3)
+    fields = lambda note: (note.time,note.duration,note.pitch,note.accidental,note.agrement,note.orientation,note.seq)
+    state = lambda page: (page.timename,list(page.clefs),[(eachstaff.clef,[fields(note) for note in eachstaff.notes]) for eachstaff in page.written()])
+    screen = make_staff(game).screen
+    def place(eachstaff):
+        note = game.Note(eachstaff,(rng.randrange(game.MEASURES_PER)+1,rng.randrange(4)+1.0),rng.choice([0.0625,0.125,0.25,0.5]),
+                         'cdefgab'[rng.randrange(7)]+str(rng.randrange(3,6)),rng.choice(['','sharp']),rng.choice(['','pince','mordent']),rng.random() < 0.5)
+        if eachstaff.position is not None:
+            note.set_position()
+        eachstaff.add_note(note)
+        return note
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder,'piece.score')
+        page = game.Page(screen,['treble','bass'],'common')
+        staves = 2*game.SYSTEMS*game.STAVES_PER # Those in view, and as many out of it
+        for s in range(staves):
+            for k in range(20):
+                place(page.staff(s))
+        page.save(path)
+        autosave = game.Autosave(interval=3600,longest=2**40) # Written out only as it is closed, and never saved whole
+        autosave.start(page,path)
+        def edited(eachstaff,note):
+            eachstaff.edited = note
+            autosave.edited(eachstaff)
+        def edit(eachstaff):
+            notes = list(eachstaff.notes)
+            if eachstaff.position is not None: # Clicked, as the player would
+                for function in rng.sample(['sharp','flat','dot','inverse','eraser','cadence','double','tremblement'],3):
+                    eachstaff.feel_click(rng.choice(notes).rect.center,function)
+                    autosave.edited(eachstaff)
+            for note in rng.sample(notes,5):
+                eachstaff.remove_note(note)
+                edited(eachstaff,note)
+            for k in range(5): # In the rows those erased left free
+                edited(eachstaff,place(eachstaff))
+        for s in range(staves):
+            edit(page.staff(s))
+        autosave.journal.cut() # The records from here on go to a segment of their own.
+        page.change_time('three')
+        autosave.time('three')
+        page.change_clef(1,'cclef')
+        autosave.clef(1,'cclef')
+        for s in range(staves):
+            edit(page.staff(s))
+        for s in range(staves,staves+2): # And two staves more, made since it was saved
+            for k in range(6):
+                edited(page.staff(s),place(page.staff(s)))
+        assert any([note.row for note in eachstaff.notes] != sorted(note.row for note in eachstaff.notes) for eachstaff in page.written()), "no rows were handed out again"
+        before = state(page)
+        edited(page.staff(0),place(page.staff(0))) # The last record, to be cut short or spoilt below
+        after = state(page)
+        records = autosave.journal.records
+        autosave.journal.close()
+        assert len(autosave.journal.segments()) == 2
+        last = autosave.journal.named(autosave.journal.segments()[-1])
+        def replayed(count):
+            opened = game.open_page(screen,path)
+            again = game.Autosave(interval=3600,longest=2**40)
+            again.start(opened,path)
+            again.journal.close()
+            assert again.replayed == count, f"{again.replayed} edits replayed, not {count}"
+            return state(opened)
+        assert replayed(records) == after, "the piece replayed is not the piece left"
+        with open(last,'r+b') as segment: # The last record's checksum spoilt
+            segment.seek(-1,os.SEEK_END)
+            byte = segment.read(1)
+            segment.seek(-1,os.SEEK_END)
+            segment.write(bytes([byte[0] ^ 0xff]))
+        assert replayed(records-1) == before, "a record with the wrong checksum was not left out alone"
+        with open(last,'r+b') as segment: # The last record cut short, as by a crash while it was written
+            segment.truncate(os.path.getsize(last) - savefile.RECORD_SIZE//2)
+        assert replayed(records-1) == before, "a record cut short was not left out alone"
+        bad = autosave.journal.named(autosave.journal.segments()[-1]+1)
+        with open(bad,'wb') as segment:
+            segment.write(b'not a journal at all, but long enough to be read as one')
+        assert replayed(records-1) == before, "a segment that is not a journal spoilt the replay"
+        assert os.path.exists(bad + '.bad') and not os.path.exists(bad), "a segment that is not a journal was not kept aside"
+
+# Finding the note under a click with the staff's index (see Staff.note_at()): it must be the very note
+# going through every note in order finds, as the game used to, wherever the click - on a staff of
+# notes strewn about it, before and after they are turned, dotted, erased and placed by clicks.
+def check_hit_test(game):
+    import random
+    from benchmarks import fill_random
+    rng = random.Random(4)
+    eachstaff = make_staff(game)
+    fill_random(game,eachstaff,2000,seed=4)
+    area = eachstaff.rect
+    def scanned(point):
+        for eachnote in eachstaff.notes:
+            if eachnote.rect.collidepoint(point):
+                return eachnote
+        return None
+    def compare(when):
+        notes = list(eachstaff.notes)
+        points = [(rng.randrange(area.left,area.right),rng.randrange(area.top,area.bottom)) for k in range(2000)]
+        points += [rng.choice([note.rect.center,note.rect.topleft,(note.rect.right-1,note.rect.bottom-1),note.rect.bottomright]) for note in rng.sample(notes,500)]
+        for point in points:
+            found, expected = eachstaff.note_at(point), scanned(point)
+            assert found is expected, f"{when}, a click at {point} found {found and found.time} rather than {expected and expected.time}"
+    compare("as placed")
+    for k in range(300):
+        point = rng.choice([note.rect.center for note in eachstaff.notes] + [(rng.randrange(area.left,area.right),rng.randrange(area.top,area.bottom))])
+        eachstaff.feel_click(point,rng.choice(['inverse','dot','eraser','eraser','quarter','eighth','half']))
+    compare("after clicks")
+
+# Keeping a staff's notes in a NoteList (see Staff.add_note()): they must be in the order a plain list
+# sorted by time, then by the order they were placed in, would hold them, as the game used to keep
+# them - with the notes of each beat and measure, and each note's neighbours, found the same way -
+# as thousands of notes (many blocks of them) are placed one at a time, half of them erased at random
+# and more placed, and after the time signature changes and they are put in order anew.
+def check_note_store(game):
+    import random
+    from benchmarks import fill_random
+    rng = random.Random(5)
+    eachstaff = make_staff(game)
+    def compare(when):
+        notes = list(eachstaff.notes)
+        expected = sorted(notes,key=lambda note: (eachstaff.time_a_note(note),note.seq))
+        assert notes == expected, f"{when}, the notes are out of order"
+        assert len(eachstaff.notes) == len(expected)
+        for beat in range(eachstaff.timesig[0]+1,(game.MEASURES_PER+1)*eachstaff.timesig[0]+1):
+            assert eachstaff.beat_notes(beat) == [note for note in expected if eachstaff.time_a_note(note)//1 == beat], f"{when}, beat {beat} holds other notes"
+        for measure in range(1,game.MEASURES_PER+1):
+            assert eachstaff.measure_notes(measure) == [note for note in expected if note.time[0] == measure], f"{when}, measure {measure} holds other notes"
+        for k in rng.sample(range(len(expected)),min(len(expected),300)):
+            before, after = expected[k-1] if k > 0 else None, expected[k+1] if k+1 < len(expected) else None
+            assert eachstaff.notes.neighbours(expected[k]) == (before,after), f"{when}, note {k} has other neighbours"
+    fill_random(game,eachstaff,3000,seed=5)
+    compare("as placed")
+    for note in rng.sample(list(eachstaff.notes),1500):
+        eachstaff.remove_note(note)
+    compare("after erasing")
+    fill_random(game,eachstaff,1000,seed=6)
+    compare("after placing more")
+    eachstaff.change_time('three')
+    compare("after the time signature changed")
+
+# Drawing again only what an edit touched, with the beams of the other beats kept (see
+# Staff.forget_beams()), as the game does after each click: the screen must come out the same, pixel for
+# pixel, as drawing the whole staff afresh, with every beam worked out anew, after each of many clicks
+# on a staff dense with beamed sixteenths and eighths.
+def check_beam_redraw(game):
+    import pygame
+    import random
+    from benchmarks import fill_sixteenths
+    rng = random.Random(6)
+    eachstaff = make_staff(game)
+    screen = eachstaff.screen
+    fill_sixteenths(game,eachstaff,4)
+    def whole():
+        screen.fill(game.PAPER_COLOR)
+        eachstaff.beams.clear()
+        eachstaff.generate_image()
+        return pygame.image.tobytes(screen,'RGB')
+    whole()
+    for k in range(60):
+        function = rng.choice(['inverse','dot','eraser','sharp','pince','sixteenth','eighth','quarter'])
+        point = rng.choice([note.rect.center for note in eachstaff.notes])
+        if function in game.NOTE_TIME_DICT: # Placed on the staff, rather than on a note
+            point = (rng.randrange(eachstaff.rect.left+3*game.STAFF_HEIGHT,eachstaff.rect.right),rng.randrange(eachstaff.rect.top,eachstaff.rect.bottom))
+        change = eachstaff.feel_click(point,function)
+        if change is None:
+            continue
+        area, dirty = change # Drawn again as redraw_staff_paper() in the game does
+        while True:
+            pygame.draw.rect(screen,game.PAPER_COLOR,area)
+            eachstaff.generate_image(area,dirty)
+            reach = area.unionall([eachnote.inked for eachnote in dirty])
+            if area.contains(reach):
+                break
+            area = reach
+        partial = pygame.image.tobytes(screen,'RGB')
+        assert partial == whole(), f"click {k} ({function} at {point}) left other pixels than drawing the staff afresh"
+
+# Realizing the agréments of a score from the table of ornaments in score.py: the notes played must be
+# identical to those the if/elif branches output_music() used to have would play (see
+# realized_one_by_one()), on a score where every note has one and on one where only some do (so that
+# the ornaments that look to the notes around them, the doublé and port de voix, meet plain ones too).
+def check_ornaments(game):
+    from benchmarks import random_score, realized_one_by_one
+    for seed, ornamented in [(4,1.0),(5,0.3)]:
+        music = random_score(12000,seed=seed,ornamented=ornamented)
+        played = [tuple(event) for event in music.compile()[['onset','duration','pitch']].tolist()]
+        expected = realized_one_by_one(music)
+        assert len(played) == len(expected), f"{len(played)} notes played against {len(expected)} before"
+        for k, (now, was) in enumerate(zip(played,expected)):
+            assert now == was, f"note {k} played otherwise: {now} against {was}"
+
+# Writing a score's MIDI file (see score.write_midi()): it must be byte for byte the file midiutil
+# writes for the same notes, as the game's used to be, whether it is given each staff's compiled
+# notes (as the game gives them) or all at once, and whether the notes are on one track or many.
+# Skipped where midiutil is not installed.
+def check_midi_export(game):
+    import io
+    import score
+    from benchmarks import melodic_score, paged_score, written_by_midiutil
+    try:
+        import midiutil
+    except ImportError:
+        return "skipped, as midiutil is not installed"
+    tracked = score.Score()
+    for track, (offset, notes, _) in enumerate(melodic_score(12000,seed=7).staves):
+        tracked.add_columns(offset,notes,track % 3)
+    for name, music in [('paged',paged_score(20000)),('on three tracks',tracked)]:
+        streams = music.compile_staves()
+        expected = io.BytesIO()
+        written_by_midiutil(score.merge(streams),expected,90)
+        for given in [streams,music.compile()]:
+            output_file = io.BytesIO()
+            score.write_midi(given,output_file,90)
+            written, was = output_file.getvalue(), expected.getvalue()
+            differs = next((k for k, (a, b) in enumerate(zip(written,was)) if a != b),min(len(written),len(was)))
+            assert written == was, f"the {name} score's file differs from midiutil's at byte {differs} of {len(was)}"
+
+# Drawing notes with their parts copied from the sprite atlas (see NoteSprites): the staff must come out
+# the same, pixel for pixel, as with every part drawn in place - on a staff with one of every kind of
+# note and beamed sixteenths, and on staves of notes strewn about it, with stems of every length.
+def check_note_sprites(game):
+    import pygame
+    from benchmarks import fill_assorted, fill_random, fill_sixteenths
+    staves = [make_staff(game,0),make_staff(game,1),make_staff(game,2)]
+    fill_assorted(game,staves[0])
+    fill_sixteenths(game,staves[0])
+    fill_random(game,staves[1],60,seed=1)
+    fill_random(game,staves[2],200,seed=2)
+    def drawn(eachstaff):
+        eachstaff.generate_image()
+        return pygame.image.tobytes(eachstaff.screen.subsurface(eachstaff.inked.clip(eachstaff.screen.get_rect())),'RGB')
+    try:
+        for s, eachstaff in enumerate(staves):
+            game.NOTE_SPRITES.enabled = False
+            in_place = drawn(eachstaff)
+            game.NOTE_SPRITES.enabled = True
+            copied = drawn(eachstaff)
+            differing = sum(in_place[i:i+3] != copied[i:i+3] for i in range(0,len(in_place),3))
+            assert differing == 0, f"staff {s}: {differing} pixels differ between notes drawn in place and copied from the atlas"
+    finally:
+        game.NOTE_SPRITES.enabled = True
+
+CHECKS = {
+    'save_and_open':check_save_and_open,
+    'journal_replay':check_journal_replay,
+    'hit_test':check_hit_test,
+    'note_store':check_note_store,
+    'beam_redraw':check_beam_redraw,
+    'ornaments':check_ornaments,
+    'midi_export':check_midi_export,
+    'note_sprites':check_note_sprites,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(CHECKS)
+    for name in names:
+        if name not in CHECKS:
+            sys.exit(f"Unknown check {name!r}; choose from {', '.join(CHECKS)}.")
+    game = load_game()
+    for name in names:
+        print(f"{name}: {CHECKS[name](game) or 'ok'}")
@@ -0,0 +1,122 @@
+# The harpsichord of Elisabeth and the Music Maker, played without any MIDI player.
+#
+# The notes played (an array of score.EVENT, as Score.compile() makes them) are rendered here as the
+# sound of a plucked string, a block of samples at a time, so that how much memory it takes depends
+# on the block and not on the length of the piece; write_wav() writes them to a WAV file as they
+# are rendered.  Nothing here needs pygame, a window or a sound card, so a piece can be rendered,
+# checked and timed anywhere, e.g. by benchmarks.py.
+import wave
+import numpy
+
+SAMPLE_RATE = 44100
+BLOCK = 4096 # How many samples are rendered at a time
+
+###############################################################################
+## A harpsichord's string is plucked by a quill, rather than struck by a hammer
+## as a piano's is, and the player has no say over how hard; what is heard is
+## the string ringing and dying away, until the key is let go and the damper
+## stops it.  It is rendered here as the sum of the string's harmonics.  A string
+## plucked a little way from its end sounds each harmonic as loud as the sine of
+## where along the string it is plucked, over the harmonic's number, which gives
+## the instrument its bright, nasal tone; the higher harmonics die away sooner,
+## and the lower strings ring longer than the higher.
+###############################################################################
+HARMONICS = 16 # Most harmonics sounded of each note (fewer, for those above half the sample rate)
+PLUCKED_AT = 0.13 # How far along the string the quill plucks it
+ATTACK = 0.002 # Seconds the pluck takes to sound fully
+RING = 4.0 # Seconds for middle C to die away to about a third, once plucked
+RING_HARMONIC = 0.35 # How much sooner each harmonic dies away than the one below it
+RELEASE = 0.04 # Seconds for the damper to bring a string to about a third, once the key is let go
+TAIL = 8 # How many times RELEASE a note is rendered for after it is let go (after which it is unheard)
+GAIN = 0.25 # How loud each note is, before all are softly limited to the loudest a sample can be
+
+# This function gives the frequency, in Hertz, of a MIDI pitch.
+def frequency(pitch):
+    return 440*2**((pitch-69)/12)
+
+# This class - harpsichord - plays the notes given it (as Score.compile() makes them, at the given
+# tempo in beats a minute), rendering any stretch of samples asked for.  Stretches are best asked for
+# in order (as render() does), since it keeps track of the notes sounding as it goes.
+class Harpsichord():
+    def __init__(self,events,tempo,sample_rate=SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        order = numpy.argsort(events['onset'],kind='stable')
+        self.start = events['onset'][order]*(60/tempo) # When each note is plucked, in seconds, in order
+        self.held = events['duration'][order]*(60/tempo) # How long each is held
+        self.pitch = events['pitch'][order].astype(numpy.float64)
+        self.stop = self.start + self.held + TAIL*RELEASE # When each is no longer heard
+        self.length = int(numpy.ceil(self.stop.max()*sample_rate)) if len(events) else 0 # Samples in the piece
+        self.longest = float((self.stop - self.start).max()) if len(events) else 0.0 # Longest any note is heard for
+        self.sounding = numpy.zeros(0,dtype=numpy.int64) # The notes sounding at the last sample rendered
+        self.plucked = 0 # How many notes had been plucked by then
+        self.position = 0 # The sample after the last rendered
+
+    # This method returns the samples from first up to first+count, as floats from -1 to 1.  The notes
+    # sounding are those sounding at the last stretch, and those plucked since, that are still heard;
+    # going back, they are looked for again among those plucked within the longest a note is heard.
+    def samples(self,first,count):
+        begin, end = first/self.sample_rate, (first+count)/self.sample_rate
+        plucked = int(numpy.searchsorted(self.start,end))
+        if first < self.position:
+            candidates = numpy.arange(int(numpy.searchsorted(self.start,begin - self.longest)),plucked)
+        else:
+            candidates = numpy.concatenate([self.sounding,numpy.arange(self.plucked,plucked)])
+        self.sounding = candidates[self.stop[candidates] > begin]
+        self.plucked = plucked
+        self.position = first + count
+        if not len(self.sounding):
+            return numpy.zeros(count)
+        t = numpy.arange(first,first+count)/self.sample_rate
+        return numpy.tanh(self.sum_strings(self.sounding,t)) # Softly limited, should many notes sound at once
+
+    # This method returns the sum of the given notes' strings at the times t (in seconds).  Each harmonic
+    # is worked out from the one below it: its sine by sin(kx) = 2cos(x)sin((k-1)x) - sin((k-2)x), and
+    # its dying away by multiplying the last's by how much faster it dies, so that the only sines and
+    # exponentials taken are those of the fundamental.  Times are kept to double precision only until
+    # they are made into each string's phase; the rest is single precision, which is twice as fast.
+    def sum_strings(self,notes,t):
+        since = t[None,:] - self.start[notes,None] # Seconds since each was plucked
+        heard = (since >= 0) & (t[None,:] < self.stop[notes,None])
+        f = frequency(self.pitch[notes])[:,None]
+        x = (2*numpy.pi*numpy.mod(f*since,1)).astype(numpy.float32)
+        since = numpy.maximum(since,0).astype(numpy.float32)
+        rate = ((frequency(60)/f)**0.5/RING).astype(numpy.float32) # Lower strings ring longer.
+        envelope = GAIN*numpy.minimum(since/ATTACK,1)*numpy.exp(-since*rate)
+        let_go = numpy.maximum(since - self.held[notes,None].astype(numpy.float32),0)
+        envelope *= numpy.exp(-let_go/RELEASE)*heard
+        harmonic_fades = numpy.exp(-since*rate*RING_HARMONIC)
+        sine, before = numpy.sin(x), numpy.zeros_like(x)
+        twice_cos = 2*numpy.cos(x)
+        total = numpy.zeros_like(x)
+        for k in range(1,HARMONICS+1):
+            below_nyquist = k*f[:,0] < self.sample_rate/2
+            if not below_nyquist.any():
+                break
+            total += (below_nyquist*abs(numpy.sin(numpy.pi*k*PLUCKED_AT))/k).astype(numpy.float32)[:,None]*envelope*sine
+            sine, before = twice_cos*sine - before, sine
+            envelope *= harmonic_fades
+        return total.sum(axis=0,dtype=numpy.float64)
+
+# This function yields the whole piece a block of samples at a time, as floats from -1 to 1.
+def render(events,tempo,sample_rate=SAMPLE_RATE,block=BLOCK):
+    harpsichord = Harpsichord(events,tempo,sample_rate)
+    for first in range(0,harpsichord.length,block):
+        yield harpsichord.samples(first,min(block,harpsichord.length-first))
+
+# This function writes the notes played (as Score.compile() makes them), at the given tempo, to a WAV
+# file (a path, or a file open for writing in bytes) of 16-bit samples, one channel, a block at a time.
+def write_wav(events,output_file,tempo,sample_rate=SAMPLE_RATE,block=BLOCK):
+    with wave.open(output_file,'wb') as wavfile:
+        wavfile.setnchannels(1)
+        wavfile.setsampwidth(2)
+        wavfile.setframerate(sample_rate)
+        for samples in render(events,tempo,sample_rate,block):
+            wavfile.writeframes(pcm(samples))
+
+# This function returns samples (floats from -1 to 1) as 16-bit little-endian PCM, as WAV files and
+# the mixer take them, with each sample repeated for as many channels as are given.
+def pcm(samples,channels=1):
+    samples = (samples*32767).astype('<i2')
+    if channels > 1:
+        samples = numpy.repeat(samples[:,None],channels,axis=1)
+    return samples.tobytes()
@@ -0,0 +1,295 @@
+# The saved scores of Elisabeth and the Music Maker.
+#
+# A score is saved as a fixed header (HEADER, below: the version of the format, how the staves are
+# laid out, the time signature, the clef of each staff of a system, the system in view, and how many
+# staves and notes there are), then where each staff's notes begin and how many there are (STAFF,
+# for each staff in order), then the notes' columns (COLUMNS), each whole, as the game keeps them in
+# its NoteTables, every staff's notes in order one after another.  All are little-endian.
+#
+# A file is opened by mapping it into memory, so that nothing of it is read until it is asked for:
+# a staff's notes are read only as the staff is made (as the game does when it comes into view), and
+# opening even a very long score takes no longer than opening a short one.
+#
+# What is done to a score after it is saved is kept in a journal (see Journal, below), a file of small
+# records, one an edit, only ever added to, from which the score is made again should the game be
+# closed before it is saved.  Nothing here needs pygame.
+import os
+import sys
+import mmap
+import array
+import struct
+import zlib
+import threading
+import numpy
+
+MAGIC = b'ELISABTH'
+VERSION = 1 # Changed whenever the format is, so that a file saved in another is not misread
+CLEFS = 8 # Most staves in a system, for which the header has room
+# The header: MAGIC, VERSION, staves a system, measures a staff, systems in view, the time signature's
+# name, each clef's name, the system in view, and how many staves and notes there are.
+HEADER = struct.Struct('<8sHHHH16s' + '8s'*CLEFS + 'QQQ8x')
+STAFF = struct.Struct('<QQ') # The first note of a staff, and how many notes it has
+COLUMNS = (('measure','d'),('beat','d'),('duration','d'),('seq','q'), # Each column of the notes, and its array typecode;
+           ('rung','h'),('accidental','B'),('agrement','B'),('orientation','B')) # the widest first, so each is aligned.
+ROW = sum(array.array(code).itemsize for name, code in COLUMNS) # The bytes each note takes
+
+# This function writes a score to a file, and syncs it to the disk: its time signature and clefs (by
+# name), its layout (staves a system, measures a staff and systems in view), the system in view, and
+# its staves.  Each staff is given as its columns (each an array, by name, as a NoteTable keeps them)
+# and the rows of its notes in order, or None for every row in order, or a function returning them
+# from the columns; or as a SavedScore and the staff's place in it.  Nothing is read from either of
+# those until it is written.
+def write(path,timename,clefs,layout,top,staves):
+    if len(clefs) > CLEFS:
+        raise ValueError(f"a score may have at most {CLEFS} staves a system, not {len(clefs)}")
+    staves = [(columns.columns(rows),None) if isinstance(columns,SavedScore) else (columns,rows) for columns, rows in staves]
+    rows = [numpy.array(eachrows(columns) if callable(eachrows) else eachrows,dtype=numpy.intp) if eachrows is not None else None
+            for columns, eachrows in staves]
+    counts = numpy.array([len(eachrows) if eachrows is not None else len(columns['seq']) for (columns, _), eachrows in zip(staves,rows)],dtype='<u8')
+    directory = numpy.zeros((len(staves),2),dtype='<u8')
+    directory[:,0] = numpy.cumsum(counts) - counts
+    directory[:,1] = counts
+    names = [clef.encode() for clef in clefs] + [b'']*(CLEFS-len(clefs))
+    header = HEADER.pack(MAGIC,VERSION,*layout,timename.encode(),*names,top,len(staves),int(counts.sum()))
+    with open(path,'wb') as file:
+        file.write(header)
+        file.write(directory.tobytes())
+        for name, code in COLUMNS:
+            dtype = numpy.dtype(code)
+            for (columns, _), eachrows, count in zip(staves,rows,counts):
+                if count:
+                    column = numpy.frombuffer(columns[name],dtype=dtype)
+                    if eachrows is not None:
+                        column = column[eachrows]
+                    file.write(column.astype(dtype.newbyteorder('<')).tobytes())
+        file.flush()
+        os.fsync(file.fileno()) # So that it is whole on the disk before it takes the place of the last
+
+# This function returns the rows of a NoteTable's notes in the order its staff keeps them - by when they
+# are played (the measure times 'beats' a measure, plus the beat), then by seq - given its columns and
+# the rows free in it; every other row holds a note.
+def ordered(columns,free,beats):
+    kept = numpy.ones(len(columns['seq']),dtype=bool)
+    kept[free] = False
+    rows = numpy.flatnonzero(kept)
+    when = numpy.frombuffer(columns['measure'],dtype=numpy.float64)[rows]*beats + numpy.frombuffer(columns['beat'],dtype=numpy.float64)[rows]
+    return rows[numpy.lexsort((numpy.frombuffer(columns['seq'],dtype=numpy.int64)[rows],when))]
+
+# This class - saved score - is a score opened from a file written by write().  Its header is read at
+# once; each staff's notes are read only when columns() is asked for them.
+class SavedScore():
+    def __init__(self,path):
+        self.path = path
+        with open(path,'rb') as file:
+            if os.fstat(file.fileno()).st_size < HEADER.size:
+                raise ValueError(f"{path} is not a saved score")
+            self.map = mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ)
+        try:
+            magic, version, *fields = HEADER.unpack_from(self.map)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a saved score")
+            if version != VERSION:
+                raise ValueError(f"{path} was saved in version {version} of the format, not {VERSION}")
+            self.staves_per, self.measures_per, self.systems = fields[:3] # The layout it was saved in
+            self.timename = fields[3].rstrip(b'\0').decode() # Its time signature
+            self.clefs = [name.rstrip(b'\0').decode() for name in fields[4:4+self.staves_per]] # The clef of each staff of a system
+            self.top, self.staves, self.notes = fields[4+CLEFS:] # The system in view, and how many staves and notes
+            if self.staves_per > CLEFS or len(self.map) != HEADER.size + STAFF.size*self.staves + ROW*self.notes:
+                raise ValueError(f"{path} is not whole")
+        except ValueError:
+            self.map.close()
+            raise
+        self.offsets = {} # Where each column begins
+        offset = HEADER.size + STAFF.size*self.staves
+        for name, code in COLUMNS:
+            self.offsets[name] = offset
+            offset += array.array(code).itemsize*self.notes
+
+    # This method returns the first note of the sth staff (from 0), and how many notes it has.
+    def counts(self,s):
+        return STAFF.unpack_from(self.map,HEADER.size + STAFF.size*s)
+
+    # This method reads the notes of the sth staff, returning each column (by name) as an array, as the
+    # game's NoteTable keeps it, with the staff's notes in order.
+    def columns(self,s):
+        first, count = self.counts(s)
+        columns = {}
+        for name, code in COLUMNS:
+            column = array.array(code)
+            start = self.offsets[name] + column.itemsize*first
+            column.frombytes(self.map[start:start+column.itemsize*count])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            columns[name] = column
+        return columns
+
+    def close(self):
+        self.map.close()
+
+JOURNAL_MAGIC = b'ELISJRNL'
+JOURNAL_VERSION = 1
+JOURNAL_HEADER = struct.Struct('<8sH6x') # JOURNAL_MAGIC, JOURNAL_VERSION
+# Each record: its kind (below), a code (of the time signature or clef set), the staff (or, for a clef,
+# which staff of a system), and a note's values, in the order of COLUMNS; then a checksum of all that,
+# so that a record only partly written as the game was closed is known for one.
+RECORD = struct.Struct('<BBxxIdddqhBBBx')
+CHECKSUM = struct.Struct('<I')
+RECORD_SIZE = RECORD.size + CHECKSUM.size
+NOTE, ERASED, TIME, CLEF = 1, 2, 3, 4 # A note placed or changed (as it now is), or erased; the time signature or a clef set
+NO_VALUES = (0.0,0.0,0.0,0,0,0,0,0)
+
+# This class - journal - is the journal of the edits to a score since it was last saved.  Each record
+# says how the score is after the edit (the note as it now is, the clef now set), not what was done,
+# so that replaying one where it was already made changes nothing: should the game be closed after
+# saving a score but before forgetting the journal saved with it, that is replayed onto it harmlessly.
+# Records are added to memory only; a thread of the journal's own writes them out and syncs them to
+# the disk every 'interval' seconds, so that whoever adds them never waits on the disk, and the disk
+# is synced once for all the edits made in that time rather than once for each.
+#
+# The journal is kept in segments, files named 'path' and a number, replayed in order.  Whenever the
+# score is to be saved, the journal is cut (see cut()): the records added from then on go to a new
+# segment, and those before are forgotten only once the score saved with them has taken its place,
+# so that the score may be written out in the background while it is still being edited.
+class Journal():
+    def __init__(self,path,interval=0.25):
+        self.path = path
+        self.interval = interval # Most seconds a record waits to be written out
+        self.lock = threading.Lock() # Held while records are added to those waiting
+        self.writing = threading.Lock() # Held while they are written out, so that they are written in order
+        self.waiting = [] # The records added and not yet written out, as the segment for them and their bytes
+        self.segment = None # The segment records added now go to (see read())
+        self.file = None # The segment being written out, once there is anything to write to it
+        self.number = None # Its number
+        self.closed = threading.Event()
+        self.thread = None
+        self.bytes = 0 # Bytes of records since the journal was last cut, written out or not
+        self.records = 0 # Records added
+        self.syncs = 0 # Times the file was synced to the disk
+
+    # This method returns the file of the nth segment.
+    def named(self,n):
+        return f"{self.path}.{n}"
+
+    # This method returns the numbers of the segments on the disk, in order.
+    def segments(self):
+        folder, name = os.path.split(self.path)
+        numbers = [each[len(name)+1:] for each in os.listdir(folder or '.') if each.startswith(name + '.')]
+        return sorted(int(number) for number in numbers if number.isdigit())
+
+    # This method yields the records of the journal, as (kind, staff, code, values), segment by segment,
+    # each up to its first record not wholly written.  Records added afterwards go to a new segment
+    # after them all, so that none is ever added to.  A file that is not a segment of a journal of this
+    # version is moved aside.
+    def read(self):
+        numbers = self.segments()
+        self.segment = numbers[-1] + 1 if numbers else 1
+        for number in numbers:
+            path = self.named(number)
+            with open(path,'rb') as file:
+                data = file.read()
+            if len(data) < JOURNAL_HEADER.size: # Begun, but nothing yet written to it
+                continue
+            magic, version = JOURNAL_HEADER.unpack_from(data)
+            if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION: # Kept aside, rather than written over.
+                os.replace(path,path + '.bad')
+                print(f"{path} is not a journal of this version, and was not replayed; it is kept as {path}.bad",file=sys.stderr)
+                continue
+            for start in range(JOURNAL_HEADER.size,len(data)-RECORD_SIZE+1,RECORD_SIZE):
+                record = data[start:start+RECORD.size]
+                if zlib.crc32(record) != CHECKSUM.unpack_from(data,start+RECORD.size)[0]:
+                    break
+                kind, code, staff, *values = RECORD.unpack(record)
+                self.bytes += RECORD_SIZE
+                yield kind, staff, code, values
+
+    # This method adds a record to the journal: of the given kind, for a staff, with a code or the
+    # values of a note, as in COLUMNS.
+    def add(self,kind,staff=0,code=0,values=NO_VALUES):
+        record = RECORD.pack(kind,code,staff,*values)
+        with self.lock:
+            if self.segment is None:
+                numbers = self.segments()
+                self.segment = numbers[-1] + 1 if numbers else 1
+            if not self.waiting or self.waiting[-1][0] != self.segment:
+                self.waiting.append((self.segment,bytearray()))
+            self.waiting[-1][1].extend(record + CHECKSUM.pack(zlib.crc32(record)))
+            self.bytes += RECORD_SIZE
+            self.records += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.work,daemon=True)
+                self.thread.start()
+
+    # This method cuts the journal, so that the records added from now on go to a new segment, and
+    # returns the number of the last segment before it.  Nothing waits on the disk for it.
+    def cut(self):
+        with self.lock:
+            if self.segment is None:
+                numbers = self.segments()
+                self.segment = numbers[-1] + 1 if numbers else 1
+            self.segment += 1
+            self.bytes = 0
+            return self.segment - 1
+
+    # This method forgets the segments up to the nth, once the score has been saved with them.
+    def forget(self,n):
+        for number in self.segments():
+            if number <= n:
+                try:
+                    os.remove(self.named(number))
+                except OSError as error:
+                    print(f"A segment of the journal could not be removed: {error}",file=sys.stderr)
+
+    def work(self):
+        while not self.closed.wait(self.interval):
+            self.write()
+
+    # This method writes out the records waiting, each to its segment, and syncs them to the disk.  A
+    # segment the journal has been cut after is closed.
+    def write(self):
+        with self.writing:
+            with self.lock:
+                waiting, self.waiting = self.waiting, []
+                segment = self.segment
+            try:
+                while waiting:
+                    number, data = waiting[0]
+                    if self.number != number:
+                        self.open(number)
+                    self.file.write(data)
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                    self.syncs += 1
+                    waiting.pop(0)
+                if self.file is not None and self.number != segment:
+                    self.file.close()
+                    self.file = self.number = None
+            except OSError as error: # Kept to be written with the next, rather than lost.
+                with self.lock:
+                    if waiting and self.waiting and self.waiting[0][0] == waiting[-1][0]:
+                        waiting[-1][1].extend(self.waiting.pop(0)[1])
+                    self.waiting[:0] = waiting
+                print(f"The journal could not be written: {error}",file=sys.stderr)
+
+    # This method opens the nth segment to be written to, closing the last.
+    def open(self,n):
+        if self.file is not None:
+            self.file.close()
+            self.file = self.number = None
+        self.file = open(self.named(n),'wb')
+        self.file.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC,JOURNAL_VERSION))
+        self.number = n
+
+    # This method returns how many bytes of records have been added since the journal was last cut,
+    # written out or not, counting those read.
+    def size(self):
+        return self.bytes
+
+    # This method writes out whatever is waiting, and closes the journal.
+    def close(self):
+        self.closed.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.write()
+        if self.file is not None:
+            self.file.close()
+            self.file = self.number = None
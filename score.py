@@ -0,0 +1,587 @@
+# The score of Elisabeth and the Music Maker, apart from the game's window.
+#
+# A Score holds the notes of each staff as plain numbers - the beat each is played on, how many
+# beats it lasts, its MIDI pitch and its agrément - and compile() turns them into one flat timeline
+# of MIDI notes, in the order the game has always added them to its MIDI file.  Writing that file
+# is then only a last step (write_midi()).  Nothing here needs pygame or a window, so the music can
+# be built, checked and timed on its own, e.g. by benchmarks.py.
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy
+
+# Each note of a staff: its beat (as given by the staff's time_a_note()), its duration in MIDI
+# beats, its MIDI pitch, and its agrément, as an index into AGREMENTS.
+NOTE = numpy.dtype([('beat','f8'),('duration','f8'),('pitch','i2'),('agrement','u1')])
+# Each note played: when it begins and how long it lasts (both in beats), its pitch, its volume, and its track.
+EVENT = numpy.dtype([('onset','f8'),('duration','f8'),('pitch','i2'),('velocity','u1'),('track','u2')])
+VELOCITY = 100 # The harpsichord has no dynamics, so every note is played as loud as any other.
+HARPSICHORD = 6 # A harpsichord is 7 in standard MIDI's 1-origin list, but 6 in midiutil's 0-origin list.
+PITCH_CLASSES = {'c':0,'d':2,'e':4,'f':5,'g':7,'a':9,'b':11}
+# A written pitch may also be given as its rung: the step of the scale it is on, counting from the C
+# of octave 0 (so 'c4' is 28), and its accidental as an index into ACCIDENTALS.
+LETTERS = 'cdefgab'
+RUNG_NAMES = tuple(letter + str(octave) for octave in range(10) for letter in LETTERS) # The pitch each rung is written as, e.g. 'c4'
+RUNG_PITCHES = numpy.array([PITCH_CLASSES[letter] for letter in LETTERS],dtype=numpy.int64)
+ACCIDENTALS = ('','sharp','flat')
+ACCIDENTAL_CODES = {name:code for code, name in enumerate(ACCIDENTALS)}
+ACCIDENTAL_STEPS = numpy.array([0,1,-1],dtype=numpy.int64)
+
+################################################################################
+## The way the game interprets agréments is determined from numerous sources.
+## Most pertinent to Jacquet's own work are the pincé, tremblement (long trill),
+## doublé, and port de voix, which are described in Burkholder's annotation to her work.
+## The pincé on a note indicates that the performer
+## plays it, the note below, and it again, in the span of the note, while
+## the tremblement, or long trill, trills between the indicated pitch and the one above for
+## length of the note.  This is fairly consistent with other sources' indications
+## for this, though Broude suggests that the trill occurs before the note on which it
+## applies, and not during.  It should also be noted that the number of trills - or
+## repercussions, as Hashimoto's sources translate them - varies, with a case being
+## made even for slowing in tempo during trills in vocal music.  However, d'Anglebert
+## and Couperin, in harpsichord music, seem content to indicate that precisely
+## four be played.  As for the doublé, its function seems to vary,
+## but is generally assumed to occur in a note adjacent to two others and involve
+## playing it and the others around it twice in a fashion similar to the shape
+## of the symbol.  In this game, it is interpreted quite strictly as the next
+## note, followed by the preceding, followed by the indicated, then the next, then
+## the preceding, each in a quarter of the time of the original indicated note.
+## Interpretation of the port de voix (+) is more difficult.
+##
+## Reeves writes that the + symbol could indicate virtually any ornament (as it
+## seems to throughout editions of Rameau), and Hashimoto assigns various meanings
+## to it.  Burkholder, however, demonstrates it as playing the previous note and the
+## indicated in the span of the indicates, and d'Anglebert confirms this with
+## examples of ascendant and descedant.  D'Anglebert's table also provides a few
+## more easily implement agrements to the game, such as the tremblement appuye
+## (a special trill on dotted notes), the cadence (a trill which dips down an extra
+## step at one point), and the mordent, a preceding trill more like Broude's
+## depiction of the pince.
+##
+## It should also be noted that, according to Kroll, composers such as Couperin
+## would put multiple ornaments on the same note.  Kroll is mystified as to how
+## one such combination was intended to be played, the doublé with the tremblement,
+## which appear in both orders in Couperin's work.  Kroll concludes that it is
+## to begin with a doublé that finishes tremblement, which Panov and Rosanov
+## state has long been known to the Baroque performance tradition.
+##
+## Remarkably, nearly every table of agrements demonstrates them on the note C,
+## with every pincé thus involving C and B, and leaving it ambiguous whether
+## trills in general are intended to span a semitone or a step in whatever
+## scale is in use.  Hashimoto writes that "the question of whether the interval
+## between the main note and the lower auxiliary should be a semitone or a whole
+## tone ... a great majority of composers left it to the performer's taste and
+## judgment."  It may vary by key or by the character of the music.  For simplicity,
+## this program elects to play trills always diatonically.  Also for simplicity,
+## it does not permit multiple ornaments on the same note, which does not occur
+## in Jacquet's first suite anyway.
+###############################################################################
+# Each agrément (and a plain note, '') is played as the notes listed for it here, in order.  Each is
+# given as its pitch, when it begins, and how long it lasts.  The pitch is the note's own ('note'),
+# a step of the scale above or below it ('above', 'below'), a semitone below it, or the note before
+# or after it ('previous', 'next').  When it begins is the note's start with one or two terms added in
+# turn, and each term, like how long it lasts, is a count of some unit: an int n for the note's duration
+# over n, or a float for that many beats.  (This is the order the sums were always done in, so that the
+# times come out the same to the last bit.)  A doublé is played just before the note after it.
+ORNAMENTS = {
+    '':[('note',[(0,1)],(1,1))],
+    'pince':[('note',[(0,4)],(1,4)),('below',[(1,4)],(1,4)),('note',[(2,4)],(2,4))],
+    'tremblement':[row for k in range(4) for row in [('above',[(2*k,8)],(1,8)),('note',[(2*k,8),(1,8)],(1,8))]],
+    'appuye':[('above',[(0,12)],(3,12)),('note',[(3,12)],(1,12))]
+        + [row for k in range(2,6) for row in [('above',[(2*k,12)],(1,12)),('note',[(2*k,12),(1,12)],(1,12))]],
+    'portdevoix':[('previous',[(0,2)],(1,2)),('note',[(1,2)],(1,2))],
+    'mordent':[('note',[(-2,1/32)],(1,1/32)),('semitone below',[(-1,1/32)],(1,1/32)),('note',[(0,1)],(1,1))],
+    'cadence':[('above',[(0,12)],(1,12)),('below',[(2,12)],(1,12))]
+        + [('note',[(2*k,12),(1,12)],(1,12)) for k in range(6)]
+        + [('above',[(2*k,12)],(1,12)) for k in range(2,6)],
+    'double':[('next',[(0,4)],(1,4)),('note',[(1,4)],(1,4)),('previous',[(2,4)],(1,4)),('note',[(3,4)],(1,4))],
+}
+AGREMENTS = tuple(ORNAMENTS)
+AGREMENT_CODES = {name:code for code, name in enumerate(AGREMENTS)}
+DOUBLE = AGREMENT_CODES['double']
+# How many notes each agrément is played as where it is written (a doublé's are played at the next note).
+EVENT_COUNTS = numpy.array([0 if name == 'double' else len(ORNAMENTS[name]) for name in AGREMENTS],dtype=numpy.int64)
+# The steps of the scale (played in C major; see above) above and below each pitch class.
+STEPS_ABOVE = numpy.array([2 if pc in [0,2,5,7,9] else 1 for pc in range(12)],dtype=numpy.int64)
+STEPS_BELOW = numpy.array([2 if pc in [2,4,7,9,11] else 1 for pc in range(12)],dtype=numpy.int64)
+
+# This function converts a printed pitch (like 'b4' with a sharp, or 'c5') to a MIDI pitch (like 72).
+def midi_pitch(pitch,accidental=''):
+    midi_pitch = PITCH_CLASSES[pitch[0]] + 12*int(pitch[1]) + 12
+    if accidental == 'sharp':
+        midi_pitch += 1
+    elif accidental == 'flat':
+        midi_pitch -= 1
+    return midi_pitch
+
+# This function converts a rung and an accidental's code (see ACCIDENTALS) to a MIDI pitch.
+def rung_pitch(rung,accidental=0):
+    return int(RUNG_PITCHES[rung % 7]) + 12*(rung // 7) + 12 + int(ACCIDENTAL_STEPS[accidental])
+
+# This function makes an array of NOTE from notes given as (beat, duration, pitch, agrément name).
+def note_columns(notes):
+    return numpy.array([(beat,duration,pitch,AGREMENT_CODES[agrement]) for beat, duration, pitch, agrement in notes],dtype=NOTE)
+
+# This function makes the same array from a staff's notes as the game holds them, column by column
+# (see its NoteTable): the rows of the notes, in order, in its columns of measures, beats within them,
+# durations, rungs, and accidentals' and agréments' codes, in the given time signature.  The sums
+# are done as the game does them, note by note, so that the numbers come out the same to the last bit.
+def table_columns(table,rows,timesig):
+    rows = numpy.array(rows,dtype=numpy.intp)
+    column = lambda name, dtype: numpy.frombuffer(getattr(table,name),dtype=dtype)[rows]
+    notes = numpy.zeros(len(rows),dtype=NOTE)
+    notes['beat'] = column('measure','f8')*timesig[0] + column('beat','f8')
+    notes['duration'] = column('duration','f8')*timesig[1]
+    rungs = column('rung','i2').astype(numpy.int64)
+    notes['pitch'] = RUNG_PITCHES[rungs % 7] + 12*(rungs // 7) + 12 + ACCIDENTAL_STEPS[column('accidental','u1')]
+    notes['agrement'] = column('agrement','u1')
+    return notes
+
+# This function gives the pitches of the notes played at a role in ORNAMENTS, from the pitches
+# of the notes written ('note', 'previous' and 'next').
+def ornament_pitch(role,pitches):
+    if role == 'above':
+        return pitches['note'] + STEPS_ABOVE[pitches['note'] % 12]
+    elif role == 'below':
+        return pitches['note'] - STEPS_BELOW[pitches['note'] % 12]
+    elif role == 'semitone below':
+        return pitches['note'] - 1
+    return pitches[role]
+
+# This function gives a count of a unit in ORNAMENTS, for notes of the given durations.
+def ornament_time(count,unit,duration):
+    if isinstance(unit,int):
+        return count*(duration/unit)
+    return count*unit
+
+class Score():
+    def __init__(self):
+        self.staves = [] # Each staff's first beat in the piece, its notes (an array of NOTE), and its track
+
+    def __len__(self):
+        return sum(len(notes) for offset, notes, track in self.staves)
+
+    # This method adds a staff, beginning offset beats into the piece, from its notes in order, each
+    # given as (beat, duration, pitch, agrément name).
+    def add_staff(self,offset,notes,track=0):
+        self.add_columns(offset,note_columns(notes),track)
+
+    # This method adds a staff whose notes are already an array of NOTE.
+    def add_columns(self,offset,notes,track=0):
+        self.staves.append((offset,notes,track))
+
+    # This method returns a name for the score's music as exported with the given options (e.g. the
+    # tempo): hex digits hashed from its notes, where each staff begins and its track, and those
+    # options, which are the same whenever they are, and all but never when they are not.
+    def digest(self,*options):
+        hashed = hashlib.blake2b(repr((EXPORT_FORMAT,options,len(self.staves))).encode(),digest_size=10)
+        for offset, notes, track in self.staves:
+            hashed.update(repr((offset,track,len(notes))).encode())
+            hashed.update(numpy.ascontiguousarray(notes,dtype=NOTE).tobytes())
+        return hashed.hexdigest()
+
+    # Whether any note has an agrément (which is what Elisabeth is listening for).
+    def agrements(self):
+        return any(numpy.any(notes['agrement']) for offset, notes, track in self.staves)
+
+    # This method turns the score into an array of EVENT: every note played, in the order the game
+    # has always added them to its MIDI file (which midiutil keeps for notes beginning together).
+    # What each staff is handed by the staves before it is found first (see handed_on()), so that the
+    # staves can then be compiled apart (see compile_staff()), by as many workers as are given.
+    def compile(self,workers=1):
+        return merge(self.compile_staves(workers))
+
+    # This method compiles the staves as compile() does, but returns each one's events apart, in order,
+    # as write_midi() is best given them.
+    def compile_staves(self,workers=1):
+        jobs = []
+        context = START
+        for offset, notes, track in self.staves:
+            jobs.append((offset,notes,track,context))
+            context = handed_on(notes,track,context)
+        return pool_map(compiled_events,jobs,workers,len(self))
+
+# What a staff needs to know of the staves before it: the pitch of the last note before it (None if
+# there is none), and a doublé on that note, which is played only when the next note comes, as
+# (beat, duration, pitch, pitch of the note before it, track), or None.  The first staff begins with START.
+START = (None,None)
+
+# This function gives what a staff (its notes, an array of NOTE, on a track) hands on to the staff
+# after it (see START), given what it was handed, without compiling it.
+def handed_on(notes,track,context):
+    if not len(notes):
+        return context
+    if len(notes) > 1:
+        previous = notes['pitch'][-2]
+    else:
+        previous = notes['pitch'][0] if context[0] is None else context[0]
+    pending = None
+    if notes['agrement'][-1] == DOUBLE:
+        pending = (float(notes['beat'][-1]),float(notes['duration'][-1]),int(notes['pitch'][-1]),int(previous),track)
+    return int(notes['pitch'][-1]), pending
+
+# This function turns a staff's notes (an array of NOTE, beginning offset beats into the piece) into
+# an array of EVENT on a track, given what it needs to know of the staves before it (see START), and returns
+# those events and what the staff after it needs to know.  Each note's events take the next places in
+# the array, so every note of one agrément (or every plain note) is laid out at once, one row of its
+# entry in ORNAMENTS at a time.  A staff's events depend on nothing else, so they may be kept and
+# merged with those of the other staves (see merge()) until the staff or what it is handed changes.
+def compile_staff(offset,notes,track=0,context=START):
+    if not len(notes):
+        return numpy.zeros(0,dtype=EVENT), context
+    last_pitch, pending = context
+    codes = notes['agrement'].astype(numpy.int64)
+    pitch = notes['pitch'].astype(numpy.int64)
+    # The note before the first is taken to be itself, for a port de voix or doublé on it.
+    previous = numpy.concatenate([pitch[:1] if last_pitch is None else [last_pitch],pitch[:-1]])
+    # A doublé is played when the note after it comes (which may be on the next staff), just before that note.
+    doubled = numpy.zeros(len(notes),dtype=bool)
+    doubled[0] = pending is not None
+    doubled[1:] = codes[:-1] == DOUBLE
+    counts = EVENT_COUNTS[codes] + len(ORNAMENTS['double'])*doubled
+    first = numpy.cumsum(counts) - counts # Where each note's events begin
+    own = first + len(ORNAMENTS['double'])*doubled # Where those of its own agrément begin
+    events = numpy.zeros(int(counts.sum()),dtype=EVENT)
+    events['velocity'] = VELOCITY
+    events['track'] = track
+    start = offset + notes['beat']
+    for code, name in enumerate(AGREMENTS):
+        if code != DOUBLE:
+            which = numpy.nonzero(codes == code)[0]
+            if len(which):
+                realize(events,own[which],ORNAMENTS[name],start[which],notes['duration'][which],
+                        {'note':pitch[which],'previous':previous[which]})
+    # The doublés, played from the next note's staff's first beat; the note each is on is the one
+    # before, which for the first note is the one handed on from the staff before.
+    # (A doublé handed on is played on the track of the staff it was written on.)
+    after = numpy.nonzero(doubled)[0]
+    if len(after):
+        before = pending or (0,0,0,0,track)
+        beat = numpy.concatenate([[before[0]],notes['beat'][:-1]])[after]
+        duration = numpy.concatenate([[before[1]],notes['duration'][:-1]])[after]
+        realize(events,first[after],ORNAMENTS['double'],offset+beat,duration,
+                {'note':numpy.concatenate([[before[2]],pitch[:-1]])[after],
+                 'previous':numpy.concatenate([[before[3]],previous[:-1]])[after],'next':pitch[after]})
+        events['track'][:own[0]] = before[4]
+    return events, handed_on(notes,track,context)
+
+# This function writes into events, at the places given (at), the notes some written notes are
+# played as, from their entry in ORNAMENTS, when they start, how long they last, and the pitches
+# of those notes and the notes around them.
+def realize(events,at,ornament,start,duration,pitches):
+    for k, (role, onset, length) in enumerate(ornament):
+        when = start
+        for count, unit in onset:
+            when = when + ornament_time(count,unit,duration)
+        events['onset'][at+k] = when
+        events['duration'][at+k] = ornament_time(*length,duration)
+        events['pitch'][at+k] = ornament_pitch(role,pitches)
+
+PARALLEL_NOTES = 100000 # Fewest notes that are compiled, or tracks written, by more than one worker
+
+# This function returns func applied to each of items, in order, worked out by as many processes as
+# workers (or here, if there is only one worker or one item, or too few notes among them to be worth
+# handing out; see PARALLEL_NOTES).  Compiling a staff and ordering a track go through their arrays a
+# little at a time from Python, holding the interpreter's lock for most of it, so threads would take
+# turns rather than use more cores; processes do not, at the cost of copying the items to them (and
+# so func must be a function of this module, and the items NumPy's arrays and plain values).  Where
+# processes are started afresh rather than forked, each imports the game's file again, which only
+# defines it (see start_pygame() there).  On one core, handing work out only costs time, which is
+# why the game gives one worker unless told otherwise.
+def pool_map(func,items,workers=1,notes=None):
+    items = list(items)
+    if workers <= 1 or len(items) <= 1 or (notes is not None and notes < PARALLEL_NOTES):
+        return [func(item) for item in items]
+    with ProcessPoolExecutor(min(workers,len(items))) as pool:
+        return list(pool.map(func,items))
+
+# This function compiles one staff, as a worker of Score.compile_staves() does, from its job:
+# (offset, notes, track, context), as compile_staff() is given them.
+def compiled_events(job):
+    return compile_staff(*job)[0]
+
+# This function returns the notes one written note is played as on its own (an array of EVENT, the
+# first beginning on beat 0), from its agrément, duration and pitch, and the pitches of the notes
+# before and after it (which only some agréments use; see roles()).  Given how many beats at longest,
+# the notes are let go then, and any after are left out.
+def ornament_events(agrement,duration,pitch,previous,next,longest=None):
+    ornament = ORNAMENTS[agrement]
+    events = numpy.zeros(len(ornament),dtype=EVENT)
+    events['velocity'] = VELOCITY
+    one = lambda value: numpy.array([value])
+    realize(events,one(0),ornament,one(0.0),one(float(duration)),{'note':one(pitch),'previous':one(previous),'next':one(next)})
+    events['onset'] -= events['onset'].min()
+    if longest is not None:
+        events = events[events['onset'] < longest]
+        events['duration'] = numpy.minimum(events['duration'],longest - events['onset'])
+    return events
+
+# This function gives the pitches an agrément is played with, among 'note', 'previous' and 'next'.
+def roles(agrement):
+    return {role if role in ('previous','next') else 'note' for role, onset, length in ORNAMENTS[agrement]}
+
+# This function joins the events of the staves, compiled one by one, into those of the whole score.
+def merge(streams):
+    streams = [events for events in streams if len(events)]
+    if not streams:
+        return numpy.zeros(0,dtype=EVENT)
+    return numpy.concatenate(streams)
+
+# The MIDI file is written as midiutil (which the game used to write it with)
+# writes one, byte for byte: a format 1 file of TICKS_PER_BEAT ticks a beat, with
+# the tempo alone on a track of its own, then each track of notes, beginning with
+# its change of instrument.  Times are cut down to whole ticks; of notes beginning
+# (or ending) on the same tick at the same pitch, only the first added is kept;
+# messages are ordered by tick, then note-offs before note-ons, then in the order
+# the notes were added; and where notes of one pitch overlap, a note-off that
+# comes while more than one of them is sounding is moved back to when the latest
+# of those began (midiutil's "deinterleaving"), after which the messages are
+# ordered again.  No running status is used.
+TICKS_PER_BEAT = 960
+EXPORT_FORMAT = 1 # Changed whenever the file written for a score would be, so that no file kept from before is used
+MESSAGE_BLOCK = 65536 # How many notes are put in order, and how many messages encoded and written out, at a time
+NOTE_ON = 0x90
+NOTE_OFF = 0x80
+END_OF_TRACK = b'\x00\xff\x2f\x00'
+PROGRAM_CHANGE = b'\x00' + bytes([0xc0,HARPSICHORD]) # Each track begins with a change to the harpsichord.
+# Each message of a track as it is put in order: twice its tick, plus one for a note-on (which is how
+# the messages are ordered, note-offs first), the order its note was added in, its pitch and velocity.
+MESSAGE = numpy.dtype([('key','i8'),('order','i8'),('pitch','i2'),('velocity','u1')])
+NO_MESSAGES = numpy.zeros(0,dtype=MESSAGE)
+
+# This function writes the events of a score to a MIDI file, at the given tempo, on a harpsichord, in as
+# many tracks as the events use.  They are given as each staff's, compiled one by one, in order (as
+# Score.compile_staves() gives them), or all at once (as Score.compile() does).  Rather than make an
+# object for every note and hold the whole file in memory, as midiutil does, each track is put in order
+# a few staves at a time (see track_messages()) and encoded a block at a time, straight to the file,
+# whose track lengths are filled in once each is done (so the file must be one that can be seeked in).
+# Given more than one worker, the tracks are written at once, each by a worker to a file of its own
+# (see write_track_file()), and those are then copied into the file in turn.
+def write_midi(streams,output_file,tempo,workers=1):
+    if isinstance(streams,numpy.ndarray):
+        streams = [streams]
+    tracks = [] # The staves' events on each track, and the first tick of each
+    for events in streams:
+        if len(events):
+            track = events['track']
+            used = track[:1] if numpy.all(track == track[0]) else numpy.unique(track) # (As a staff's mostly are all on one.)
+            first = int(events['onset'].min()*TICKS_PER_BEAT)
+            tracks.extend([] for k in range(len(tracks),int(used[-1])+1))
+            for track in used.tolist():
+                tracks[track].append((events if len(used) == 1 else events[events['track'] == track],first))
+    output_file.write(b'MThd' + struct.pack('>LHHH',6,1,max(len(tracks),1)+1,TICKS_PER_BEAT))
+    write_track(output_file,[b'\x00\xff\x51\x03' + struct.pack('>L',int(60000000/tempo))[1:]])
+    notes = sum(len(events) for track_streams in tracks for events, first in track_streams)
+    if workers > 1 and len(tracks) > 1 and notes >= PARALLEL_NOTES:
+        with tempfile.TemporaryDirectory() as folder:
+            paths = [os.path.join(folder,f"{k}.mtrk") for k in range(len(tracks))]
+            pool_map(write_track_file,zip(paths,tracks),workers)
+            for path in paths:
+                with open(path,'rb') as track_file:
+                    shutil.copyfileobj(track_file,output_file)
+        return
+    for track_streams in tracks or [[]]:
+        write_track(output_file,encoded_blocks(track_messages(track_streams),PROGRAM_CHANGE))
+
+# This function writes one track chunk, of the staves' events on it (as write_midi() gathers them), to
+# a file of its own, as a worker of write_midi() does: job is the file's path and those events.
+def write_track_file(job):
+    path, track_streams = job
+    with open(path,'wb') as track_file:
+        write_track(track_file,encoded_blocks(track_messages(track_streams),PROGRAM_CHANGE))
+
+# This function writes a track chunk from blocks of bytes, going back to fill in its length at the end.
+def write_track(output_file,blocks):
+    output_file.write(b'MTrk\x00\x00\x00\x00')
+    start = output_file.tell()
+    for block in blocks:
+        output_file.write(block)
+    output_file.write(END_OF_TRACK)
+    end = output_file.tell()
+    output_file.seek(start-4)
+    output_file.write(struct.pack('>L',end-start))
+    output_file.seek(end)
+
+# This function puts the notes of one track in order as midiutil would (see above), and yields their
+# messages' ticks, whether each is a note-on, and their pitches and velocities, a batch at a time.  The
+# notes are given as the events of the staves on the track, compiled one by one, in order, each with
+# the first tick of any of its events (which may begin no sooner than those on the track).  Rather than
+# put the whole track in order at once, which would take memory for every note of the piece, the staves
+# are taken a few at a time (see kept_messages()), and only the messages nothing still to come could go
+# before are given: none still to come begins before the first note of the staves not yet taken, and a
+# note-off still to come is only moved back (see deinterleave()) to a note-on on the stack of its pitch
+# as high as the stack will then be.  How low each stack will go is counted first, which takes only
+# counting, so that the note-ons midiutil leaves on its stacks for good (as it does where notes of one
+# pitch begin apart and end together) hold nothing back.  So only the messages of the few staves at
+# hand are held at once, with those of any notes held long at one pitch, however long the piece.
+def track_messages(streams):
+    if not streams:
+        return
+    lowest = min(int(events['pitch'].min()) for events, first in streams)
+    pitches = max(int(events['pitch'].max()) for events, first in streams) - lowest + 1
+    # For each batch, how many note-ons will at least be sounding before any note-off of each pitch after it
+    below = list(stack_depths(kept_messages(streams),lowest,pitches))
+    reach = [numpy.full(pitches,numpy.iinfo(numpy.int64).max,dtype=numpy.int64)]
+    for fewest in below[:0:-1]:
+        reach.append(numpy.minimum(reach[-1],fewest))
+    reach.reverse()
+    sounding = NO_MESSAGES # The note-ons midiutil's stacks hold, and a note-off for each it has none for (see sounding_after())
+    waiting = NO_MESSAGES # Messages deinterleaved, waiting until none still to come can go before them
+    for (ready, later), depth in zip(kept_messages(streams),reach):
+        ready = numpy.concatenate([sounding,ready])
+        deinterleave(ready['key'],ready['pitch'])
+        ready, sounding = ready[len(sounding):], ready[sounding_after(ready['key'],ready['pitch'])]
+        # A note-off still to come with so many sounding before it is moved back to the note-on at that
+        # height on its stack, if that is more than one.
+        stacked = sounding[(sounding['key'] & 1) == 1]
+        played, starts, counts = numpy.unique(stacked['pitch'],return_index=True,return_counts=True)
+        height = numpy.maximum(depth[played-lowest],2) - 1
+        reached = height < counts
+        if later is not None and numpy.any(reached):
+            later = min(later,int(stacked['key'][starts[reached]+height[reached]].min()) - 1)
+        waiting = numpy.concatenate([waiting,ready])
+        done = waiting['key'] < later if later is not None else numpy.ones(len(waiting),dtype=bool)
+        ready, waiting = waiting[done], waiting[~done]
+        ready = ready[numpy.lexsort((ready['order'],ready['key']))]
+        if len(ready):
+            yield ready['key'] >> 1, (ready['key'] & 1).astype(bool), ready['pitch'], ready['velocity']
+
+# This function yields the messages of a track's notes, given as the events of its staves compiled one
+# by one (each with its first tick, as above), some MESSAGE_BLOCK of notes at a time, in order (by key,
+# then the order the notes were added), less those of notes beginning (or ending) on the same tick at
+# the same pitch as one added before; and with each batch, the least key of any message still to come
+# (or None after the last), before which all have been given.  Those not yet known to be the first of
+# their tick and pitch are held back.
+def kept_messages(streams):
+    firsts = numpy.minimum.accumulate([first for events, first in streams][::-1])[::-1] # The first tick of each staff or any after it
+    held = NO_MESSAGES
+    added = 0
+    taken, count = [], 0
+    for k, (events, first) in enumerate(streams):
+        taken.append(events)
+        count += len(events)
+        if count < MESSAGE_BLOCK and k+1 < len(streams):
+            continue
+        events = numpy.frombuffer(b''.join(taken),dtype=EVENT) if len(taken) > 1 else taken[0] # (Much as concatenate() would, but at once.)
+        taken, count = [], 0
+        on = (events['onset']*TICKS_PER_BEAT).astype(numpy.int64)
+        off = on + (events['duration']*TICKS_PER_BEAT).astype(numpy.int64)
+        messages = numpy.zeros(2*len(events),dtype=MESSAGE)
+        messages['key'] = numpy.concatenate([2*on+1,2*off])
+        messages['order'] = numpy.tile(numpy.arange(added,added+len(events)),2)
+        messages['pitch'] = numpy.tile(events['pitch'],2)
+        messages['velocity'] = numpy.tile(events['velocity'],2)
+        added += len(events)
+        held = numpy.concatenate([held,messages])
+        held = held[numpy.argsort(held['key']*65536 + held['pitch'],kind='stable')] # (Those held come first, and each in order.)
+        first = numpy.ones(len(held),dtype=bool)
+        first[1:] = (held['key'][1:] != held['key'][:-1]) | (held['pitch'][1:] != held['pitch'][:-1])
+        held = held[first]
+        later = 2*int(firsts[k+1]) if k+1 < len(streams) else None
+        done = held['key'] < later if later is not None else numpy.ones(len(held),dtype=bool)
+        ready, held = held[done], held[~done]
+        yield ready[numpy.lexsort((ready['order'],ready['key']))], later
+
+# This function counts, through batches of messages in order (as kept_messages() gives them), how many
+# note-ons are sounding at the pitch of each note-off before it, and yields for each batch the fewest for
+# each pitch (from the lowest, as many as are given; the most an int64 holds where there is no note-off).
+# This is how low midiutil's stacks go, found without going through them.
+def stack_depths(batches,lowest,pitches):
+    never = numpy.iinfo(numpy.int64).max
+    sounding = numpy.zeros(pitches,dtype=numpy.int64)
+    for ready, later in batches:
+        fewest = numpy.full(pitches,never,dtype=numpy.int64)
+        if len(ready):
+            pitch = ready['pitch'].astype(numpy.int64) - lowest
+            by_pitch = numpy.argsort(pitch,kind='stable')
+            pitch = pitch[by_pitch]
+            is_on = (ready['key'][by_pitch] & 1).astype(bool)
+            level = numpy.cumsum(2*is_on.astype(numpy.int64)-1)
+            played, starts, counts = numpy.unique(pitch,return_index=True,return_counts=True)
+            level -= numpy.repeat(numpy.concatenate([[0],level[starts[1:]-1]]) - sounding[played],counts) # How many are sounding after each
+            numpy.minimum.at(fewest,pitch[~is_on],level[~is_on] + 1)
+            sounding[played] = level[starts+counts-1]
+        yield fewest
+
+# This function gives, after messages in order (by their keys and pitches), the note-ons midiutil's
+# stacks would hold, as their places among the messages, each pitch's in the order they are stacked;
+# where there have been more note-offs of a pitch than note-ons, a note-off for each one more stands
+# in their place, so that what is given, put before the messages after, stands for all those before.
+def sounding_after(key,pitch):
+    if not len(key):
+        return numpy.zeros(0,dtype=numpy.intp)
+    by_pitch = numpy.argsort(pitch,kind='stable')
+    is_on = (key & 1).astype(bool)[by_pitch]
+    level = numpy.cumsum(2*is_on.astype(numpy.int64)-1)
+    pitches, starts, counts = numpy.unique(pitch[by_pitch],return_index=True,return_counts=True)
+    level -= numpy.repeat(numpy.concatenate([[0],level[starts[1:]-1]]),counts) # How many are sounding after each, at its pitch
+    group = numpy.repeat(numpy.arange(len(pitches)),counts)
+    final = level[starts+counts-1][group]
+    # The note-on at each level on a stack is the last to have brought its pitch up to that level.
+    ons = numpy.nonzero(is_on & (level >= 1) & (level <= final))[0]
+    ons = ons[numpy.lexsort((ons,level[ons],group[ons]))]
+    last = numpy.ones(len(ons),dtype=bool)
+    last[:-1] = (group[ons][1:] != group[ons][:-1]) | (level[ons][1:] != level[ons][:-1])
+    # For each note-off too many, the last note-off of its pitch.
+    offs = numpy.nonzero(~is_on)[0]
+    last_off = numpy.zeros(len(pitches),dtype=numpy.int64)
+    numpy.maximum.at(last_off,group[offs],offs)
+    owing = numpy.repeat(last_off,numpy.maximum(-level[starts+counts-1],0))
+    return numpy.concatenate([by_pitch[owing],by_pitch[ons[last]]]).astype(numpy.intp)
+
+# This function moves the note-offs midiutil's deinterleaving moves (see above), in place, and returns
+# whether there were any.  Each message is given by its key: twice its tick, plus one for a note-on.
+# midiutil keeps a stack of the note-ons sounding at each pitch; rather than go through the messages
+# one at a time, how many notes of each pitch are sounding is counted for all of them at once, and the
+# note-on a note-off would take off the stack is the last of its pitch to have brought the count to
+# what it is just before that note-off.
+def deinterleave(key,pitch):
+    if not len(key):
+        return False
+    by_pitch = numpy.argsort(pitch,kind='stable')
+    is_on = (key & 1).astype(bool)[by_pitch]
+    sounding = numpy.cumsum(2*is_on.astype(numpy.int8)-1,dtype=numpy.int64)
+    counts = numpy.bincount(pitch[by_pitch]-pitch.min())
+    counts = counts[counts > 0] # How many messages there are of each pitch, in order of pitch
+    sounding -= numpy.repeat(numpy.concatenate([[0],sounding[numpy.cumsum(counts)[:-1]-1]]),counts)
+    sounding[~is_on] += 1 # For a note-off, how many were sounding just before it
+    moved = numpy.nonzero(~is_on & (sounding > 1))[0]
+    if not len(moved):
+        return False
+    # Each note-on's and note-off's pitch and count together, then its place, in one number, so that
+    # the note-ons can be searched for those of each note-off.
+    span = int(sounding.max() - sounding.min()) + 1
+    pitches = numpy.repeat(numpy.arange(len(counts)),counts)
+    level = (pitches*span + sounding - sounding.min())*len(key)
+    ons = numpy.nonzero(is_on)[0]
+    ons = ons[numpy.argsort(level[ons] + ons)]
+    found = ons[numpy.searchsorted(level[ons] + ons,level[moved] + moved) - 1]
+    key[by_pitch[moved]] = key[by_pitch[found]] - 1
+    return True
+
+# This function yields a track's messages as bytes, a block at a time, after the first message given;
+# they are given a batch at a time (as track_messages() gives them).  Each is the ticks since the last
+# (as a variable-length quantity, seven bits to a byte, the highest first, all but the last byte with
+# the top bit set), then its status, pitch and velocity.
+def encoded_blocks(batches,first):
+    yield first
+    last = 0
+    for tick, is_on, pitch, velocity in batches:
+        for b in range(0,len(tick),MESSAGE_BLOCK):
+            ticks = tick[b:b+MESSAGE_BLOCK]
+            delta = numpy.diff(ticks,prepend=last)
+            last = ticks[-1]
+            width = 1 + (delta >= 1<<7) + (delta >= 1<<14) + (delta >= 1<<21) + (delta >= 1<<28)
+            ends = numpy.cumsum(width + 3)
+            block = numpy.zeros(ends[-1],dtype=numpy.uint8)
+            for k in range(int(width.max())):
+                more = numpy.nonzero(width > k)[0]
+                shift = 7*(width[more]-1-k)
+                block[ends[more]-3-width[more]+k] = ((delta[more] >> shift) & 0x7f) | numpy.where(shift > 0,0x80,0)
+            block[ends-3] = numpy.where(is_on[b:b+MESSAGE_BLOCK],NOTE_ON,NOTE_OFF)
+            block[ends-2] = pitch[b:b+MESSAGE_BLOCK]
+            block[ends-1] = velocity[b:b+MESSAGE_BLOCK]
+            yield block.tobytes()